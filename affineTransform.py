@@ -0,0 +1,195 @@
+import math
+import numpy as np
+from PIL import Image
+
+
+class AffineTransform:
+    """
+    Stack of geometric edits (translate, scale, rotate, flips) folded into one affine matrix.
+    The matrix maps source coordinates to output coordinates and the output canvas size is
+    tracked analytically with every step, so the whole stack is rendered with a single resample.
+    """
+
+    def __init__(self, width, height):
+        """
+        :param width: Width of the image the transform will be applied to
+        :param height: Height of the image the transform will be applied to
+        """
+        self.source_size = (int(width), int(height))
+        self.size = self.source_size
+        self.forward = np.eye(3)
+        self.steps = []
+
+    @property
+    def matrix(self):
+        """
+        2x3 forward matrix mapping source (x, y) to output (x, y).
+        """
+        return self.forward[:2].copy()
+
+    def translate(self, dx, dy):
+        """
+        Move the image content by (dx, dy) pixels, keeping the canvas size.
+        :return: The transform, so calls can be chained
+        """
+        return self._push("translate", (dx, dy), np.array([
+            [1, 0, dx],
+            [0, 1, dy],
+            [0, 0, 1],
+        ], dtype=np.float64), self.size)
+
+    def scale(self, scale_x, scale_y):
+        """
+        Scale the image, the canvas becomes int(width * scale_x) x int(height * scale_y)
+        like basicOperations.scale.
+        :return: The transform, so calls can be chained
+        """
+        width, height = self.size
+        new_width = int(width * scale_x)
+        new_height = int(height * scale_y)
+        if new_width <= 0 or new_height <= 0:
+            raise ValueError("Scaling would produce an empty image")
+        return self._push("scale", (scale_x, scale_y), np.array([
+            [new_width / width, 0, 0],
+            [0, new_height / height, 0],
+            [0, 0, 1],
+        ], dtype=np.float64), (new_width, new_height))
+
+    def rotate(self, angle):
+        """
+        Rotate counter-clockwise by angle degrees around the center, expanding the canvas
+        to hold the whole result like Image.rotate(angle, expand=True).
+        :return: The transform, so calls can be chained
+        """
+        width, height = self.size
+        radians = math.radians(angle)
+        cos_a = round(math.cos(radians), 15)
+        sin_a = round(math.sin(radians), 15)
+        rotation = np.array([
+            [cos_a, sin_a, 0],
+            [-sin_a, cos_a, 0],
+            [0, 0, 1],
+        ], dtype=np.float64)
+
+        # Bounds of the rotated canvas corners, rounded outwards the same way Image.rotate does
+        corners = np.array([
+            [0, 0, 1],
+            [width, 0, 1],
+            [width, height, 1],
+            [0, height, 1],
+        ], dtype=np.float64).T
+        rotated = self._translation(width / 2, height / 2) @ rotation @ self._translation(-width / 2, -height / 2) @ corners
+        new_width = math.ceil(rotated[0].max()) - math.floor(rotated[0].min())
+        new_height = math.ceil(rotated[1].max()) - math.floor(rotated[1].min())
+
+        step = self._translation(new_width / 2, new_height / 2) @ rotation @ self._translation(-width / 2, -height / 2)
+        return self._push("rotate", (angle,), step, (new_width, new_height))
+
+    def horizontal_flip(self):
+        """
+        Mirror the image left to right.
+        :return: The transform, so calls can be chained
+        """
+        width, _ = self.size
+        return self._push("horizontal_flip", (), np.array([
+            [-1, 0, width],
+            [0, 1, 0],
+            [0, 0, 1],
+        ], dtype=np.float64), self.size)
+
+    def vertical_flip(self):
+        """
+        Flip the image top to bottom.
+        :return: The transform, so calls can be chained
+        """
+        _, height = self.size
+        return self._push("vertical_flip", (), np.array([
+            [1, 0, 0],
+            [0, -1, height],
+            [0, 0, 1],
+        ], dtype=np.float64), self.size)
+
+    def diagonal_flip(self):
+        """
+        Flip the image along its main diagonal (transpose).
+        :return: The transform, so calls can be chained
+        """
+        width, height = self.size
+        return self._push("diagonal_flip", (), np.array([
+            [0, 1, 0],
+            [1, 0, 0],
+            [0, 0, 1],
+        ], dtype=np.float64), (height, width))
+
+    def is_exact(self):
+        """
+        True when the stack only moves whole pixels around (flips, transposes and integer shifts),
+        in which case it is rendered without interpolation.
+        """
+        linear = self.forward[:2, :2]
+        offset = self.forward[:2, 2]
+        permutation = np.abs(np.round(linear))
+        return (
+            np.allclose(linear, np.round(linear))
+            and np.allclose(permutation.sum(axis=0), 1)
+            and np.allclose(permutation.sum(axis=1), 1)
+            and np.allclose(offset, np.round(offset))
+        )
+
+    def apply(self, image, resample=Image.BICUBIC):
+        """
+        Render the whole stack onto the image with a single resample.
+        :param image: PIL.Image object of the size the transform was created for
+        :param resample: Resampling filter used when the stack is not pixel exact
+        :return: Transformed PIL image
+        """
+        if not isinstance(image, Image.Image):
+            raise ValueError("Input must be a PIL.Image object")
+        if image.size != self.source_size:
+            raise ValueError("Image size does not match the transform source size")
+
+        if self.is_exact() or image.mode in ("1", "P"):
+            resample = Image.NEAREST
+
+        inverse = np.linalg.inv(self.forward)
+
+        # Strong downscaling would alias with a plain affine resample, so box-reduce first
+        reduce_x = int(np.hypot(inverse[0, 0], inverse[1, 0]))
+        reduce_y = int(np.hypot(inverse[0, 1], inverse[1, 1]))
+        if resample != Image.NEAREST and (reduce_x >= 2 or reduce_y >= 2):
+            reduce_x, reduce_y = max(reduce_x, 1), max(reduce_y, 1)
+            image = image.reduce((reduce_x, reduce_y))
+            inverse = np.diag([1 / reduce_x, 1 / reduce_y, 1]) @ inverse
+
+        return image.transform(self.size, Image.AFFINE, tuple(inverse[:2].ravel()), resample=resample)
+
+    @staticmethod
+    def apply_steps(image, steps, translation_scale=1.0, resample=Image.BICUBIC):
+        """
+        Build a transform for the image from recorded steps and render it with a single resample.
+        :param image: PIL.Image object
+        :param steps: List of (method name, parameters) tuples, e.g. [("rotate", (30,)), ("horizontal_flip", ())]
+        :param translation_scale: Factor for translate offsets, used when the steps run on a resized copy
+        :param resample: Resampling filter used when the stack is not pixel exact
+        :return: Transformed PIL image
+        """
+        transform = AffineTransform(*image.size)
+        for name, params in steps:
+            if name == "translate":
+                params = tuple(offset * translation_scale for offset in params)
+            getattr(transform, name)(*params)
+        return transform.apply(image, resample)
+
+    def _push(self, name, params, step, size):
+        self.forward = step @ self.forward
+        self.size = (int(size[0]), int(size[1]))
+        self.steps.append((name, params))
+        return self
+
+    @staticmethod
+    def _translation(dx, dy):
+        return np.array([
+            [1, 0, dx],
+            [0, 1, dy],
+            [0, 0, 1],
+        ], dtype=np.float64)
@@ -1,8 +1,29 @@
-import math
-from PIL import Image, ImageOps, ImageEnhance, ImageDraw
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+from pointOperation import PointOperationPipeline
+from shapeMask import ShapeMaskCache
 
 class basicOperations:
 
+    # Tone matrices for the color filters, rows produce the R, G and B output channels
+    SEPIA_MATRIX = (
+        (0.393, 0.769, 0.189),
+        (0.349, 0.686, 0.168),
+        (0.272, 0.534, 0.131),
+    )
+    CYANOTYPE_MATRIX = (
+        (0.3, 0.0, 0.0),
+        (0.0, 0.4, 0.0),
+        (0.0, 0.0, 1.5),
+    )
+
+    # Number of image rows converted to float at once by apply_color_matrix
+    COLOR_MATRIX_BAND_ROWS = 256
+
+    # Shared cache of masks used by the shape cropping functions
+    SHAPE_MASKS = ShapeMaskCache()
+
     @staticmethod
     def to_grayscale(image):
         """
@@ -23,7 +44,7 @@ class basicOperations:
         """
         if not isinstance(image, Image.Image):
             raise ValueError("Input must be a PIL.Image object")
-        return ImageOps.invert(image.convert("RGB"))
+        return PointOperationPipeline().negative().apply(image.convert("RGB"))
 
     @staticmethod
     def horizontal_flip(image):
@@ -89,38 +110,8 @@ class basicOperations:
         :param shape: Bentuk cropping ("Circle", "Star", "Diamond")
         :return: Gambar hasil cropping
         """
-        from PIL import Image, ImageDraw
-
-        # Buat masker berbentuk sesuai parameter
-        mask = Image.new("L", image.size, 0)
-        draw = ImageDraw.Draw(mask)
-
-        width, height = image.size
-
-        if shape == "Circle":
-            draw.ellipse((0, 0, width, height), fill=255)
-        elif shape == "Star":
-            # Buat bentuk bintang sederhana (5 sisi)
-            center_x, center_y = width // 2, height // 2
-            radius = min(width, height) // 2
-            points = []
-            for i in range(10):
-                angle = i * (3.14159 / 5)  # Sudut 36 derajat
-                r = radius if i % 2 == 0 else radius // 2
-                x = center_x + r * math.cos(angle)
-                y = center_y - r * math.sin(angle)
-                points.append((x, y))
-            draw.polygon(points, fill=255)
-        elif shape == "Diamond":
-            # Bentuk belah ketupat
-            draw.polygon([
-                (width // 2, 0),
-                (width, height // 2),
-                (width // 2, height),
-                (0, height // 2)
-            ], fill=255)
-        else:
-            raise ValueError(f"Unknown shape: {shape}")
+        # Ambil masker dari cache, hanya digambar ulang untuk ukuran baru
+        mask = basicOperations.SHAPE_MASKS.get(shape, image.size)
 
         # Terapkan masker ke gambar
         result = Image.new("RGBA", image.size)
@@ -128,6 +119,28 @@ class basicOperations:
 
         return result
 
+    @staticmethod
+    def crop_images_by_shape(images, shape):
+        """
+        Crop a list of equally sized images with the same shape, drawing the mask only once.
+        :param images: List of PIL Image objects with the same size
+        :param shape: Cropping shape ("Circle", "Star", "Diamond")
+        :return: List of cropped RGBA images
+        """
+        if not images:
+            return []
+        size = images[0].size
+        if any(image.size != size for image in images):
+            raise ValueError("All images must have the same size")
+
+        mask = basicOperations.SHAPE_MASKS.get(shape, size)
+        results = []
+        for image in images:
+            result = Image.new("RGBA", size)
+            result.paste(image, (0, 0), mask=mask)
+            results.append(result)
+        return results
+
 
 
     @staticmethod
@@ -191,11 +204,7 @@ class basicOperations:
         if not isinstance(image, Image.Image):
             raise ValueError("Input must be a PIL.Image object")
 
-        r, g, b = image.split()
-        r = ImageEnhance.Brightness(r).enhance(red / 255)
-        g = ImageEnhance.Brightness(g).enhance(green / 255)
-        b = ImageEnhance.Brightness(b).enhance(blue / 255)
-        return Image.merge("RGB", (r, g, b))
+        return PointOperationPipeline().rgb_intensity(red, green, blue).apply(image)
 
     @staticmethod
     def add_border(image, thickness, color):
@@ -253,8 +262,7 @@ class basicOperations:
         :return: Adjusted PIL image.
         """
         try:
-            enhancer = ImageEnhance.Brightness(image)
-            return enhancer.enhance(1 + value / 100.0)
+            return PointOperationPipeline().brightness(value).apply(image)
         except Exception as e:
             raise RuntimeError(f"Failed to adjust brightness: {e}")
 
@@ -267,8 +275,7 @@ class basicOperations:
         :return: Adjusted PIL image.
         """
         try:
-            enhancer = ImageEnhance.Contrast(image)
-            return enhancer.enhance(1 + value / 100.0)
+            return PointOperationPipeline().contrast(value).apply(image)
         except Exception as e:
             raise RuntimeError(f"Failed to adjust contrast: {e}")
 
@@ -292,20 +299,7 @@ class basicOperations:
         :return: Image with sepia filter applied.
         """
         try:
-            sepia_image = image.convert("RGB")
-            pixels = sepia_image.load()
-
-            for y in range(sepia_image.height):
-                for x in range(sepia_image.width):
-                    r, g, b = pixels[x, y]
-
-                    tr = int(0.393 * r + 0.769 * g + 0.189 * b)
-                    tg = int(0.349 * r + 0.686 * g + 0.168 * b)
-                    tb = int(0.272 * r + 0.534 * g + 0.131 * b)
-
-                    pixels[x, y] = (min(255, tr), min(255, tg), min(255, tb))
-
-            return sepia_image
+            return basicOperations.apply_color_matrix(image, basicOperations.SEPIA_MATRIX)
         except Exception as e:
             raise RuntimeError(f"Failed to apply sepia filter: {e}")
         
@@ -316,23 +310,40 @@ class basicOperations:
         :return: Image with cyanotype filter applied.
         """
         try:
-            cyan_image = image.convert("RGB")
-            pixels = cyan_image.load()
+            # Apply cyanotype effect (boost blue, reduce red/green)
+            return basicOperations.apply_color_matrix(image, basicOperations.CYANOTYPE_MATRIX)
+        except Exception as e:
+            raise RuntimeError(f"Failed to apply cyanotype filter: {e}")
 
-            for y in range(cyan_image.height):
-                for x in range(cyan_image.width):
-                    r, g, b = pixels[x, y]
+    @staticmethod
+    def apply_color_matrix(image, matrix, offset=(0, 0, 0)):
+        """
+        Apply a 3x3 color matrix plus offset to every pixel of the image.
+        Each output channel is matrix[row] . (r, g, b) + offset[row], truncated and saturated to 0-255.
+        :param image: PIL.Image object
+        :param matrix: 3x3 sequence of weights, one row per output channel (R, G, B)
+        :param offset: Sequence of 3 values added to the R, G and B outputs
+        :return: RGB image with the color matrix applied
+        """
+        if not isinstance(image, Image.Image):
+            raise ValueError("Input must be a PIL.Image object")
 
-                    # Apply cyanotype effect (boost blue, reduce red/green)
-                    tr = int(r * 0.3)
-                    tg = int(g * 0.4)
-                    tb = int(b * 1.5)
+        matrix = np.asarray(matrix, dtype=np.float64)
+        offset = np.asarray(offset, dtype=np.float64)
+        if matrix.shape != (3, 3) or offset.shape != (3,):
+            raise ValueError("Color matrix must be 3x3 and offset must have 3 values")
+        transform = np.hstack([matrix, offset.reshape(3, 1)])
 
-                    pixels[x, y] = (min(255, tr), min(255, tg), min(255, tb))
+        pixels = np.asarray(image.convert("RGB"))
+        result = np.empty_like(pixels)
 
-            return cyan_image
-        except Exception as e:
-            raise RuntimeError(f"Failed to apply cyanotype filter: {e}")
+        # Work in bands of rows so the float copy stays small on large photos
+        band = basicOperations.COLOR_MATRIX_BAND_ROWS
+        for y in range(0, pixels.shape[0], band):
+            transformed = cv2.transform(pixels[y:y + band].astype(np.float64), transform)
+            result[y:y + band] = np.clip(transformed, 0, 255)
+
+        return Image.fromarray(result, "RGB")
 
     def apply_custom_color(image, hex_color):
         """
@@ -1,42 +1,313 @@
 import cv2
 import numpy as np
 from PIL import Image
+from packedMask import PackedMask
 
 class BinaryOperation:
+    # Structuring element shapes, and the elements already built by (shape, width, height)
+    SHAPES = {"rect": cv2.MORPH_RECT, "ellipse": cv2.MORPH_ELLIPSE, "cross": cv2.MORPH_CROSS}
+    STRUCTURING_ELEMENTS = {}
+    # Ellipses from this size on are decomposed into rectangles, cv2 costs one operation per element pixel
+    DECOMPOSE_SIZE = 31
+    # Rectangle sides from this length on are built from about log3(length) sparse passes, each tripling the reach,
+    # instead of one pass of that length
+    LOGARITHMIC_SIZE = 129
+    OPERATIONS = ("dilate", "erode", "open", "close", "boundary")
+
     @staticmethod
-    def dilation(image):
-        kernel = np.ones((3, 3), np.uint8)
-        dilated_image = cv2.dilate(np.array(image), kernel, iterations=1)
-        return Image.fromarray(dilated_image)
+    def dilation(image, shape="rect", size=3, iterations=1):
+        return BinaryOperation.morphology_sequence(image, [("dilate", shape, size, iterations)])
 
     @staticmethod
-    def erosion(image):
-        kernel = np.ones((3, 3), np.uint8)
-        eroded_image = cv2.erode(np.array(image), kernel, iterations=1)
-        return Image.fromarray(eroded_image)
+    def erosion(image, shape="rect", size=3, iterations=1):
+        return BinaryOperation.morphology_sequence(image, [("erode", shape, size, iterations)])
 
     @staticmethod
-    def opening(image):
-        kernel = np.ones((3, 3), np.uint8)
-        opened_image = cv2.morphologyEx(np.array(image), cv2.MORPH_OPEN, kernel)
-        return Image.fromarray(opened_image)
+    def opening(image, shape="rect", size=3, iterations=1):
+        return BinaryOperation.morphology_sequence(image, [("open", shape, size, iterations)])
 
     @staticmethod
-    def closing(image):
-        kernel = np.ones((3, 3), np.uint8)
-        closed_image = cv2.morphologyEx(np.array(image), cv2.MORPH_CLOSE, kernel)
-        return Image.fromarray(closed_image)
+    def closing(image, shape="rect", size=3, iterations=1):
+        return BinaryOperation.morphology_sequence(image, [("close", shape, size, iterations)])
 
     @staticmethod
-    def boundary_extraction(image):
-        kernel = np.ones((3, 3), np.uint8)
-        eroded_image = cv2.erode(np.array(image), kernel, iterations=1)
-        boundary_image = cv2.subtract(np.array(image), eroded_image)
-        return Image.fromarray(boundary_image)
+    def boundary_extraction(image, shape="rect", size=3, iterations=1):
+        return BinaryOperation.morphology_sequence(image, [("boundary", shape, size, iterations)])
+
+    @staticmethod
+    def morphology_sequence(image, steps):
+        """
+        Run several morphology operations on one NumPy buffer, converting from and to PIL once.
+        Masks of mode "1" and PackedMask objects stay bit-packed when every step uses an odd rectangle.
+        :param image: PIL.Image object, NumPy array or PackedMask
+        :param steps: List of (operation, shape, size, iterations) tuples, trailing items may be left out,
+                      e.g. [("open", "ellipse", 5), ("dilate",)]
+        :return: PIL.Image object, of the same mode for mode "1", or a PackedMask for a PackedMask
+        """
+        if isinstance(image, PackedMask):
+            return BinaryOperation.packed_morphology_sequence(image, steps)
+        if isinstance(image, Image.Image) and image.mode == "1":
+            if all(BinaryOperation._packable(*step[1:]) for step in steps):
+                mask = BinaryOperation.packed_morphology_sequence(PackedMask.from_image(image), steps)
+                return mask.to_image("1")
+            # cv2 has no bool images
+            return BinaryOperation.morphology_sequence(image.convert("L"), steps).convert("1")
+
+        array = np.asarray(image)
+        for step in steps:
+            array = BinaryOperation.morphology(array, *step)
+        return Image.fromarray(array)
+
+    @staticmethod
+    def packed_morphology_sequence(mask, steps):
+        """
+        Run morphology operations on a bit-packed mask, see morphology_sequence.
+        Only odd rectangles are supported, at an eighth of the memory of a uint8 mask.
+        :return: PackedMask
+        """
+        for step in steps:
+            operation, shape, size, iterations = tuple(step) + ("rect", 3, 1)[len(step) - 1:]
+            if operation not in BinaryOperation.OPERATIONS:
+                raise ValueError(f"Unknown morphology operation: {operation}")
+            if not BinaryOperation._packable(shape, size):
+                raise ValueError("Packed masks only support odd rectangular structuring elements.")
+            if iterations > 0:
+                mask = getattr(mask, operation)(size, iterations)
+        return mask
+
+    @staticmethod
+    def _packable(shape="rect", size=3, iterations=1):
+        width, height = (size, size) if np.ndim(size) == 0 else size
+        return shape == "rect" and width % 2 == 1 and height % 2 == 1
+
+    @staticmethod
+    def morphology(array, operation, shape="rect", size=3, iterations=1):
+        """
+        Morphology operation on a NumPy array.
+        :param operation: "dilate", "erode", "open", "close" or "boundary" (image minus its erosion)
+        :param shape: "rect", "ellipse" or "cross"
+        :param size: Side of the structuring element, or (width, height)
+        :param iterations: Times the dilation and erosion are repeated
+        :return: New array
+        """
+        if operation not in BinaryOperation.OPERATIONS:
+            raise ValueError(f"Unknown morphology operation: {operation}")
+        if operation == "dilate":
+            return BinaryOperation._morph(array, True, shape, size, iterations)
+        if operation == "erode":
+            return BinaryOperation._morph(array, False, shape, size, iterations)
+        if operation == "open":
+            eroded = BinaryOperation._morph(array, False, shape, size, iterations)
+            return BinaryOperation._morph(eroded, True, shape, size, iterations)
+        if operation == "close":
+            dilated = BinaryOperation._morph(array, True, shape, size, iterations)
+            return BinaryOperation._morph(dilated, False, shape, size, iterations)
+        return cv2.subtract(array, BinaryOperation._morph(array, False, shape, size, iterations))
+
+    @staticmethod
+    def structuring_element(shape="rect", size=3):
+        """
+        Cached structuring element, read-only since it is shared.
+        :param size: Side of the element, or (width, height)
+        """
+        width, height = (size, size) if np.ndim(size) == 0 else size
+        key = (shape, int(width), int(height))
+        if key not in BinaryOperation.STRUCTURING_ELEMENTS:
+            if shape not in BinaryOperation.SHAPES:
+                raise ValueError(f"Unknown structuring element shape: {shape}")
+            element = cv2.getStructuringElement(BinaryOperation.SHAPES[shape], (key[1], key[2]))
+            element.setflags(write=False)
+            BinaryOperation.STRUCTURING_ELEMENTS[key] = element
+        return BinaryOperation.STRUCTURING_ELEMENTS[key]
+
+    @staticmethod
+    def _morph(array, dilate, shape, size, iterations):
+        element = BinaryOperation.structuring_element(shape, size)
+        height, width = element.shape
+        # Decompositions need a centered element, even sizes go straight to cv2
+        if width % 2 and height % 2 and iterations > 0:
+            if shape == "rect":
+                # n passes of a rectangle are one pass of a rectangle n times as large
+                return BinaryOperation._rectangle(
+                    array, dilate, iterations * (width - 1) // 2, iterations * (height - 1) // 2
+                )
+            if shape == "ellipse" and max(width, height) >= BinaryOperation.DECOMPOSE_SIZE:
+                for _ in range(iterations):
+                    array = BinaryOperation._union_of_rectangles(array, dilate, element)
+                return array
+        morph = cv2.dilate if dilate else cv2.erode
+        return morph(array, element, iterations=iterations)
+
+    @staticmethod
+    def _rectangle(array, dilate, half_width, half_height):
+        # Rectangle of (2 * half_width + 1) x (2 * half_height + 1), as one row and one column pass when long
+        limit = BinaryOperation.LOGARITHMIC_SIZE
+        if 2 * half_width + 1 < limit and 2 * half_height + 1 < limit:
+            morph = cv2.dilate if dilate else cv2.erode
+            return morph(array, np.ones((2 * half_height + 1, 2 * half_width + 1), np.uint8))
+        array = BinaryOperation._segment(array, dilate, half_width, axis=1)
+        return BinaryOperation._segment(array, dilate, half_height, axis=0)
+
+    @staticmethod
+    def _segment(array, dilate, half, axis):
+        # Dilation or erosion by a centered segment of 2 * half + 1 pixels along an axis
+        morph = cv2.dilate if dilate else cv2.erode
+        if half == 0:
+            return array
+        if 2 * half + 1 < BinaryOperation.LOGARITHMIC_SIZE:
+            shape = (1, 2 * half + 1) if axis == 1 else (2 * half + 1, 1)
+            return morph(array, np.ones(shape, np.uint8))
+
+        # Segments [-s, s] + {-d, 0, d} = [-(s + d), s + d] while d <= 2s + 1, so the length triples per pass.
+        # Intermediate results are cut at the image border, so the image is padded by half with a neutral value
+        if dilate:
+            neutral = 0
+        else:
+            neutral = np.iinfo(array.dtype).max if np.issubdtype(array.dtype, np.integer) else np.inf
+        padding = [(0, 0)] * array.ndim
+        padding[axis] = (half, half)
+        array = np.pad(array, padding, constant_values=neutral)
+        reached = 0
+        while reached < half:
+            step = min(2 * reached + 1, half - reached)
+            kernel = np.zeros(2 * step + 1, np.uint8)
+            kernel[[0, step, 2 * step]] = 1
+            array = morph(array, kernel[None, :] if axis == 1 else kernel[:, None])
+            reached += step
+        crop = [slice(None)] * array.ndim
+        crop[axis] = slice(half, array.shape[axis] - half)
+        return np.ascontiguousarray(array[tuple(crop)])
+
+    @staticmethod
+    def _union_of_rectangles(array, dilate, element):
+        # A symmetric convex element is the union of rectangles (2a + 1) x (2b(a) + 1), one per distinct row
+        # half width a, where b(a) is the furthest row at least that wide. With a growing and b shrinking:
+        # result = column_b_last(row_a_last | column_(b_last-1 - b_last)(row_a_last-1 | ...))
+        # so every pass only adds the difference to the previous rectangle
+        height, width = element.shape
+        center_y, center_x = height // 2, width // 2
+        rows = {}
+        for y in range(height):
+            columns = np.flatnonzero(element[y])
+            if len(columns):
+                rows[abs(y - center_y)] = max(rows.get(abs(y - center_y), 0), int(center_x - columns[0]))
+        rectangles = [
+            (half_width, max(offset for offset, row_half in rows.items() if row_half >= half_width))
+            for half_width in sorted(set(rows.values()))
+        ]
+
+        combine = cv2.max if dilate else cv2.min
+        row = BinaryOperation._segment(array, dilate, rectangles[0][0], axis=1)
+        result = row
+        for (half_width, half_height), (next_width, next_height) in zip(rectangles, rectangles[1:]):
+            row = BinaryOperation._segment(row, dilate, next_width - half_width, axis=1)
+            result = combine(BinaryOperation._segment(result, dilate, half_height - next_height, axis=0), row)
+        return BinaryOperation._segment(result, dilate, rectangles[-1][1], axis=0)
+
+    # Deletion tables of the thinning sub-iterations, by method, built on first use
+    THINNING_LUTS = {}
+
+    @staticmethod
+    def skeletonization(image, method="zhang-suen"):
+        """
+        Skeleton of a binary image.
+        :param image: 2D array or PIL.Image object, every nonzero pixel is foreground (e.g. a 0/255 threshold)
+        :param method: "zhang-suen" or "guo-hall" thinning, or "morphological" for the erode/dilate skeleton
+        :return: PIL.Image object with the skeleton in 255
+        """
+        if method == "morphological":
+            return BinaryOperation.morphological_skeleton(image)
+        return Image.fromarray(BinaryOperation.thin(np.asarray(image), method))
+
+    @staticmethod
+    def thin(binary, method="zhang-suen"):
+        """
+        Thinning of a binary array to one pixel wide lines.
+        Every 3x3 neighbourhood is encoded as an 8 bit code (P2 at the top, clockwise) and looked up in a
+        deletion table, for all candidate pixels of a sub-iteration at once. Only pixels next to a pixel
+        deleted since their last check can change, so later sub-iterations only look at that frontier.
+        :param binary: 2D array, nonzero is foreground
+        :return: uint8 array with the skeleton in 255
+        """
+        luts = BinaryOperation._thinning_luts(method)
+        height, width = binary.shape
+        row = width + 2
+
+        # Working image with a background border, so neighbours of every pixel are valid flat indices
+        padded = np.zeros((height + 2, row), dtype=np.uint8)
+        padded[1:-1, 1:-1] = binary != 0
+        pixels = padded.ravel()
+        offsets = np.array([-row, -row + 1, 1, row + 1, row, row - 1, -1, -row - 1], dtype=np.intp)
+        weights = np.uint8(1) << np.arange(8, dtype=np.uint8)
+
+        # Interior pixels can never be deleted, the first candidates are the object borders
+        border = padded - cv2.erode(padded, np.ones((3, 3), np.uint8), borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        candidates = [np.flatnonzero(border)] * len(luts)
+        # Reused to drop duplicate indices without sorting: an index is kept where it wrote its own position
+        stamps = np.empty(pixels.size, dtype=np.int32)
+
+        def foreground_unique(index):
+            index = index[pixels[index] != 0]
+            positions = np.arange(len(index), dtype=np.int32)
+            stamps[index] = positions
+            return index[stamps[index] == positions]
+
+        step = 0
+        unchanged = 0
+        # Stop once every sub-iteration in a row deleted nothing
+        while unchanged < len(luts):
+            index = candidates[step]
+            codes = pixels[index[:, None] + offsets] @ weights
+            deleted = index[luts[step][codes]]
+            if len(deleted):
+                pixels[deleted] = 0
+                # The neighbours of deleted pixels are what every sub-iteration has to look at again
+                neighbours = (deleted[:, None] + offsets).ravel()
+                candidates = [
+                    foreground_unique(neighbours if other == step else np.concatenate([candidates[other], neighbours]))
+                    for other in range(len(luts))
+                ]
+                unchanged = 0
+            else:
+                candidates[step] = deleted
+                unchanged += 1
+            step = (step + 1) % len(luts)
+
+        return padded[1:-1, 1:-1] * np.uint8(255)
+
+    @staticmethod
+    def _thinning_luts(method):
+        # For every neighbourhood code, whether the center pixel is deleted in each sub-iteration
+        if method in BinaryOperation.THINNING_LUTS:
+            return BinaryOperation.THINNING_LUTS[method]
+        if method not in ("zhang-suen", "guo-hall"):
+            raise ValueError(f"Unknown thinning method: {method}")
+
+        luts = [np.zeros(256, dtype=bool), np.zeros(256, dtype=bool)]
+        for code in range(256):
+            p2, p3, p4, p5, p6, p7, p8, p9 = [(code >> bit) & 1 for bit in range(8)]
+            ring = [p2, p3, p4, p5, p6, p7, p8, p9, p2]
+            if method == "zhang-suen":
+                neighbours = sum(ring[:8])
+                transitions = sum(1 for a, b in zip(ring, ring[1:]) if a == 0 and b == 1)
+                if 2 <= neighbours <= 6 and transitions == 1:
+                    luts[0][code] = p2 * p4 * p6 == 0 and p4 * p6 * p8 == 0
+                    luts[1][code] = p2 * p4 * p8 == 0 and p2 * p6 * p8 == 0
+            else:
+                crossings = ((not p2) and (p3 or p4)) + ((not p4) and (p5 or p6)) \
+                    + ((not p6) and (p7 or p8)) + ((not p8) and (p9 or p2))
+                n1 = (p9 or p2) + (p3 or p4) + (p5 or p6) + (p7 or p8)
+                n2 = (p2 or p3) + (p4 or p5) + (p6 or p7) + (p8 or p9)
+                if crossings == 1 and 2 <= min(n1, n2) <= 3:
+                    luts[0][code] = not ((p6 or p7 or not p9) and p8)
+                    luts[1][code] = not ((p2 or p3 or not p5) and p4)
+        BinaryOperation.THINNING_LUTS[method] = luts
+        return luts
 
     @staticmethod
-    def skeletonization(image):
-        # Ensure the image is binary
+    def morphological_skeleton(image):
+        # Union of the opening residues of successive erosions
+        image = np.asarray(image, dtype=np.uint8)
         skeleton = np.zeros_like(image, dtype=np.uint8)
         temp_image = image.copy()
         kernel = np.ones((3, 3), np.uint8)
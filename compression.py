@@ -1,12 +1,74 @@
 import cv2
 import numpy as np
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import Tk, filedialog, Button, Label, OptionMenu, StringVar, messagebox, ttk
 from PIL import Image, ImageTk
 
 
 class ImageCompressor:
-    def __init__(self, image):
+    # Standard JPEG quantization matrix
+    QUANTIZATION_TABLE = np.array([
+        [16, 11, 10, 16, 24, 40, 51, 61],
+        [12, 12, 14, 19, 26, 58, 60, 55],
+        [14, 13, 16, 24, 40, 57, 69, 56],
+        [14, 17, 22, 29, 51, 87, 80, 62],
+        [18, 22, 37, 56, 68, 109, 103, 77],
+        [24, 35, 55, 64, 81, 104, 113, 92],
+        [49, 64, 78, 87, 103, 121, 120, 101],
+        [72, 92, 95, 98, 112, 100, 103, 99]
+    ], dtype=np.float32)
+
+    # Standard JPEG chrominance quantization matrix
+    CHROMA_QUANTIZATION_TABLE = np.array([
+        [17, 18, 24, 47, 99, 99, 99, 99],
+        [18, 21, 26, 66, 99, 99, 99, 99],
+        [24, 26, 56, 99, 99, 99, 99, 99],
+        [47, 66, 99, 99, 99, 99, 99, 99],
+        [99, 99, 99, 99, 99, 99, 99, 99],
+        [99, 99, 99, 99, 99, 99, 99, 99],
+        [99, 99, 99, 99, 99, 99, 99, 99],
+        [99, 99, 99, 99, 99, 99, 99, 99]
+    ], dtype=np.float32)
+
+    # Horizontal and vertical chroma subsampling factors
+    SUBSAMPLING = {"4:4:4": (1, 1), "4:2:2": (2, 1), "4:2:0": (2, 2)}
+
+    # JFIF RGB to YCbCr matrix, the chroma planes are offset by 128
+    YCBCR_MATRIX = np.array([
+        [0.299, 0.587, 0.114],
+        [-0.168736, -0.331264, 0.5],
+        [0.5, -0.418688, -0.081312]
+    ], dtype=np.float32)
+
+    # Blocks per parallel task. Fixed so the output does not depend on the number of workers
+    BLOCK_CHUNK = 4096
+    # Tasks of parallel_map in flight at once, whatever the worker count, so streamed bands stay few in memory
+    MAX_IN_FLIGHT = 8
+
+    # Orthonormal 8-point DCT-II basis, the same transform cv2.dct applies to an 8x8 block
+    DCT_MATRIX = np.array([
+        [(np.sqrt(1 / 8) if k == 0 else np.sqrt(2 / 8)) * np.cos((2 * n + 1) * k * np.pi / 16) for n in range(8)]
+        for k in range(8)
+    ], dtype=np.float32)
+
+    # Position in the flattened 8x8 block of every zig-zag index, low frequencies first
+    ZIGZAG = np.array(sorted(range(64), key=lambda index: (
+        index // 8 + index % 8,
+        index // 8 if (index // 8 + index % 8) % 2 else index % 8,
+    )), dtype=np.intp)
+
+    # Supported downscale factors of the progressive decode, every block then decodes to 8 // reduce pixels
+    REDUCTIONS = (1, 2, 4, 8)
+
+    def __init__(self, image, workers=None):
+        """
+        :param image: PIL.Image object or NumPy array
+        :param workers: Threads used for the DCT, None for the CPU count
+        """
+        self.workers = workers
+
         # Convert PIL image to NumPy array
         if isinstance(image, Image.Image):
             self.image = np.array(image)
@@ -19,54 +81,55 @@ class ImageCompressor:
     def apply_rle(self):
         """
         Applies Run-Length Encoding (RLE) to the image. Handles both grayscale and color images.
+        :return: Tuple (values, counts). values holds one pixel per run with the image dtype, shaped (runs,)
+                 for grayscale or (runs, channels) for color images, counts holds the run lengths
         """
         # Flatten the image for RLE processing
         if len(self.image.shape) == 2:  # Grayscale image
-            pixels = self.image.flatten()
+            pixels = self.image.reshape(-1)
         elif len(self.image.shape) == 3:  # Color image
-            # Flatten along all channels for RLE encoding
+            # One row per pixel, all channels together
             pixels = self.image.reshape(-1, self.image.shape[2])
         else:
             raise ValueError("Unsupported image format for RLE.")
 
-        encoded = []
-        prev_pixel = tuple(pixels[0]) if pixels.ndim > 1 else pixels[0]
-        count = 1
+        if pixels.shape[0] == 0:
+            return pixels.copy(), np.zeros(0, dtype=np.uint8)
 
-        for pixel in pixels[1:]:
-            pixel_tuple = tuple(pixel) if pixels.ndim > 1 else pixel
-            if pixel_tuple == prev_pixel:
-                count += 1
-            else:
-                encoded.append((prev_pixel, count))
-                prev_pixel = pixel_tuple
-                count = 1
+        # Compare whole pixels at once through a packed view with one element per pixel
+        pixels = np.ascontiguousarray(pixels)
+        packed = pixels.view(self._packed_dtype(pixels)).reshape(-1)
 
-        encoded.append((prev_pixel, count))
-        return encoded
+        # Run starts are the first pixel and every pixel that differs from the one before it
+        starts = np.flatnonzero(packed[1:] != packed[:-1]) + 1
+        starts = np.concatenate(([0], starts))
+        counts = np.diff(np.append(starts, len(packed)))
+
+        return pixels[starts], counts.astype(np.min_scalar_type(counts.max()))
+
+    @staticmethod
+    def _packed_dtype(pixels):
+        # Pixel sizes that fit an integer are compared as integers, other sizes as raw bytes
+        pixel_bytes = pixels.itemsize * (pixels.shape[1] if pixels.ndim == 2 else 1)
+        if pixel_bytes in (1, 2, 4, 8):
+            return np.dtype(f"u{pixel_bytes}")
+        return np.dtype((np.void, pixel_bytes))
 
     def run_length_decoding(self, encoded):
         """
         Decodes an RLE-encoded image back to its original format. Handles both grayscale and color images.
+        :param encoded: Tuple (values, counts) from apply_rle
         """
-        decoded = []
-        for pixel, count in encoded:
-            decoded.extend([pixel] * count)
-
-        decoded_array = np.array(decoded, dtype=np.uint8)
+        values, counts = encoded
+        decoded_array = np.repeat(values, counts, axis=0)
 
         # Determine original dimensions
-        height, width = self.image.shape[:2]
-        if len(self.image.shape) == 3:  # Color image
-            decoded_array = decoded_array.reshape((height, width, self.image.shape[2]))
-        else:  # Grayscale image
-            decoded_array = decoded_array.reshape((height, width))
-
-        return decoded_array
+        return decoded_array.reshape(self.image.shape)
 
     def apply_dct(self, quality):
         """
         Applies Discrete Cosine Transform (DCT) for lossy compression.
+        All 8x8 blocks are transformed, quantized and thresholded at once.
         """
         # If the image is a NumPy array, convert it back to a PIL.Image to ensure compatibility
         if isinstance(self.image, np.ndarray):
@@ -78,80 +141,333 @@ class ImageCompressor:
         image = image.convert('L')
         image = np.array(image, dtype=np.float32)
 
-        # Ensure dimensions are multiples of 8
+        # DCT of every 8x8 block, quantized and thresholded
         height, width = image.shape
-        padded_height = (height + 7) // 8 * 8
-        padded_width = (width + 7) // 8 * 8
-        padded_image = np.zeros((padded_height, padded_width), dtype=np.float32)
-        padded_image[:height, :width] = image
+        dct_encoded = self._encode_planes([image], [self.quantization_matrix(quality)], quality)[0]
+        return dct_encoded[:height, :width]  # Remove padding
+
+    def inverse_dct(self, dct_encoded, reduce=1, coefficients=64):
+        """
+        Decodes a coefficient plane, optionally at a reduced size or from the first coefficients only.
+        :param reduce: 1, 2, 4 or 8, the output is 1/reduce of the size. Only the top-left (8 / reduce)^2
+                       coefficients of every block are transformed, so no full size image is built first
+        :param coefficients: Number of zig-zag coefficients used per block, 1 keeps only the DC
+        """
+        height, width = dct_encoded.shape
+        decoded_image = self._decode_planes([dct_encoded], reduce, coefficients)[0]
+        return decoded_image[:-(-height // reduce), :-(-width // reduce)]  # Remove padding before returning
+
+    def apply_channel_dct(self, quality):
+        """
+        Applies DCT compression to every channel of the image, the channels and their block rows
+        are spread over the worker threads.
+        :return: List of dequantized coefficient planes, padded to whole 8x8 blocks
+        """
+        image = np.asarray(self.image)
+        planes = [image] if image.ndim == 2 else [image[:, :, index] for index in range(image.shape[2])]
+        return self._encode_planes(planes, [self.quantization_matrix(quality)] * len(planes), quality)
+
+    def inverse_channel_dct(self, encoded, reduce=1, coefficients=64):
+        """
+        Decodes the planes of apply_channel_dct back to a uint8 image of the original size,
+        or 1/reduce of it (see inverse_dct).
+        """
+        height, width = -(-self.image.shape[0] // reduce), -(-self.image.shape[1] // reduce)
+        planes = [plane[:height, :width] for plane in self._decode_planes(encoded, reduce, coefficients)]
+        return np.stack(planes, axis=-1) if len(planes) > 1 else planes[0]
+
+    def apply_ycbcr_dct(self, quality, subsampling="4:2:0"):
+        """
+        Applies DCT compression to an RGB image in YCbCr, with the chroma planes subsampled and
+        quantized with the chrominance table.
+        :param quality: Quality between 1 and 100
+        :param subsampling: "4:4:4", "4:2:2" or "4:2:0"
+        :return: List of dequantized coefficient planes [Y, Cb, Cr], the chroma planes at their reduced size.
+                 Planes keep their padding to whole 8x8 blocks, so partial edge blocks decode completely
+        """
+        planes = self.ycbcr_planes(np.asarray(self.image)[:, :, :3], subsampling)
+        tables = [self.quantization_matrix(quality, chroma=index > 0) for index in range(len(planes))]
+        return self._encode_planes(planes, tables, quality)
+
+    def inverse_ycbcr_dct(self, encoded, subsampling="4:2:0", reduce=1, coefficients=64):
+        """
+        Decodes the planes of apply_ycbcr_dct back to an RGB image of the original size,
+        or 1/reduce of it (see inverse_dct).
+        """
+        height, width = self.image.shape[:2]
+        factor_x, factor_y = self.SUBSAMPLING[subsampling]
+        sizes = [(height, width)] + [(-(-height // factor_y), -(-width // factor_x))] * 2
+        reductions = [(reduce, reduce)] + [self.plane_reduction(reduce, (factor_x, factor_y))] * 2
+        planes = [
+            plane[:-(-rows // reduce_y), :-(-columns // reduce_x)]
+            for plane, (rows, columns), (reduce_y, reduce_x)
+            in zip(self._decode_planes(encoded, reductions, coefficients), sizes, reductions)
+        ]
+        return self.merge_ycbcr(planes, (-(-height // reduce), -(-width // reduce)))
+
+    @staticmethod
+    def quantization_matrix(quality, chroma=False, scale=None):
+        """
+        Quantization matrix for a quality between 1 and 100.
+        :param chroma: Use the chrominance table instead of the luminance one
+        :param scale: Explicit scale factor for the table, overrides the one derived from quality
+        """
+        # Adjust quantization based on quality
+        scale_factor = max(1, (100 - quality) / 50.0) if scale is None else scale
+        table = ImageCompressor.CHROMA_QUANTIZATION_TABLE if chroma else ImageCompressor.QUANTIZATION_TABLE
+        return np.clip(table * scale_factor, 1, 255)
+
+    @staticmethod
+    def ycbcr_planes(rgb, subsampling="4:2:0"):
+        """
+        Split an RGB array into Y, Cb and Cr planes, averaging the chroma over the subsampling blocks.
+        :param rgb: (H, W, 3) array with values 0-255
+        :return: List of float32 planes [Y, Cb, Cr]
+        """
+        factor_x, factor_y = ImageCompressor.SUBSAMPLING[subsampling]
+        ycbcr = rgb.astype(np.float32) @ ImageCompressor.YCBCR_MATRIX.T
+        ycbcr[:, :, 1:] += 128
+        planes = [ycbcr[:, :, 0]]
+        for index in (1, 2):
+            plane = ycbcr[:, :, index]
+            if factor_x > 1 or factor_y > 1:
+                # Repeat the last row and column for odd sizes, then average each block
+                height, width = plane.shape
+                pad = ((0, -height % factor_y), (0, -width % factor_x))
+                plane = np.pad(plane, pad, mode="edge")
+                plane = plane.reshape(plane.shape[0] // factor_y, factor_y, plane.shape[1] // factor_x, factor_x).mean(axis=(1, 3))
+            planes.append(plane)
+        return planes
+
+    @staticmethod
+    def merge_ycbcr(planes, shape, margins=(0, 0)):
+        """
+        Upsample the chroma planes to the luma size and convert back to RGB.
+        :param planes: Decoded [Y, Cb, Cr] planes
+        :param shape: (height, width) of the image
+        :param margins: Extra chroma rows (above, below) that only serve as interpolation context,
+                        used when an image is decoded in bands
+        :return: (H, W, 3) uint8 RGB array
+        """
+        height, width = shape
+        ycbcr = np.empty((height, width, 3), dtype=np.float32)
+        ycbcr[:, :, 0] = planes[0][:height, :width]
+        for index in (1, 2):
+            ycbcr[:, :, index] = ImageCompressor.upsample_plane(planes[index], shape, margins) - 128
+        rgb = ycbcr @ np.linalg.inv(ImageCompressor.YCBCR_MATRIX).T
+        return np.clip(np.round(rgb), 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def upsample_plane(plane, shape, margins=(0, 0)):
+        """
+        Linearly upsample a subsampled chroma plane to the image size.
+        :param shape: (height, width) of the image
+        :param margins: Extra context rows (above, below) in the plane, see merge_ycbcr
+        :return: float32 plane of the given shape
+        """
+        height, width = shape
+        above, below = margins
+        plane = plane.astype(np.float32)
+        factor_y = -(-height // (plane.shape[0] - above - below))
+        factor_x = -(-width // plane.shape[1])
+        if factor_x > 1 or factor_y > 1:
+            size = (plane.shape[1] * factor_x, plane.shape[0] * factor_y)
+            plane = cv2.resize(plane, size, interpolation=cv2.INTER_LINEAR)
+        top = above * factor_y
+        return plane[top:top + height, :width]
+
+    @staticmethod
+    def forward_dct_blocks(plane):
+        """
+        DCT of every 8x8 block of a plane, padded with zeros to multiples of 8.
+        :param plane: 2D array with values 0-255
+        :return: Tuple ((blocks, 8, 8) float32 coefficients in row-major block order, padded (height, width))
+        """
+        # Ensure dimensions are multiples of 8
+        padded_image = ImageCompressor._pad_to_blocks(plane)
 
         # Shift values for DCT processing
         padded_image -= 128
 
-        # Standard JPEG quantization matrix
-        quantization_table = np.array([
-            [16, 11, 10, 16, 24, 40, 51, 61],
-            [12, 12, 14, 19, 26, 58, 60, 55],
-            [14, 13, 16, 24, 40, 57, 69, 56],
-            [14, 17, 22, 29, 51, 87, 80, 62],
-            [18, 22, 37, 56, 68, 109, 103, 77],
-            [24, 35, 55, 64, 81, 104, 113, 92],
-            [49, 64, 78, 87, 103, 121, 120, 101],
-            [72, 92, 95, 98, 112, 100, 103, 99]
-        ], dtype=np.float32)
+        # DCT of every block as C . B . C^T
+        blocks = ImageCompressor._to_blocks(padded_image)
+        return ImageCompressor.DCT_MATRIX @ blocks @ ImageCompressor.DCT_MATRIX.T, padded_image.shape
 
-        # Adjust quantization based on quality
-        scale_factor = max(1, (100 - quality) / 50.0)
-        quantization_matrix = np.clip(quantization_table * scale_factor, 1, 255)
+    @staticmethod
+    def quantize_blocks(dct_blocks, quantization_matrix, quality):
+        """
+        Quantize DCT blocks and zero the coefficients below quality percent of each block's maximum.
+        :return: Rounded quantized coefficients as float32, multiply by quantization_matrix to dequantize
+        """
+        # Quantization (zeroing small values)
+        quantized_blocks = np.round(dct_blocks / quantization_matrix)
 
-        # Apply DCT and quantization in 8×8 blocks
-        dct_encoded = np.zeros_like(padded_image)
-        for i in range(0, padded_height, 8):
-            for j in range(0, padded_width, 8):
-                block = padded_image[i:i+8, j:j+8]
-                dct_block = cv2.dct(block)
+        # Remove small coefficients based on quality, the threshold is relative to each block's maximum
+        thresholds = quantized_blocks.max(axis=(1, 2), keepdims=True) * (quality / 100.0)
+        quantized_blocks[np.abs(quantized_blocks) < thresholds] = 0
+        return quantized_blocks
 
-                # Quantization (zeroing small values)
-                quantized_block = np.round(dct_block / quantization_matrix)
+    @staticmethod
+    def inverse_dct_blocks(blocks, shape, reduce=1):
+        """
+        Inverse DCT of dequantized 8x8 blocks back to a uint8 plane.
+        :param blocks: (blocks, 8, 8) coefficients in row-major block order
+        :param shape: Padded (height, width) of the plane
+        :param reduce: 1, 2, 4 or 8, or a (vertical, horizontal) pair, the plane is decoded at 1/reduce, see scaled_idct
+        :return: uint8 plane of shape / reduce
+        """
+        reduce_y, reduce_x = reduce if isinstance(reduce, tuple) else (reduce, reduce)
+        decoded_blocks = ImageCompressor.scaled_idct(blocks, (reduce_y, reduce_x))
+        return ImageCompressor._from_blocks(decoded_blocks, (shape[0] // reduce_y, shape[1] // reduce_x))
 
-                # Remove small coefficients based on quality
-                threshold = np.max(quantized_block) * (quality / 100.0)
-                quantized_block[np.abs(quantized_block) < threshold] = 0
+    @staticmethod
+    def scaled_idct(blocks, reduce=1):
+        """
+        Inverse DCT of 8x8 coefficient blocks straight to 8 / reduce pixels per side.
+        The low N-point DCT coefficients of a block, scaled by sqrt(N / 8), approximate the N-point DCT of
+        the block averaged down by 8 / N, so an N-point inverse DCT of them gives the reduced block without
+        computing the full one. N = 1 is exactly the block mean taken from the DC alone.
+        :param blocks: (blocks, 8, 8) dequantized coefficients
+        :param reduce: 1, 2, 4 or 8, or a (vertical, horizontal) pair
+        :return: (blocks, 8 / reduce, 8 / reduce) uint8 pixels
+        """
+        reduce_y, reduce_x = reduce if isinstance(reduce, tuple) else (reduce, reduce)
+        if reduce_y not in ImageCompressor.REDUCTIONS or reduce_x not in ImageCompressor.REDUCTIONS:
+            raise ValueError(f"Reduce must be one of {ImageCompressor.REDUCTIONS}, got {reduce}")
+        rows, columns = 8 // reduce_y, 8 // reduce_x
+        basis_y = ImageCompressor.DCT_MATRIX if rows == 8 else ImageCompressor.dct_matrix(rows)
+        basis_x = ImageCompressor.DCT_MATRIX if columns == 8 else ImageCompressor.dct_matrix(columns)
 
-                dct_encoded[i:i+8, j:j+8] = quantized_block * quantization_matrix
+        # Inverse DCT of every block as C^T . B . C
+        scale = np.float32(np.sqrt(rows * columns) / 8)
+        decoded = basis_y.T @ (blocks[:, :rows, :columns] * scale) @ basis_x
 
-        return dct_encoded[:height, :width]  # Remove padding
+        # Shift values back to 0-255 range
+        decoded += 128
+        return np.clip(decoded, 0, 255).astype(np.uint8)
 
+    @staticmethod
+    def plane_reduction(reduce, factors):
+        """
+        Reduction of a subsampled plane that brings it to the size of the full plane decoded at 1/reduce,
+        so previews of subsampled chroma keep as much detail as the luma.
+        :param factors: (horizontal, vertical) subsampling factors of the plane
+        :return: (vertical, horizontal) reduction
+        """
+        factor_x, factor_y = factors
+        return max(1, reduce // factor_y), max(1, reduce // factor_x)
 
-    def inverse_dct(self, dct_encoded):
-        height, width = dct_encoded.shape
-        padded_height = (height + 7) // 8 * 8
-        padded_width = (width + 7) // 8 * 8
-        padded_dct = np.zeros((padded_height, padded_width), dtype=np.float32)
-        padded_dct[:height, :width] = dct_encoded
-
-        # Define standard quantization matrix (JPEG-like)
-        quantization_table = np.array([
-            [16, 11, 10, 16, 24, 40, 51, 61],
-            [12, 12, 14, 19, 26, 58, 60, 55],
-            [14, 13, 16, 24, 40, 57, 69, 56],
-            [14, 17, 22, 29, 51, 87, 80, 62],
-            [18, 22, 37, 56, 68, 109, 103, 77],
-            [24, 35, 55, 64, 81, 104, 113, 92],
-            [49, 64, 78, 87, 103, 121, 120, 101],
-            [72, 92, 95, 98, 112, 100, 103, 99]
+    @staticmethod
+    def dct_matrix(size):
+        """
+        Orthonormal size-point DCT-II basis, DCT_MATRIX for size 8.
+        """
+        return np.array([
+            [(np.sqrt(1 / size) if k == 0 else np.sqrt(2 / size)) * np.cos((2 * n + 1) * k * np.pi / (2 * size))
+             for n in range(size)]
+            for k in range(size)
         ], dtype=np.float32)
 
-        # Apply Inverse DCT in 8x8 blocks
-        decoded_image = np.zeros_like(padded_dct)
-        for i in range(0, padded_height, 8):
-            for j in range(0, padded_width, 8):
-                quantized_block = padded_dct[i:i+8, j:j+8]
-                idct_block = cv2.idct(quantized_block)
-                decoded_image[i:i+8, j:j+8] = idct_block
+    @staticmethod
+    def coefficient_count(reduce=1, coefficients=64):
+        """
+        Number of leading zig-zag coefficients a decode at 1/reduce needs, at most coefficients.
+        :param reduce: 1, 2, 4 or 8, or a (vertical, horizontal) pair
+        """
+        reduce_y, reduce_x = reduce if isinstance(reduce, tuple) else (reduce, reduce)
+        rows, columns = 8 // reduce_y, 8 // reduce_x
+        needed = max(
+            position for position, index in enumerate(ImageCompressor.ZIGZAG) if index // 8 < rows and index % 8 < columns
+        ) + 1
+        return max(1, min(needed, coefficients))
 
-        # Shift values back to 0-255 range
-        decoded_image += 128
-        decoded_image = np.clip(decoded_image, 0, 255).astype(np.uint8)
+    @staticmethod
+    def parallel_map(function, items, workers=None, in_flight=MAX_IN_FLIGHT):
+        """
+        Map a function over items on a thread pool, yielding the results in input order.
+        NumPy, cv2 and zlib release the GIL in their heavy loops, so the threads run on separate cores.
+        At most in_flight tasks are submitted and not yet yielded, so items produced lazily and their
+        results stay bounded in memory on any machine. More workers than that would only sit idle.
+        :param workers: Number of threads, None for the CPU count, 1 runs everything on the calling thread
+        :param in_flight: Bound on pending tasks, None for two per worker when the items are already in memory
+        """
+        workers = workers or os.cpu_count() or 1
+        in_flight = workers * 2 if in_flight is None else in_flight
+        workers = min(workers, in_flight)
+        if workers == 1:
+            yield from map(function, items)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for item in items:
+                pending.append(executor.submit(function, item))
+                if len(pending) >= in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _encode_planes(self, planes, tables, quality):
+        # Transform, quantize and dequantize every plane, one task per chunk of blocks
+        padded = [self._pad_to_blocks(plane) - 128 for plane in planes]
+        blocks = [self._to_blocks(plane) for plane in padded]
+
+        def encode(task):
+            index, start = task
+            chunk = blocks[index][start:start + self.BLOCK_CHUNK]
+            dct_chunk = self.DCT_MATRIX @ chunk @ self.DCT_MATRIX.T
+            return self.quantize_blocks(dct_chunk, tables[index], quality) * tables[index]
+
+        return self._map_chunks(encode, blocks, [plane.shape for plane in padded])
+
+    def _decode_planes(self, encoded, reduce=1, coefficients=64):
+        # Inverse transform of dequantized coefficient planes, one task per chunk of blocks
+        # reduce is one value for every plane or a list of (vertical, horizontal) reductions per plane
+        reductions = reduce if isinstance(reduce, list) else [(reduce, reduce)] * len(encoded)
+        padded = [self._pad_to_blocks(plane) for plane in encoded]
+        blocks = [self._to_blocks(plane) for plane in padded]
+        mask = None
+        if coefficients < 64:
+            mask = np.zeros(64, dtype=np.float32)
+            mask[self.ZIGZAG[:coefficients]] = 1
+            mask = mask.reshape(8, 8)
+
+        def decode(task):
+            index, start = task
+            chunk = blocks[index][start:start + self.BLOCK_CHUNK]
+            return self.scaled_idct(chunk if mask is None else chunk * mask, reductions[index])
+
+        shapes = [
+            (plane.shape[0] // reduce_y, plane.shape[1] // reduce_x)
+            for plane, (reduce_y, reduce_x) in zip(padded, reductions)
+        ]
+        return self._map_chunks(decode, blocks, shapes)
+
+    def _map_chunks(self, function, blocks, shapes):
+        tasks = [(index, start) for index, plane in enumerate(blocks) for start in range(0, len(plane), self.BLOCK_CHUNK)]
+        results = list(self.parallel_map(function, tasks, self.workers, in_flight=None))
+        planes = []
+        for index, shape in enumerate(shapes):
+            chunks = [result for (task_index, _), result in zip(tasks, results) if task_index == index]
+            planes.append(self._from_blocks(np.concatenate(chunks), shape))
+        return planes
+
+    @staticmethod
+    def _pad_to_blocks(plane):
+        # Zero pad a plane to multiples of 8 in float32
+        height, width = plane.shape
+        padded = np.zeros(((height + 7) // 8 * 8, (width + 7) // 8 * 8), dtype=np.float32)
+        padded[:height, :width] = plane
+        return padded
+
+    @staticmethod
+    def _to_blocks(plane):
+        # (H, W) plane to a (blocks, 8, 8) tensor in row-major block order
+        height, width = plane.shape
+        return plane.reshape(height // 8, 8, width // 8, 8).swapaxes(1, 2).reshape(-1, 8, 8)
 
-        return decoded_image[:height, :width]  # Remove padding before returning
\ No newline at end of file
+    @staticmethod
+    def _from_blocks(blocks, shape):
+        # Inverse of _to_blocks, for any block size
+        height, width = shape
+        rows, columns = blocks.shape[-2:]
+        return blocks.reshape(height // rows, width // columns, rows, columns).swapaxes(1, 2).reshape(height, width)
@@ -7,11 +7,21 @@ import numpy as np
 from mathematicalOperation import MathematicalOperations
 from imageEnhancement import ImageEnhancement
 from transformAndFiltering import TransformAndFiltering
+from frequencyFilter import FrequencyFilter
 from imageRestorationAndImageMatching import ImageMatchingAndImageRestorations
 from compression import ImageCompressor
+from papiContainer import PapiContainer
+from rateControl import RateController
 from segmentation import ImageSegmentation
 from binaryOperation import BinaryOperation
 from basicOperation import basicOperations
+from affineTransform import AffineTransform
+from overlayCompositor import OverlayCompositor
+from previewPyramid import PreviewPyramid
+from proxySession import ProxySession
+from jobScheduler import JobScheduler
+from historyStore import HistoryStore
+import io
 import math
 
 class ImageEditorApp:
@@ -46,10 +56,26 @@ class ImageEditorApp:
         self.original_image = None
         self.overlay_image = None
         self.overlay_position = (0, 0)  # Initial position of overlay
+        self.overlay_compositor = None
+        self.overlay_render_pending = False
 
-        # Undo and Redo stacks
-        self.undo_stack = []
-        self.redo_stack = []
+        # Pending geometric edits, rendered from geometry_base with a single resample
+        self.geometry_base = None
+        self.geometry_steps = []
+        self.geometry_base_index = None
+        self.geometry_result = None
+        self.geometry_history_index = None
+
+        # Proxy editing: operations run on a screen-sized copy and are replayed at full resolution on save
+        self.proxy_session = None
+        self.proxy_undo_start = 0
+
+        # Operations run on worker threads, results are applied on the Tk main thread in submission order
+        self.jobs = JobScheduler(self.root, on_status=self.status_text.set)
+
+        # Undo and Redo history, stored compressed and spilled to disk past the memory budget
+        self.history = HistoryStore()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Zoom variables
         self.left_zoom = 1.0
@@ -61,6 +87,9 @@ class ImageEditorApp:
         self.right_tk_image = None
         self.result_tk_image = None
 
+        # Display pyramids per canvas side, rebuilt when a new image is shown there
+        self.preview_pyramids = {}
+
     def create_top_panel(self):
         self.top_panel = ttk.Frame(self.main_frame)
         self.top_panel.pack(side=tk.TOP, fill=tk.X)
@@ -81,12 +110,247 @@ class ImageEditorApp:
             btn = ttk.Button(self.top_panel, text=text, command=command)
             btn.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.proxy_mode = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.top_panel, text="Proxy Mode", variable=self.proxy_mode, command=self.toggle_proxy_mode).pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.status_text = tk.StringVar(value="Ready")
+        ttk.Label(self.top_panel, textvariable=self.status_text).pack(side=tk.RIGHT, padx=5, pady=5)
+
+    def on_close(self):
+        """Stop pending jobs and remove the history spill file before closing."""
+        self.jobs.shutdown()
+        self.history.clear()
+        self.root.destroy()
+
     def get_base_image(self):
         """
         Return the current result image if it exists, otherwise return the original left image.
         """
         return self.result_image if self.result_image else self.left_image
 
+    def run_operation(self, operation, *args, **kwargs):
+        """
+        Apply operation(base_image, *args, **kwargs) to the current image on a worker thread, then display
+        the result and save it for undo. Every call is applied, also when the same operation is still pending:
+        each click is an edit of its own, the second one runs on the result of the first.
+        In proxy mode the operation runs on the screen-sized proxy and is recorded for the full resolution render.
+        :param operation: Callable taking the image as first argument and returning the new image
+        """
+        context = {}
+
+        def prepare():
+            # Resolved when the job starts, so it sees the results of the jobs queued before it
+            context["session"] = self.ensure_proxy_session() if self.proxy_mode.get() else None
+            source = context["session"].proxy if context["session"] else self.get_base_image()
+            context["source"] = source
+            return lambda: operation(source, *args, **kwargs)
+
+        def on_success(result):
+            recipe = self.make_recipe(context["source"], operation, args, kwargs)
+            if context["session"] is not None:
+                result = context["session"].record(operation, args, kwargs, result)
+            self.show_result(result, recipe)
+
+        name = getattr(operation, "__name__", "operation")
+        self.submit_job("operation" if name == "<lambda>" else name, prepare, on_success)
+
+    def run_full_resolution_operation(self, operation, *args, **kwargs):
+        """
+        Like run_operation, but always on the full resolution image, also in proxy mode. For operations whose
+        parameters are pixels of the full image (crop sizes, border thickness, seed points) or that read the
+        second image: on the proxy their preview would not match the render. Pending proxy edits are
+        rendered and committed first, see submit_committed_job.
+        :param operation: Callable taking the image as first argument and returning the new image
+        """
+        context = {}
+
+        def work(base_image):
+            context["source"] = base_image
+            return operation(base_image, *args, **kwargs)
+
+        def on_success(result):
+            self.show_result(result, self.make_recipe(context["source"], operation, args, kwargs))
+
+        name = getattr(operation, "__name__", "operation")
+        self.submit_committed_job("operation" if name == "<lambda>" else name, work, on_success)
+
+    def submit_job(self, name, prepare, on_success, key=None):
+        """
+        Queue a job that changes the result image. These jobs run one at a time in the order they were
+        requested, and errors are reported in a message box.
+        :param name: Name shown in the status bar
+        :param prepare: Callable run on the main thread when the job starts, returning the worker callable
+        :param on_success: Callable receiving the worker result on the main thread
+        :param key: Pending jobs with the same key are replaced by the newer one. Only for handlers that re-run
+                    with the latest parameters, such as live slider previews, never for discrete edits
+        """
+        self.jobs.submit(name, prepare, on_success, on_error=self.show_job_error, key=key, lane="result")
+
+    def show_job_error(self, error):
+        messagebox.showerror("Error", f"An error occurred: {error}")
+
+    def show_result(self, image, recipe=None):
+        """
+        Display a new result image and save it for undo.
+        :param recipe: Optional history recipe, see make_recipe
+        """
+        self.result_image = image
+        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+        self.save_state_for_undo(recipe)
+
+    def make_recipe(self, source, operation, args=(), kwargs=None, parent=None):
+        """
+        Describe a result as operation(source, *args, **kwargs) for the undo history, so the history can
+        rebuild or replay it instead of keeping its pixels.
+        :param source: Image the operation ran on, it has to be a state of the history
+        :param parent: History index of source, defaults to the current state
+        :return: Recipe tuple, or None when source is not in the history
+        """
+        if parent is None:
+            if not self.history.can_undo or source is not self.history.current:
+                return None
+            parent = self.history.position - 1
+        return (operation, tuple(args), dict(kwargs or {}), parent)
+
+    def apply_geometric_transform(self, step):
+        """
+        Add a geometric step to the pending affine transform and render the result.
+        Consecutive geometric edits are folded into one matrix and resampled once from the
+        image they started on, instead of resampling the previous result again.
+        :param step: Tuple (AffineTransform method name, parameters), e.g. ("rotate", (30,))
+        """
+        context = {}
+
+        def prepare():
+            session = self.ensure_proxy_session() if self.proxy_mode.get() else None
+            base_image = self.get_base_image()
+            if not self.geometry_steps or base_image is not self.geometry_result:
+                self.geometry_base = base_image
+                self.geometry_steps = []
+                self.geometry_base_index = len(session.operations) if session else None
+                in_history = self.history.can_undo and base_image is self.history.current
+                self.geometry_history_index = self.history.position - 1 if in_history else None
+            self.geometry_steps.append(step)
+
+            steps = list(self.geometry_steps)
+            context.update(session=session, steps=steps, base_index=self.geometry_base_index,
+                           history_index=self.geometry_history_index)
+            if session:
+                # The steps are recorded against the state the chain started on, with offsets in full resolution pixels
+                source = session.state(self.geometry_base_index)
+                return lambda: AffineTransform.apply_steps(source, steps, session.scale)
+            source = self.geometry_base
+            return lambda: AffineTransform.apply_steps(source, steps)
+
+        def on_success(result):
+            session = context["session"]
+            args = (context["steps"], session.scale) if session else (context["steps"],)
+            recipe = None
+            if context["history_index"] is not None:
+                recipe = (AffineTransform.apply_steps, args, {}, context["history_index"])
+            if session:
+                result = session.record(AffineTransform.apply_steps, (context["steps"],), {}, result, context["base_index"])
+            self.geometry_result = result
+            self.show_result(result, recipe)
+
+        self.submit_job(step[0], prepare, on_success)
+
+    def ensure_proxy_session(self):
+        """
+        Return the active proxy session, starting a new one from the current image when needed.
+        """
+        session = self.proxy_session
+        if session is not None:
+            # Drop the session if the image was changed outside of it
+            current = session.proxy if session.operations else session.source
+            if self.get_base_image() is not current:
+                session = None
+        if session is None:
+            screen_size = (self.root.winfo_screenwidth(), self.root.winfo_screenheight())
+            session = ProxySession(self.get_base_image(), screen_size)
+            self.proxy_session = session
+            self.proxy_undo_start = self.history.position
+        return session
+
+    def submit_committed_job(self, name, work, on_success):
+        """
+        Queue a job that needs the full resolution image, e.g. an export or compression.
+        Pending proxy edits are rendered at full resolution on the worker thread before work runs, and
+        committed as a single undo step on the main thread before on_success, also when work fails.
+        :param work: Callable taking the full resolution image, run on the worker thread
+        :param on_success: Callable receiving the result of work on the main thread
+        """
+        context = {}
+
+        def prepare():
+            # Resolved when the job starts, so the jobs queued before it have already been recorded
+            session = self.proxy_session
+            self.proxy_session = None
+            if session is None or not session.operations:
+                base_image = self.get_base_image()
+                return lambda: work(base_image)
+            operations = list(session.operations)
+
+            def render_and_work():
+                context["rendered"] = session.render(operations)
+                return work(context["rendered"])
+            return render_and_work
+
+        def commit():
+            if "rendered" in context:
+                self.finish_proxy_session(context.pop("rendered"))
+
+        def on_done(result):
+            commit()
+            on_success(result)
+
+        def on_error(error):
+            commit()
+            self.show_job_error(error)
+
+        self.jobs.submit(name, prepare, on_done, on_error=on_error, lane="result")
+
+    def finish_proxy_session(self, image):
+        self.result_image = image
+        self.history.truncate(self.proxy_undo_start)
+        self.save_state_for_undo()
+        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+
+    def toggle_proxy_mode(self):
+        """Leaving proxy mode renders the pending edits at full resolution in the background."""
+        if self.proxy_mode.get():
+            return
+
+        def prepare():
+            session = self.proxy_session
+            self.proxy_session = None
+            if session is None or not session.operations:
+                return lambda: None
+            operations = list(session.operations)
+            return lambda: session.render(operations)
+
+        def on_success(image):
+            if image is not None:
+                self.finish_proxy_session(image)
+
+        self.submit_job("full resolution render", prepare, on_success)
+
+    def render_full_resolution(self, on_done):
+        """
+        Render the proxy edits at full resolution in the background and pass the image to on_done.
+        The render waits for the pending operations, so it includes every edit requested so far.
+        """
+        def prepare():
+            session = self.proxy_session
+            if session is None or not session.operations:
+                image = self.result_image
+                return lambda: image
+            operations = list(session.operations)
+            return lambda: session.render(operations)
+
+        self.jobs.submit("full resolution render", prepare, on_done,
+                         on_error=lambda e: messagebox.showerror("Error", f"Full resolution render failed: {e}"), lane="result")
+
     def create_image_sections(self):
         self.left_frame = ttk.Frame(self.content_frame)
         self.left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -463,9 +727,25 @@ class ImageEditorApp:
         quality_dropdown = ttk.OptionMenu(main_frame, self.quality_var, *quality_options)
         quality_dropdown.pack(pady=5)
 
+        # RGB codes every channel at full resolution, the YCbCr options subsample the chroma planes
+        self.subsampling_var = tk.StringVar(main_frame)
+        self.subsampling_var.set("RGB")
+        subsampling_options = ["RGB", "RGB", "YCbCr 4:4:4", "YCbCr 4:2:2", "YCbCr 4:2:0"]
+        ttk.OptionMenu(main_frame, self.subsampling_var, *subsampling_options).pack(pady=5)
+
         btn_apply_lossy = ttk.Button(main_frame, text="Apply Lossy Compression", command=self.apply_lossy_compression)
         btn_apply_lossy.pack(pady=5)
 
+        # Rate control: search the quantization scale for a target size or quality
+        rate_frame = ttk.LabelFrame(main_frame, text="Rate Control")
+        rate_frame.pack(fill='x', pady=5)
+        self.rate_target_var = tk.StringVar(rate_frame)
+        rate_options = ["Max Size (KB)", "Max Size (KB)", "Min PSNR (dB)"]
+        ttk.OptionMenu(rate_frame, self.rate_target_var, *rate_options).pack(pady=5)
+        self.rate_value = ttk.Entry(rate_frame)
+        self.rate_value.pack(pady=5)
+        ttk.Button(rate_frame, text="Apply Rate Controlled Compression", command=self.apply_rate_controlled_compression).pack(pady=5)
+
     def update_file_size_display(self):
         if self.original_image:
             original_size = self.original_image.size[0] * self.original_image.size[1] * 3
@@ -483,42 +763,60 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            # Initialize compressor with the PIL image
-            compressor = ImageCompressor(base_image)
-            
-            # Perform RLE compression
-            rle_encoded = compressor.apply_rle()
-            self.compressed_file_size = len(rle_encoded) * 2  # Approximate compressed size
+            self.submit_committed_job("lossless compression", self.compress_lossless, self.finish_lossless_compression)
+        else:
+            messagebox.showwarning("Warning", "No image loaded!")
 
-            # Decode the compressed data back to the original image
-            decoded_image_array = compressor.run_length_decoding(rle_encoded)
+    @staticmethod
+    def compress_lossless(base_image):
+        """
+        RLE round trip of an image through the PAPI container, run on a worker thread.
+        :return: Tuple (decoded PIL image, compressed size in bytes, container bytes)
+        """
+        # Compress into an in-memory .papi file, its length is the real compressed size
+        buffer = io.BytesIO()
+        PapiContainer.write(buffer, base_image, codec="rle")
+        data = buffer.getvalue()
 
-            # Convert decoded array back to PIL Image with the original mode
-            self.result_image = Image.fromarray(decoded_image_array, mode=base_image.mode)
+        # Decode the compressed data back to a PIL Image with the original mode
+        return PapiContainer.read_image(data), len(data), data
 
-            # Display the result image in the result canvas
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+    def finish_lossless_compression(self, result):
+        self.result_image, self.compressed_file_size, data = result
 
-            # Display alert for autosave
-            messagebox.showinfo("Autosave", "This is autosave. Compressed image has been saved.")
+        # Display the result image in the result canvas
+        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
 
-            # Autosave compressed image
-            save_path = filedialog.asksaveasfilename(
-                title="Save Compressed Image",
-                defaultextension=".png",
-                filetypes=[("PNG Files", "*.png"), ("JPEG Files", "*.jpg"), ("All Files", "*.*")]
-            )
-            if save_path:
-                self.result_image.save(save_path)
-                messagebox.showinfo("Success", f"Image saved successfully at: {save_path}")
+        # Display alert for autosave
+        messagebox.showinfo("Autosave", "This is autosave. Compressed image has been saved.")
 
-            # Update file size display
-            self.update_file_size_display()
+        # Autosave compressed image
+        save_path = filedialog.asksaveasfilename(
+            title="Save Compressed Image",
+            defaultextension=".png",
+            filetypes=[("PNG Files", "*.png"), ("JPEG Files", "*.jpg"), ("PAPI Compressed Files", "*.papi"), ("All Files", "*.*")]
+        )
+        if save_path:
+            self.save_compressed(save_path, data)
 
-            # Save the current state for undo
-            self.save_state_for_undo()
+        # Update file size display
+        self.update_file_size_display()
+
+        # Save the current state for undo
+        self.save_state_for_undo()
+
+    def save_compressed(self, save_path, data, **save_options):
+        """
+        Save a compression result, .papi paths get the compressed container itself.
+        :param data: Bytes of the PAPI container
+        :param save_options: Options for PIL's save when saving a regular image file
+        """
+        if save_path.lower().endswith(".papi"):
+            with open(save_path, "wb") as file:
+                file.write(data)
         else:
-            messagebox.showwarning("Warning", "No image loaded!")
+            self.result_image.save(save_path, **save_options)
+        messagebox.showinfo("Success", f"Image saved successfully at: {save_path}")
 
     def apply_lossy_compression(self):
         # Get the base image (result image if exists, otherwise the left/original image)
@@ -531,56 +829,121 @@ class ImageEditorApp:
                 return
 
             quality = int(quality)
-            compressor = ImageCompressor(np.array(base_image))
-
-            # Split image into color channels
-            if base_image.mode == 'RGB':
-                channels = base_image.split()  # R, G, B channels
-            else:
+            subsampling = self.subsampling_var.get()
+            subsampling = None if subsampling == "RGB" else subsampling.split()[-1]
+            if base_image.mode != 'RGB':
                 messagebox.showwarning("Warning", "Only RGB images are supported for color lossy compression!")
                 return
 
-            # Apply DCT to each channel and store results
-            dct_encoded_channels = []
-            decoded_channels = []
+            def work(base_image):
+                if base_image.mode != 'RGB':
+                    raise ValueError("Only RGB images are supported for color lossy compression!")
+                return self.compress_lossy(base_image, quality, subsampling)
 
-            for channel in channels:
-                channel_array = np.array(channel, dtype=np.float32)
-                compressor.image = channel_array  # Set current channel for processing
-                dct_encoded = compressor.apply_dct(quality)  # Apply DCT compression
-                dct_encoded_channels.append(dct_encoded)
-                decoded_channel = compressor.inverse_dct(dct_encoded)  # Decode channel
-                decoded_channels.append(decoded_channel)
+            self.submit_committed_job("lossy compression", work, lambda result: self.finish_lossy_compression(result, quality))
+        else:
+            messagebox.showwarning("Warning", "No image loaded!")
 
-            # Combine decoded channels into a color image
-            decoded_image_array = np.stack(decoded_channels, axis=-1)
-            self.result_image = Image.fromarray(decoded_image_array.astype(np.uint8), mode='RGB')
+    @staticmethod
+    def compress_lossy(base_image, quality, subsampling=None):
+        """
+        DCT round trip of an RGB image through the PAPI container, run on a worker thread.
+        :param subsampling: None to code R, G and B, or "4:4:4", "4:2:2", "4:2:0" to code YCbCr
+        :return: Tuple (decoded PIL image, compressed size in bytes, container bytes)
+        """
+        # Every plane is DCT coded and entropy coded into an in-memory .papi file
+        buffer = io.BytesIO()
+        PapiContainer.write(buffer, base_image, codec="dct", quality=quality, subsampling=subsampling)
+        data = buffer.getvalue()
 
-            # Calculate compressed file size (approximation)
-            self.compressed_file_size = sum(np.count_nonzero(channel) for channel in dct_encoded_channels) * 2
+        # Decode the compressed data back into a color image
+        return PapiContainer.read_image(data), len(data), data
 
-            # Display the result image
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+    def finish_lossy_compression(self, result, quality):
+        self.result_image, self.compressed_file_size, data = result
 
-            # Autosave functionality
-            messagebox.showinfo("Autosave", "This is autosave. Compressed image has been saved.")
-            save_path = filedialog.asksaveasfilename(
-                title="Save Compressed Image",
-                defaultextension=".jpg",
-                filetypes=[("JPEG Files", "*.jpg"), ("PNG Files", "*.png"), ("All Files", "*.*")]
-            )
-            if save_path:
-                self.result_image.save(save_path, format="JPEG", quality=quality)
-                messagebox.showinfo("Success", f"Image saved successfully at: {save_path}")
+        # Display the result image
+        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
 
+        # Autosave functionality
+        messagebox.showinfo("Autosave", "This is autosave. Compressed image has been saved.")
+        save_path = filedialog.asksaveasfilename(
+            title="Save Compressed Image",
+            defaultextension=".jpg",
+            filetypes=[("JPEG Files", "*.jpg"), ("PNG Files", "*.png"), ("PAPI Compressed Files", "*.papi"), ("All Files", "*.*")]
+        )
+        if save_path:
+            self.save_compressed(save_path, data, format="JPEG", quality=quality)
 
-                # Update file size display
-                self.update_file_size_display()
 
-                # Save the current state for undo
-                self.save_state_for_undo()
-            else:
-                pass
+            # Update file size display
+            self.update_file_size_display()
+
+            # Save the current state for undo
+            self.save_state_for_undo()
+
+    def apply_rate_controlled_compression(self):
+        base_image = self.get_base_image()
+
+        if base_image:
+            try:
+                value = float(self.rate_value.get())
+            except ValueError:
+                messagebox.showerror("Error", "Invalid target value. Please enter a number.")
+                return
+            if base_image.mode != 'RGB':
+                messagebox.showwarning("Warning", "Only RGB images are supported for color lossy compression!")
+                return
+
+            target = self.rate_target_var.get()
+            subsampling = self.subsampling_var.get()
+            subsampling = None if subsampling == "RGB" else subsampling.split()[-1]
+
+            def work(base_image):
+                if base_image.mode != 'RGB':
+                    raise ValueError("Only RGB images are supported for color lossy compression!")
+                return self.compress_rate_controlled(base_image, target, value, subsampling)
+
+            self.submit_committed_job("rate controlled compression", work, self.finish_rate_controlled_compression)
+        else:
+            messagebox.showwarning("Warning", "No image loaded!")
+
+    @staticmethod
+    def compress_rate_controlled(base_image, target, value, subsampling=None):
+        """
+        Search the DCT quantization scale for a size budget or PSNR floor, run on a worker thread.
+        :param target: "Max Size (KB)" or "Min PSNR (dB)"
+        :return: Tuple (decoded PIL image, compressed size in bytes, container bytes, scale, PSNR of the decoded image)
+        """
+        controller = RateController(base_image, subsampling)
+        if target == "Min PSNR (dB)":
+            scale = controller.fit_psnr(value)
+        else:
+            scale = controller.fit_size(value * 1024)
+
+        buffer = io.BytesIO()
+        controller.write(buffer, scale)
+        data = buffer.getvalue()
+        return PapiContainer.read_image(data), len(data), data, scale, controller.probe(scale)[1]
+
+    def finish_rate_controlled_compression(self, result):
+        self.result_image, self.compressed_file_size, data, scale, psnr = result
+        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+        self.update_file_size_display()
+        messagebox.showinfo(
+            "Rate Control",
+            f"Quantization scale {scale:.2f}: {self.compressed_file_size / 1024:.2f} KB, {psnr:.2f} dB PSNR."
+        )
+
+        save_path = filedialog.asksaveasfilename(
+            title="Save Compressed Image",
+            defaultextension=".papi",
+            filetypes=[("PAPI Compressed Files", "*.papi"), ("PNG Files", "*.png"), ("All Files", "*.*")]
+        )
+        if save_path:
+            self.save_compressed(save_path, data)
+        self.save_state_for_undo()
+
     def create_segmentation_tab(self, parent):
         main_frame = ttk.Frame(parent)
         main_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -613,10 +976,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            segmentation = ImageSegmentation(base_image)
-            self.result_image = segmentation.edge_detected()
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(lambda image: ImageSegmentation.for_image(image).edge_detected())
         else:
             messagebox.showwarning("Warning", "No image loaded!")
     
@@ -625,10 +985,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            segmentation = ImageSegmentation(base_image)
-            self.result_image = segmentation.apply_edge_sobel()
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(lambda image: ImageSegmentation.for_image(image).apply_edge_sobel())
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -638,10 +995,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            segmentation = ImageSegmentation(base_image)
-            self.result_image = segmentation.apply_edge_prewitt()
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(lambda image: ImageSegmentation.for_image(image).apply_edge_prewitt())
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -650,10 +1004,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            segmentation = ImageSegmentation(base_image)
-            self.result_image = segmentation.apply_edge_robert()
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(lambda image: ImageSegmentation.for_image(image).apply_edge_robert())
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -661,10 +1012,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()        
         if base_image:
             seed_point = (50, 50)  
-            segmentation = ImageSegmentation(base_image)
-            self.result_image = segmentation.apply_region_growing(seed_point)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_full_resolution_operation(lambda image: ImageSegmentation.for_image(image).apply_region_growing(seed_point))
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -672,10 +1020,7 @@ class ImageEditorApp:
     def apply_region_watershed(self):
         base_image = self.get_base_image() 
         if base_image:
-            segmentation = ImageSegmentation(base_image)
-            self.result_image = segmentation.apply_region_watershed()
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(lambda image: ImageSegmentation.for_image(image).apply_region_watershed(levels=None))
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -684,14 +1029,24 @@ class ImageEditorApp:
         base_image = self.get_base_image()
         
         if base_image:
-            segmentation = ImageSegmentation(base_image)
-            self.result_image = segmentation.apply_kmeans_clustering()
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            # Fast mode: the palette is fitted on a sample. The first run keeps it in palette, so the full
+            # resolution render of a proxy edit and history replays map to the palette that was previewed
+            self.run_operation(self.kmeans_clustering, ImageSegmentation.KMEANS_SAMPLE_SIZE, {})
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
     
+    @staticmethod
+    def kmeans_clustering(image, sample_size, palette):
+        """
+        Fast k-means of an image, fitting the palette on the first call and reusing it afterwards.
+        :param palette: Dict shared by the calls of one edit, holding the fitted centers
+        """
+        segmentation = ImageSegmentation.for_image(image)
+        if "centers" not in palette:
+            palette["centers"] = segmentation.kmeans_palette(sample_size=sample_size)
+        return segmentation.apply_kmeans_clustering(centers=palette["centers"])
+
     def create_filter_transform_tab(self, parent): 
         main_frame = ttk.Frame(parent)
         main_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -715,6 +1070,31 @@ class ImageEditorApp:
         ttk.Button(pixel_ops_frame, text="Canny", command=self.apply_canny).pack(side=tk.LEFT, padx=5)
         ttk.Button(pixel_ops_frame, text="Laplacian", command=self.apply_laplacian).pack(side=tk.LEFT, padx=5)
 
+        # Frequency domain filters, cutoffs in cycles per image
+        frequency_frame = ttk.LabelFrame(main_frame, text="Frequency Filter")
+        frequency_frame.pack(fill=tk.X, pady=5)
+
+        self.frequency_kind_var = tk.StringVar(frequency_frame)
+        ttk.OptionMenu(frequency_frame, self.frequency_kind_var, "Gaussian", "Ideal", "Butterworth", "Gaussian").grid(row=0, column=0)
+        self.frequency_band_var = tk.StringVar(frequency_frame)
+        ttk.OptionMenu(frequency_frame, self.frequency_band_var, "Low-pass", "Low-pass", "High-pass", "Band-pass").grid(row=0, column=1)
+
+        ttk.Label(frequency_frame, text="Cutoff:").grid(row=1, column=0)
+        self.frequency_cutoff = ttk.Scale(frequency_frame, from_=1, to=500, orient=tk.HORIZONTAL)
+        self.frequency_cutoff.set(30)
+        self.frequency_cutoff.grid(row=1, column=1, sticky='ew')
+        ttk.Label(frequency_frame, text="Band-pass High:").grid(row=2, column=0)
+        self.frequency_high_cutoff = ttk.Scale(frequency_frame, from_=1, to=500, orient=tk.HORIZONTAL)
+        self.frequency_high_cutoff.set(120)
+        self.frequency_high_cutoff.grid(row=2, column=1, sticky='ew')
+        ttk.Label(frequency_frame, text="Butterworth Order:").grid(row=3, column=0)
+        self.frequency_order = ttk.Scale(frequency_frame, from_=1, to=10, orient=tk.HORIZONTAL)
+        self.frequency_order.set(2)
+        self.frequency_order.grid(row=3, column=1, sticky='ew')
+
+        ttk.Button(frequency_frame, text="Apply Frequency Filter", command=self.apply_frequency_filter).grid(row=4, column=0, pady=5)
+        ttk.Button(frequency_frame, text="Show Spectrum", command=self.apply_spectrum).grid(row=4, column=1, pady=5)
+
     def create_image_restoration(self, parent):
         main_frame = ttk.Frame(parent)
         main_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -771,9 +1151,11 @@ class ImageEditorApp:
 
     def delete_first_image(self):
         if self.left_image:
+            self.jobs.cancel_all("result")
             self.left_image = None
             self.original_image = None
             self.result_image = None
+            self.proxy_session = None
             self.display_image(self.left_image, self.left_canvas, self.left_zoom, 'left')  # Clear the left canvas
         else:
             messagebox.showwarning("Warning", "No first image to delete!")
@@ -787,7 +1169,9 @@ class ImageEditorApp:
 
     def delete_result_image(self):
         if self.result_image:
+            self.jobs.cancel_all("result")
             self.result_image = None
+            self.proxy_session = None
             # Clear the canvas without trying to display a None image
             self.result_canvas.delete("all")
         else:
@@ -796,6 +1180,7 @@ class ImageEditorApp:
     def open_first_image(self):
         file_path = filedialog.askopenfilename()
         if file_path:
+            self.jobs.cancel_all("result")
             self.left_image = Image.open(file_path)
             self.original_image = self.left_image.copy()
             self.display_image(self.left_image, self.left_canvas, self.left_zoom, 'left')
@@ -810,8 +1195,15 @@ class ImageEditorApp:
     def save_image(self):
         file_path = filedialog.asksaveasfilename(defaultextension=".png")
         if file_path and self.result_image:
-            self.result_image.save(file_path)
-            messagebox.showinfo("Save", "Image saved successfully!")
+            if self.proxy_session is not None and self.proxy_session.operations:
+                # Proxy edits are rendered at full resolution in the background before saving
+                self.render_full_resolution(lambda image: self.write_image(image, file_path))
+            else:
+                self.write_image(self.result_image, file_path)
+
+    def write_image(self, image, file_path):
+        image.save(file_path)
+        messagebox.showinfo("Save", "Image saved successfully!")
 
     def update_left_zoom(self, value):
         self.left_zoom = float(value)
@@ -833,27 +1225,21 @@ class ImageEditorApp:
         if base_image is None:
             messagebox.showwarning("No Image", "Please upload an image first.")
             return
-        self.result_image = basicOperations.to_grayscale(base_image)
-        self.save_state_for_undo()
-        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+        self.run_operation(basicOperations.to_grayscale)
 
     def apply_negative(self):
         base_image = self.get_base_image()
         if base_image is None:
             messagebox.showwarning("No Image", "Please upload an image first.")
             return
-        self.save_state_for_undo()
-        self.result_image = basicOperations.to_negative(base_image)
-        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+        self.run_operation(basicOperations.to_negative)
 
     def apply_horizontal_flip(self):
         base_image = self.get_base_image()
         if base_image is None:
             messagebox.showwarning("No Image", "Please upload an image first.")
             return
-        self.save_state_for_undo()
-        self.result_image = basicOperations.horizontal_flip(base_image)
-        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+        self.apply_geometric_transform(("horizontal_flip", ()))
 
 
     def apply_vertical_flip(self):
@@ -861,18 +1247,14 @@ class ImageEditorApp:
         if base_image is None:
             messagebox.showwarning("No Image", "Please upload an image first.")
             return
-        self.save_state_for_undo()
-        self.result_image = basicOperations.vertical_flip(base_image)
-        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+        self.apply_geometric_transform(("vertical_flip", ()))
 
     def apply_diagonal_flip(self):
         base_image = self.get_base_image()
         if base_image is None:
             messagebox.showwarning("No Image", "Please upload an image first.")
             return
-        self.save_state_for_undo()
-        self.result_image = basicOperations.diagonal_flip(base_image)
-        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+        self.apply_geometric_transform(("diagonal_flip", ()))
 
 
     def apply_crop_method1(self):
@@ -884,12 +1266,8 @@ class ImageEditorApp:
                 width = int(self.crop_width.get())
                 height = int(self.crop_height.get())
 
-                # Lakukan cropping pada gambar dasar
-                self.result_image = basicOperations.crop_image(base_image, width, height)
-
-                # Tampilkan hasil gambar dan simpan state untuk undo
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
+                # Lakukan cropping pada gambar dasar, tampilkan hasil dan simpan state untuk undo
+                self.run_full_resolution_operation(basicOperations.crop_image, width, height)
             except ValueError:
                 messagebox.showerror("Error", "Invalid width or height value. Please enter valid integers.")
         else:
@@ -902,9 +1280,7 @@ class ImageEditorApp:
             try:
                 # Get Shape from dropdown
                 shape = self.shape_var.get()
-                self.result_image = basicOperations.crop_image_by_shape(base_image, shape)
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
+                self.run_operation(basicOperations.crop_image_by_shape, shape)
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred: {e}")
         else:
@@ -921,9 +1297,8 @@ class ImageEditorApp:
                 up = int(self.translate_up.get())
                 down = int(self.translate_down.get())
 
-                self.result_image = basicOperations.translate(base_image, right, left, up, down)
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
+                # Same offsets as basicOperations.translate
+                self.apply_geometric_transform(("translate", (left - right, up - down)))
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred: {e}")
         else:
@@ -938,11 +1313,7 @@ class ImageEditorApp:
                 scale_y = float(self.scale_y.get())
 
                 # Lakukan operasi scaling pada gambar dasar
-                self.result_image = basicOperations.scale(base_image, scale_x, scale_y)
-
-                # Tampilkan hasil gambar dan simpan state untuk undo
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
+                self.apply_geometric_transform(("scale", (scale_x, scale_y)))
             except ValueError:
                 messagebox.showerror("Error", "Invalid scaling values. Please enter valid numbers.")
             except Exception as e:
@@ -960,9 +1331,7 @@ class ImageEditorApp:
                 red = int(self.intensity_red.get())
                 green = int(self.intensity_green.get())
                 blue = int(self.intensity_blue.get())
-                self.result_image = basicOperations.adjust_rgb_intensity(base_image, red, green, blue)
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
+                self.run_operation(basicOperations.adjust_rgb_intensity, red, green, blue)
 
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred: {e}")
@@ -976,9 +1345,7 @@ class ImageEditorApp:
                 # get slider thick
                 thickness = int(self.border_thickness.get())
                 color = self.border_color.get() or "black"  # Default default black
-                self.result_image = basicOperations.add_border(base_image, thickness, color)
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
+                self.run_full_resolution_operation(basicOperations.add_border, thickness, color)
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred: {e}")
         else:
@@ -996,6 +1363,7 @@ class ImageEditorApp:
                     # Resize overlay to fit the base image size
                     self.overlay_image = self.overlay_image.resize(self.left_image.size, Image.Resampling.LANCZOS)
                     self.overlay_position = (0, 0)  # Reset overlay position
+                    self.overlay_compositor = None  # Rebuilt for the new overlay
                     self.update_overlay_preview()
                 else:
                     messagebox.showwarning("Warning", "No base image loaded!")
@@ -1022,8 +1390,16 @@ class ImageEditorApp:
             self.overlay_start_x = event.x
             self.overlay_start_y = event.y
             
-            # Refresh the overlay preview
-            self.update_overlay_preview()
+            # Refresh the overlay preview, at most once per frame interval
+            if not self.overlay_render_pending:
+                self.overlay_render_pending = True
+                interval = self.overlay_compositor.frame_interval if self.overlay_compositor else 16
+                self.root.after(interval, self.flush_overlay_preview)
+
+    def flush_overlay_preview(self):
+        """Render the overlay preview for the latest drag position."""
+        self.overlay_render_pending = False
+        self.update_overlay_preview()
 
     def update_overlay_preview(self):
         """Update the canvas to show the overlay in its current position."""
@@ -1031,13 +1407,20 @@ class ImageEditorApp:
 
         if base_image and self.overlay_image:
             try:
-                # Apply the overlay to the base image
-                overlay_preview = basicOperations.apply_overlay(
-                    base_image,
-                    self.overlay_image,
-                    self.overlay_transparency.get(),
-                    self.overlay_position
-                )
+                # Keep the compositor while the base image and the canvas size stay the same
+                transparency = self.overlay_transparency.get()
+                preview_size = (self.result_canvas.winfo_width(), self.result_canvas.winfo_height())
+                if min(preview_size) <= 1:
+                    # The canvas is not laid out yet, the preview is fitted to the canvas when it is displayed
+                    preview_size = base_image.size
+                compositor = self.overlay_compositor
+                if compositor is None or compositor.source is not base_image or compositor.preview_size != preview_size:
+                    self.overlay_compositor = OverlayCompositor(base_image, self.overlay_image, transparency, preview_size)
+                else:
+                    self.overlay_compositor.set_transparency(transparency)
+
+                # Only the old and new overlay areas are recomposited
+                overlay_preview = self.overlay_compositor.render(self.overlay_position)
 
                 # Display the overlay preview
                 self.display_image(overlay_preview, self.result_canvas, zoom=1.0, side='result')
@@ -1049,21 +1432,19 @@ class ImageEditorApp:
         base_image = self.get_base_image()  # Get the base image
 
         if base_image and self.overlay_image:
-            try:
-                # Apply the overlay to the base image
-                self.result_image = basicOperations.apply_overlay(
-                    base_image,
-                    self.overlay_image,
-                    self.overlay_transparency.get(),
-                    self.overlay_position
-                )
+            overlay_image = self.overlay_image
+            transparency = self.overlay_transparency.get()
+            position = self.overlay_position
+
+            def work(base_image):
+                return basicOperations.apply_overlay(base_image, overlay_image, transparency, position)
 
+            def on_success(result):
                 # Display the final image and save the state for undo
-                self.display_image(self.result_image, self.result_canvas, zoom=1.0, side='result')
-                self.save_state_for_undo()
+                self.show_result(result)
                 messagebox.showinfo("Success", "Overlay applied successfully!")
-            except Exception as e:
-                messagebox.showerror("Error", f"An error occurred while applying overlay: {e}")
+
+            self.submit_committed_job("overlay", work, on_success)
         else:
             messagebox.showwarning("Warning", "Please upload both base image and overlay image before applying!")
 
@@ -1074,12 +1455,7 @@ class ImageEditorApp:
         if base_image:
             try:
                 angle = int(self.rotation_angle.get())
-                self.result_image = basicOperations.rotate_image(base_image, angle)
-
-                # Tampilkan hasil gambar
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
-
+                self.apply_geometric_transform(("rotate", (angle,)))
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred: {e}")
         else:
@@ -1091,9 +1467,7 @@ class ImageEditorApp:
         if base_image:
             try:
                 brightness = int(self.brightness_value.get())
-                self.result_image = basicOperations.adjust_brightness(base_image, brightness)
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
+                self.run_operation(basicOperations.adjust_brightness, brightness)
 
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred: {e}")
@@ -1106,9 +1480,7 @@ class ImageEditorApp:
         if base_image:
             try:
                 contrast = int(self.contrast_value.get())
-                self.result_image = basicOperations.adjust_contrast(base_image, contrast)
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
+                self.run_operation(basicOperations.adjust_contrast, contrast)
 
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred: {e}")
@@ -1119,9 +1491,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
         if base_image:
             try:
-                self.result_image = basicOperations.apply_sepia(base_image)
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
+                self.run_operation(basicOperations.apply_sepia)
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred: {e}")
         else:
@@ -1131,9 +1501,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
         if base_image:
             try:
-                self.result_image = basicOperations.apply_cyanotype(base_image)
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
+                self.run_operation(basicOperations.apply_cyanotype)
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred: {e}")
         else:
@@ -1144,9 +1512,7 @@ class ImageEditorApp:
         if base_image:
             try:
                 custom_color = self.custom_color_effect.get()
-                self.result_image = basicOperations.apply_custom_color(base_image, custom_color)
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-                self.save_state_for_undo()
+                self.run_operation(basicOperations.apply_custom_color, custom_color)
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred: {e}")
         else:
@@ -1159,9 +1525,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image and self.right_image:
-            self.result_image = MathematicalOperations.pixelwise_addition(base_image, self.right_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_full_resolution_operation(MathematicalOperations.pixelwise_addition, self.right_image)
         else:
             messagebox.showwarning("Warning", "Both images must be loaded!")
 
@@ -1169,9 +1533,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image and self.right_image:
-            self.result_image = MathematicalOperations.pixelwise_subtraction(base_image, self.right_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_full_resolution_operation(MathematicalOperations.pixelwise_subtraction, self.right_image)
         else:
             messagebox.showwarning("Warning", "Both images must be loaded!")
 
@@ -1179,9 +1541,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image and self.right_image:
-            self.result_image = MathematicalOperations.pixelwise_multiplication(base_image, self.right_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_full_resolution_operation(MathematicalOperations.pixelwise_multiplication, self.right_image)
         else:
             messagebox.showwarning("Warning", "Both images must be loaded!")
 
@@ -1189,9 +1549,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image and self.right_image:
-            self.result_image = MathematicalOperations.pixelwise_division(base_image, self.right_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_full_resolution_operation(MathematicalOperations.pixelwise_division, self.right_image)
         else:
             messagebox.showwarning("Warning", "Both images must be loaded!")
 
@@ -1199,9 +1557,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image and self.right_image:
-            self.result_image = MathematicalOperations.bitwise_and(base_image, self.right_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_full_resolution_operation(MathematicalOperations.bitwise_and, self.right_image)
         else:
             messagebox.showwarning("Warning", "Both images must be loaded!")
 
@@ -1209,9 +1565,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image and self.right_image:
-            self.result_image = MathematicalOperations.bitwise_or(base_image, self.right_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_full_resolution_operation(MathematicalOperations.bitwise_or, self.right_image)
         else:
             messagebox.showwarning("Warning", "Both images must be loaded!")
 
@@ -1219,9 +1573,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image and self.right_image:
-            self.result_image = MathematicalOperations.bitwise_xor(base_image, self.right_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_full_resolution_operation(MathematicalOperations.bitwise_xor, self.right_image)
         else:
             messagebox.showwarning("Warning", "Both images must be loaded!")
 
@@ -1229,9 +1581,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image and self.right_image:
-            self.result_image = MathematicalOperations.bitwise_not(base_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(MathematicalOperations.bitwise_not)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1240,9 +1590,7 @@ class ImageEditorApp:
         if base_image is None:
             messagebox.showwarning("No Image", "Please upload an image first.")
             return
-        self.result_image = ImageEnhancement.histogram_equalization(base_image)
-        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-        self.save_state_for_undo()
+        self.run_operation(ImageEnhancement.histogram_equalization)
 
     def apply_contrast_stretching(self):
         base_image = self.get_base_image()
@@ -1259,9 +1607,7 @@ class ImageEditorApp:
         if low_out >= high_out:
             messagebox.showwarning("Value Error","Please input low out value less than high out.")
             raise ValueError("low_out must be less than high_out")
-        self.result_image = ImageEnhancement.contrast_stretching(base_image, low_in, high_in, low_out, high_out)
-        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-        self.save_state_for_undo()
+        self.run_operation(ImageEnhancement.contrast_stretching, low_in, high_in, low_out, high_out)
         
 
     def apply_gamma_correction(self):
@@ -1270,25 +1616,45 @@ class ImageEditorApp:
             messagebox.showwarning("No Image", "Please upload an image first.")
             return
         gamma = self.gamma_value.get()
-        self.result_image = ImageEnhancement.gamma_correction(base_image, gamma)
-        self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-        self.save_state_for_undo()
+        self.run_operation(ImageEnhancement.gamma_correction, gamma)
 
     def apply_fourier_transformation(self):
         if self.left_image:
-            self.result_image = TransformAndFiltering.fourier_transformation(self.left_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            left_image = self.left_image
+            self.submit_committed_job("fourier_transformation",
+                                      lambda _: TransformAndFiltering.fourier_transformation(left_image), self.show_result)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
             
+    def apply_frequency_filter(self):
+        base_image = self.get_base_image()
+
+        if base_image:
+            kind = self.frequency_kind_var.get().lower()
+            band = self.frequency_band_var.get().lower().replace("-", "")
+            cutoff = int(self.frequency_cutoff.get())
+            if band == "bandpass":
+                cutoff = (cutoff, int(self.frequency_high_cutoff.get()))
+                if cutoff[0] >= cutoff[1]:
+                    messagebox.showwarning("Warning", "The cutoff must be below the band-pass high cutoff.")
+                    return
+            self.run_operation(FrequencyFilter.apply_filter, kind, band, cutoff, int(self.frequency_order.get()))
+        else:
+            messagebox.showwarning("Warning", "No image loaded!")
+
+    def apply_spectrum(self):
+        base_image = self.get_base_image()
+
+        if base_image:
+            self.run_operation(FrequencyFilter.spectrum)
+        else:
+            messagebox.showwarning("Warning", "No image loaded!")
+
     def apply_mean_filter(self):
         base_image = self.get_base_image()
 
         if base_image:
-            self.result_image = TransformAndFiltering.mean_filter(base_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(TransformAndFiltering.mean_filter)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1296,9 +1662,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            self.result_image = TransformAndFiltering.med_filter(base_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(TransformAndFiltering.med_filter)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1307,9 +1671,7 @@ class ImageEditorApp:
 
         if base_image:
             kernel_size = int(self.kernel_size_slider.get())
-            self.result_image = TransformAndFiltering.gaussian_filter(base_image, kernel_size)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(TransformAndFiltering.gaussian_filter, kernel_size)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1317,9 +1679,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            self.result_image = TransformAndFiltering.sobel_filter(base_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(TransformAndFiltering.sobel_filter)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
     
@@ -1327,9 +1687,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            self.result_image = TransformAndFiltering.canny_filter(base_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(TransformAndFiltering.canny_filter)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
         
@@ -1338,9 +1696,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            self.result_image = TransformAndFiltering.laplacian_filter(base_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(TransformAndFiltering.laplacian_filter)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1349,9 +1705,7 @@ class ImageEditorApp:
 
         if base_image:
             kernel_size = int(self.kernel_size_slider.get())
-            self.result_image = ImageMatchingAndImageRestorations.wiener_filter(base_image, kernel_size)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(ImageMatchingAndImageRestorations.wiener_filter, kernel_size)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1359,9 +1713,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image and self.right_image:
-            self.result_image = ImageMatchingAndImageRestorations.sift_detector(base_image, self.right_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_full_resolution_operation(ImageMatchingAndImageRestorations.sift_detector, self.right_image)
         else:
             messagebox.showwarning("Warning, Both images must be loaded!")
 
@@ -1369,9 +1721,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image and self.right_image:
-            self.result_image = ImageMatchingAndImageRestorations.orb_detector(base_image, self.right_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_full_resolution_operation(ImageMatchingAndImageRestorations.orb_detector, self.right_image)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1382,9 +1732,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            self.result_image = BinaryOperation.dilation(base_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(BinaryOperation.dilation)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1392,9 +1740,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            self.result_image = BinaryOperation.erosion(base_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(BinaryOperation.erosion)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1402,9 +1748,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            self.result_image = BinaryOperation.opening(base_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(BinaryOperation.opening)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1412,9 +1756,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            self.result_image = BinaryOperation.closing(base_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(BinaryOperation.closing)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1422,9 +1764,7 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            self.result_image = BinaryOperation.boundary_extraction(base_image)
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(BinaryOperation.boundary_extraction)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
@@ -1432,21 +1772,23 @@ class ImageEditorApp:
         base_image = self.get_base_image()
 
         if base_image:
-            # Convert to grayscale and binary
-            gray_image = base_image.convert('L')  # Convert to grayscale
-            binary_image = np.array(gray_image)  # Convert to numpy array
-            _, binary_image = cv2.threshold(binary_image, 127, 255, cv2.THRESH_BINARY)
-            
-            # Perform skeletonization
-            skeleton_image = BinaryOperation.skeletonization(binary_image)
-            
-            # Display result
-            self.result_image = skeleton_image
-            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
-            self.save_state_for_undo()
+            self.run_operation(self.skeletonize_image)
         else:
             messagebox.showwarning("Warning", "No image loaded!")
 
+    @staticmethod
+    def skeletonize_image(image):
+        """
+        Threshold the image to binary and skeletonize it.
+        """
+        # Convert to grayscale and binary
+        gray_image = image.convert('L')  # Convert to grayscale
+        binary_image = np.array(gray_image)  # Convert to numpy array
+        _, binary_image = cv2.threshold(binary_image, 127, 255, cv2.THRESH_BINARY)
+
+        # Perform skeletonization
+        return BinaryOperation.skeletonization(binary_image)
+
     def display_image(self, image, canvas, zoom=1.0, side='left'):
         canvas.delete("all")
         
@@ -1456,11 +1798,15 @@ class ImageEditorApp:
         width = int(image.width * zoom)
         height = int(image.height * zoom)
         
-        scaled_image = image.copy()
         if width > canvas_width or height > canvas_height:
-            scaled_image.thumbnail((canvas_width, canvas_height), Image.LANCZOS)
-        else:
-            scaled_image = scaled_image.resize((width, height), Image.LANCZOS)
+            # Fit inside the canvas, keeping the aspect ratio
+            fit = min(canvas_width / image.width, canvas_height / image.height)
+            width = max(1, round(image.width * fit))
+            height = max(1, round(image.height * fit))
+
+        # Visible part of the image, the whole image while it is fitted to the canvas
+        viewport = (0, 0, image.width, image.height)
+        scaled_image = self.get_preview_pyramid(image, side).render((max(width, 1), max(height, 1)), viewport)
         
         if side == 'left':
             self.left_tk_image = ImageTk.PhotoImage(scaled_image)
@@ -1478,35 +1824,57 @@ class ImageEditorApp:
             y = (canvas_height - scaled_image.height) // 2
             canvas.create_image(x, y, anchor=tk.NW, image=self.result_tk_image)
 
-    def save_state_for_undo(self):
+    def get_preview_pyramid(self, image, side):
+        """
+        Return the display pyramid of the image shown on a side, building it the first time the image is shown.
+        """
+        pyramid = self.preview_pyramids.get(side)
+        if pyramid is None or pyramid.source is not image:
+            pyramid = PreviewPyramid(image)
+            self.preview_pyramids[side] = pyramid
+        return pyramid
+
+    def save_state_for_undo(self, recipe=None):
+        """
+        Save the result image in the undo history, clearing the redo states.
+        :param recipe: Optional recipe that rebuilds the state from an earlier one, see make_recipe
+        """
         if self.result_image:
-            self.undo_stack.append(self.result_image.copy())
-            self.redo_stack.clear()  # Clear redo stack on new operation
+            self.history.push(self.result_image, recipe)
 
     def undo_operation(self):
-        if self.undo_stack:
-            self.redo_stack.append(self.undo_stack.pop())
-            if self.undo_stack:
-                self.result_image = self.undo_stack[-1]
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+        self.jobs.cancel_all("result")
+        if self.history.can_undo:
+            # Undoing past the first proxy edit ends the proxy session
+            if self.proxy_session is not None and self.proxy_session.undo() is None:
+                self.proxy_session = None
+
+            previous = self.history.undo()
+            if self.proxy_session is not None and self.proxy_session.operations:
+                self.result_image = self.proxy_session.proxy
+            elif previous is not None:
+                self.result_image = previous
             else:
                 self.result_image = self.original_image
-                self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
+            self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
         else:
             messagebox.showwarning("Warning", "No operation to undo!")
 
     def redo_operation(self):
-        if self.redo_stack:
-            self.result_image = self.redo_stack.pop()
-            self.undo_stack.append(self.result_image.copy())
+        self.jobs.cancel_all("result")
+        if self.history.can_redo:
+            self.result_image = self.history.redo()
+            if self.proxy_session is not None and self.proxy_session.redo() is not None:
+                self.result_image = self.proxy_session.proxy
             self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
         else:
             messagebox.showwarning("Warning", "No operation to redo!")
 
     def reset_image(self):
+        self.jobs.cancel_all("result")
+        self.proxy_session = None
         self.result_image = self.original_image.copy() if self.original_image else None
-        self.undo_stack.clear()
-        self.redo_stack.clear()
+        self.history.clear()
         self.display_image(self.result_image, self.result_canvas, self.result_zoom, 'result')
         self.update_file_size_display() 
 
@@ -0,0 +1,194 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import scipy.fft
+from PIL import Image
+
+
+class FrequencyFilter:
+    """
+    Filtering in the frequency domain with real FFTs. rfft2 keeps only the non-negative horizontal
+    frequencies of a real image, half the spectrum of fft2, and float32 input is transformed in single
+    precision. scipy.fft splits the transforms over worker threads.
+    Images are padded by mirroring to a size scipy.fft transforms quickly, so the periodic wrap-around of
+    the FFT does not bleed one image border into the other. The padded size of every image shape and the
+    transfer functions of recent filters are cached, a filter costs O(N log N) whatever its reach.
+    Cutoffs are in cycles per image along its longer side, so the same settings give the same look on a
+    proxy and on the full resolution image.
+    """
+
+    KINDS = ("ideal", "butterworth", "gaussian")
+    BANDS = ("lowpass", "highpass", "bandpass")
+    # Mirrored border added on every side, as a fraction of the side
+    PADDING = 0.125
+    # Threads per transform, -1 for the CPU count
+    WORKERS = -1
+
+    PADDED_SHAPES = {}
+    TRANSFER_CACHE_SIZE = 8
+    transfer_cache = OrderedDict()
+    transfer_lock = threading.Lock()
+
+    @staticmethod
+    def apply_filter(image, kind="gaussian", band="lowpass", cutoff=30, order=2, dtype=np.float32):
+        """
+        Low-, high- or band-pass filter an image.
+        :param image: PIL.Image object
+        :param kind: "ideal", "butterworth" or "gaussian"
+        :param band: "lowpass", "highpass" or "bandpass"
+        :param cutoff: Cutoff frequency in cycles per image, (low, high) for "bandpass"
+        :param order: Order of the Butterworth filter
+        :param dtype: np.float32 or np.float64 precision of the transforms
+        :return: PIL.Image object in the mode of image. High- and band-pass results have no mean brightness left and are
+                 stretched to 0..255 like the edge filters
+        """
+        array, alpha = FrequencyFilter._channels(image)
+        scale = max(array.shape[:2])
+        # Only Butterworth filters depend on the order, the others share one cached transfer function
+        key = (kind, band, cutoff, order if kind == "butterworth" else None, scale)
+        filtered = FrequencyFilter.filter_array(
+            array, lambda radius: FrequencyFilter.transfer_function(radius * scale, kind, band, cutoff, order),
+            key, dtype,
+        )
+        if band == "lowpass":
+            result = np.clip(np.rint(filtered), 0, 255).astype(np.uint8)
+        else:
+            low, high = filtered.min(), filtered.max()
+            result = ((filtered - low) * (255 / max(high - low, 1e-6))).astype(np.uint8)
+        return FrequencyFilter._image(result, alpha, image.mode)
+
+    @staticmethod
+    def gaussian_blur(image, sigma, dtype=np.float32):
+        """
+        Gaussian blur with a standard deviation of sigma pixels, at the same cost for any sigma.
+        """
+        array, alpha = FrequencyFilter._channels(image)
+        # The Fourier transform of a Gaussian of sigma pixels is a Gaussian of 1 / (2 pi sigma) cycles per pixel
+        filtered = FrequencyFilter.filter_array(
+            array, lambda radius: np.exp(-2 * (np.pi * sigma * radius) ** 2), ("blur", sigma), dtype,
+        )
+        return FrequencyFilter._image(np.clip(np.rint(filtered), 0, 255).astype(np.uint8), alpha, image.mode)
+
+    @staticmethod
+    def spectrum(image):
+        """
+        Centered log magnitude spectrum of the grayscale image, for display.
+        :return: PIL.Image object of mode "L", the zero frequency in the middle
+        """
+        gray = np.asarray(image.convert("L"), dtype=np.float32)
+        height, width = gray.shape
+        magnitude = np.log1p(np.abs(scipy.fft.rfft2(gray, workers=FrequencyFilter.WORKERS)))
+        # A real image has F(-u, -v) = conj(F(u, v)), the missing half is the mirror of the computed one
+        full = np.empty((height, width), dtype=np.float32)
+        half = magnitude.shape[1]
+        full[:, :half] = magnitude
+        full[:, half:] = magnitude[(-np.arange(height)) % height][:, width - np.arange(half, width)]
+        full = scipy.fft.fftshift(full)
+        return Image.fromarray((full * (255 / max(full.max(), 1e-6))).astype(np.uint8))
+
+    @staticmethod
+    def filter_array(array, transfer, key, dtype=np.float32):
+        """
+        Multiply the spectrum of a (height, width) or (height, width, channels) array by a transfer function.
+        :param transfer: Callable mapping the radial frequency in cycles per pixel to the gain, over the
+                         rfft2 grid of the padded image
+        :param key: Hashable description of transfer, used to cache the evaluated function
+        :return: Filtered array of dtype
+        """
+        height, width = array.shape[:2]
+        padded_height, padded_width = FrequencyFilter.padded_shape((height, width))
+        top, left = (padded_height - height) // 2, (padded_width - width) // 2
+        padding = [(top, padded_height - height - top), (left, padded_width - width - left)]
+        padded = np.pad(array.astype(dtype, copy=False), padding + [(0, 0)] * (array.ndim - 2), mode="symmetric")
+
+        gain = FrequencyFilter.cached_transfer((padded_height, padded_width), transfer, key, dtype)
+        if array.ndim == 3:
+            gain = gain[:, :, None]
+        workers = FrequencyFilter.WORKERS
+        spectrum = scipy.fft.rfft2(padded, axes=(0, 1), workers=workers, overwrite_x=True)
+        spectrum *= gain
+        filtered = scipy.fft.irfft2(spectrum, s=(padded_height, padded_width), axes=(0, 1), workers=workers, overwrite_x=True)
+        return filtered[top:top + height, left:left + width]
+
+    @staticmethod
+    def padded_shape(shape):
+        """
+        Size the FFT runs at for an image shape: the mirrored border added and rounded up to a fast length.
+        """
+        if shape not in FrequencyFilter.PADDED_SHAPES:
+            FrequencyFilter.PADDED_SHAPES[shape] = tuple(
+                scipy.fft.next_fast_len(side + 2 * int(np.ceil(side * FrequencyFilter.PADDING)), real=True)
+                for side in shape
+            )
+        return FrequencyFilter.PADDED_SHAPES[shape]
+
+    @staticmethod
+    def cached_transfer(shape, transfer, key, dtype=np.float32):
+        """
+        Transfer function evaluated on the rfft2 grid of a padded shape, cached and read-only.
+        """
+        cache_key = (shape, np.dtype(dtype).name, key)
+        with FrequencyFilter.transfer_lock:
+            if cache_key in FrequencyFilter.transfer_cache:
+                FrequencyFilter.transfer_cache.move_to_end(cache_key)
+                return FrequencyFilter.transfer_cache[cache_key]
+
+        frequency_y = scipy.fft.fftfreq(shape[0]).astype(dtype)
+        frequency_x = scipy.fft.rfftfreq(shape[1]).astype(dtype)
+        radius = np.hypot(frequency_y[:, None], frequency_x[None, :])
+        gain = np.asarray(transfer(radius), dtype=dtype)
+        gain.setflags(write=False)
+
+        with FrequencyFilter.transfer_lock:
+            FrequencyFilter.transfer_cache[cache_key] = gain
+            while len(FrequencyFilter.transfer_cache) > FrequencyFilter.TRANSFER_CACHE_SIZE:
+                FrequencyFilter.transfer_cache.popitem(last=False)
+        return gain
+
+    @staticmethod
+    def transfer_function(distance, kind="gaussian", band="lowpass", cutoff=30, order=2):
+        """
+        Gain of a filter at the given distances from the zero frequency.
+        :param distance: Array of frequencies, in the unit of cutoff
+        """
+        if kind not in FrequencyFilter.KINDS:
+            raise ValueError(f"Unknown frequency filter: {kind}")
+        if band not in FrequencyFilter.BANDS:
+            raise ValueError(f"Unknown frequency band: {band}")
+        if band == "bandpass":
+            low, high = cutoff
+            if low >= high:
+                raise ValueError("The low cutoff of a band-pass filter must be below the high cutoff.")
+            return FrequencyFilter._lowpass(distance, kind, high, order) * (1 - FrequencyFilter._lowpass(distance, kind, low, order))
+        lowpass = FrequencyFilter._lowpass(distance, kind, cutoff, order)
+        return lowpass if band == "lowpass" else 1 - lowpass
+
+    @staticmethod
+    def _lowpass(distance, kind, cutoff, order):
+        if cutoff <= 0:
+            return np.zeros_like(distance)
+        if kind == "ideal":
+            return (distance <= cutoff).astype(distance.dtype)
+        if kind == "butterworth":
+            return 1 / (1 + (distance / cutoff) ** (2 * order))
+        return np.exp(-np.square(distance) / (2 * cutoff ** 2))
+
+    @staticmethod
+    def _channels(image):
+        # Color channels to filter and the alpha band kept as it is
+        if image.mode not in ("L", "RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        array = np.asarray(image)
+        if image.mode == "RGBA":
+            return array[:, :, :3], array[:, :, 3]
+        return array, None
+
+    @staticmethod
+    def _image(array, alpha, mode):
+        # Back to the mode of the input, see _channels
+        image = Image.fromarray(array if alpha is None else np.dstack([array, alpha]))
+        if image.mode == mode:
+            return image
+        if mode == "P":
+            return image.convert("RGB").convert("P", palette=Image.Palette.ADAPTIVE)
+        return image.convert(mode)
@@ -0,0 +1,294 @@
+import os
+import tempfile
+import zlib
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+
+class HistoryEntry:
+    """
+    One state of the undo history. Pixels are stored as a compressed keyframe or as the compressed
+    tiles that changed since the previous state, in memory or in the spill file.
+    recipe is (operation, args, kwargs, parent) when the state can be rebuilt by running
+    operation(state(parent), *args, **kwargs), parent None meaning the previous state.
+    """
+
+    def __init__(self, mode, size, palette, keyframe, tiles, data, recipe=None):
+        self.mode = mode
+        self.size = size
+        self.palette = palette
+        self.keyframe = keyframe
+        self.tiles = tiles
+        self.data = data
+        self.spill = None
+        self.recipe = recipe
+
+    @property
+    def nbytes(self):
+        """
+        Bytes of pixel data held in memory.
+        """
+        size = len(self.data) if self.data is not None else 0
+        return size + (self.tiles.nbytes if self.tiles is not None else 0)
+
+
+class HistoryStore:
+    """
+    Undo/redo history that stores states compressed instead of as full image copies.
+    A state is saved as a zlib keyframe, or as the tiles that differ from the previous state when only
+    part of the image changed. When the compressed history outgrows the memory budget the oldest states
+    are spilled to a memory-mapped file on disk. States are decoded lazily when undo or redo reaches them.
+    """
+
+    # Modes whose pixels map one to one onto a numpy array, other modes are always stored as keyframes
+    DELTA_MODES = ("L", "LA", "P", "RGB", "RGBA", "CMYK", "YCbCr", "I", "F")
+
+    def __init__(self, max_memory=512 * 1024 * 1024, spill=True, spill_dir=None, tile_size=64,
+                 keyframe_interval=16, keyframe_ratio=0.5, cached_states=3, compression_level=1):
+        """
+        :param max_memory: Budget in bytes for compressed states kept in memory
+        :param spill: Move states over the budget to a file on disk. Without spilling, states that have a
+                      recipe are dropped instead and rebuilt by running their operation again
+        :param spill_dir: Directory of the spill file, defaults to the system temp directory
+        :param tile_size: Side of the tiles compared between consecutive states
+        :param keyframe_interval: Maximum number of deltas between two keyframes
+        :param keyframe_ratio: A state is stored as a keyframe when more than this fraction of tiles changed
+        :param cached_states: Number of decoded states kept around for fast undo and redo
+        :param compression_level: zlib level for the stored pixels
+        """
+        self.max_memory = max_memory
+        self.spill_enabled = spill
+        self.spill_dir = spill_dir
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.keyframe_ratio = keyframe_ratio
+        self.cached_states = cached_states
+        self.compression_level = compression_level
+
+        self.entries = []
+        self.position = 0
+        self.memory = 0
+        self.cache = OrderedDict()
+        self.spill_path = None
+        self.spill_size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def can_undo(self):
+        return self.position > 0
+
+    @property
+    def can_redo(self):
+        return self.position < len(self.entries)
+
+    @property
+    def current(self):
+        """
+        The state at the current position, or None before the first saved state.
+        """
+        return self.state(self.position - 1) if self.position > 0 else None
+
+    def push(self, image, recipe=None):
+        """
+        Save a new state after the current position, discarding the states that could be redone.
+        :param image: PIL.Image object of the new state. It is kept as decoded state and must not be modified afterwards
+        :param recipe: Optional (operation, args, kwargs, parent) that recreates the state from state(parent),
+                       only for deterministic operations
+        """
+        self.truncate(self.position)
+        index = len(self.entries)
+        previous = self.state(index - 1) if index > 0 else None
+        self.entries.append(self._encode(image, previous, index, recipe))
+        self.memory += self.entries[-1].nbytes
+        self.position = len(self.entries)
+        self._remember(index, image)
+        self._enforce_budget()
+
+    def undo(self):
+        """
+        Step back one state.
+        :return: The state now current, or None when the history is back before the first saved state
+        """
+        if not self.can_undo:
+            return None
+        self.position -= 1
+        return self.current
+
+    def redo(self):
+        """
+        Step forward one state.
+        :return: The state now current, or None when there is nothing to redo
+        """
+        if not self.can_redo:
+            return None
+        self.position += 1
+        return self.current
+
+    def truncate(self, length):
+        """
+        Forget every state from index length on.
+        """
+        for entry in self.entries[length:]:
+            self.memory -= entry.nbytes
+        del self.entries[length:]
+        self.position = min(self.position, len(self.entries))
+        for index in [index for index in self.cache if index >= length]:
+            del self.cache[index]
+
+    def clear(self):
+        """
+        Forget the whole history and remove the spill file.
+        """
+        self.entries = []
+        self.position = 0
+        self.memory = 0
+        self.cache.clear()
+        if self.spill_path is not None:
+            os.remove(self.spill_path)
+            self.spill_path = None
+            self.spill_size = 0
+
+    def state(self, index):
+        """
+        Decode the state at an index, walking back to the nearest decoded state or keyframe.
+        :return: PIL.Image object
+        """
+        # Collect the entries to rebuild, newest first
+        chain = []
+        while index not in self.cache:
+            entry = self.entries[index]
+            chain.append(index)
+            if entry.data is None and entry.spill is None:
+                index = index - 1 if entry.recipe[3] is None else entry.recipe[3]
+            elif entry.keyframe:
+                break
+            else:
+                index -= 1
+
+        image = self.cache[index] if index in self.cache else None
+        if index in self.cache:
+            self.cache.move_to_end(index)
+        for index in reversed(chain):
+            image = self._decode(index, image)
+            self._remember(index, image)
+        return image
+
+    def replay(self, image, start=0, stop=None):
+        """
+        Run the recipes of a range of states on another image, e.g. the full resolution version of the state
+        before start. Every state in the range needs a recipe whose parent is inside the range or start - 1.
+        :param image: PIL.Image object standing for state start - 1
+        :return: PIL.Image object standing for state stop - 1
+        """
+        stop = len(self.entries) if stop is None else stop
+        states = {start - 1: image}
+        for index in range(start, stop):
+            recipe = self.entries[index].recipe
+            if recipe is None:
+                raise ValueError(f"State {index} has no recipe to replay")
+            operation, args, kwargs, parent = recipe
+            states[index] = operation(states[index - 1 if parent is None else parent], *args, **kwargs)
+        return states[stop - 1]
+
+    def _encode(self, image, previous, index, recipe):
+        palette = image.getpalette() if image.mode == "P" else None
+        since_keyframe = 0
+        for entry in reversed(self.entries):
+            if entry.keyframe:
+                break
+            since_keyframe += 1
+
+        if (
+            previous is not None
+            and image.mode in self.DELTA_MODES
+            and previous.mode == image.mode
+            and previous.size == image.size
+            and since_keyframe + 1 < self.keyframe_interval
+        ):
+            current = np.asarray(image)
+            tiles = self._changed_tiles(np.asarray(previous), current)
+            grid = -(-image.height // self.tile_size) * -(-image.width // self.tile_size)
+            if len(tiles) <= grid * self.keyframe_ratio:
+                data = b"".join(self._tile(current, y, x).tobytes() for y, x in tiles)
+                return HistoryEntry(image.mode, image.size, palette, False, tiles,
+                                    zlib.compress(data, self.compression_level), recipe)
+
+        data = zlib.compress(image.tobytes(), self.compression_level)
+        return HistoryEntry(image.mode, image.size, palette, True, None, data, recipe)
+
+    def _decode(self, index, previous):
+        entry = self.entries[index]
+        if entry.data is None and entry.spill is None:
+            # Dropped without spilling, rebuild by running the operation again
+            # previous is the state of the recipe's parent, see state()
+            operation, args, kwargs, _ = entry.recipe
+            return operation(previous, *args, **kwargs)
+
+        data = zlib.decompress(self._payload(entry))
+        if entry.keyframe:
+            image = Image.frombytes(entry.mode, entry.size, data)
+        else:
+            array = np.array(previous)
+            offset = 0
+            for y, x in entry.tiles:
+                tile = self._tile(array, y, x)
+                tile[...] = np.frombuffer(data, dtype=array.dtype, count=tile.size, offset=offset).reshape(tile.shape)
+                offset += tile.nbytes
+            image = Image.frombytes(entry.mode, entry.size, array.tobytes())
+        if entry.palette is not None:
+            image.putpalette(entry.palette)
+        return image
+
+    def _changed_tiles(self, previous, current):
+        changed = previous != current
+        if changed.ndim == 3:
+            changed = changed.any(axis=2)
+        height, width = changed.shape
+        size = self.tile_size
+        padded = np.zeros((-(-height // size) * size, -(-width // size) * size), dtype=bool)
+        padded[:height, :width] = changed
+        grid = padded.reshape(padded.shape[0] // size, size, padded.shape[1] // size, size).any(axis=(1, 3))
+        return np.argwhere(grid).astype(np.uint32)
+
+    def _tile(self, array, y, x):
+        size = self.tile_size
+        return array[y * size:(y + 1) * size, x * size:(x + 1) * size]
+
+    def _payload(self, entry):
+        if entry.data is not None:
+            return entry.data
+        offset, length = entry.spill
+        return np.memmap(self.spill_path, dtype=np.uint8, mode="r", offset=offset, shape=(length,)).tobytes()
+
+    def _remember(self, index, image):
+        self.cache[index] = image
+        self.cache.move_to_end(index)
+        while len(self.cache) > self.cached_states:
+            self.cache.popitem(last=False)
+
+    def _enforce_budget(self):
+        # The newest state stays in memory, it is the one diffed against on the next push
+        for index, entry in enumerate(self.entries[:-1]):
+            if self.memory <= self.max_memory:
+                return
+            if entry.data is None:
+                continue
+            if self.spill_enabled:
+                entry.spill = self._write_spill(entry.data)
+            elif entry.recipe is None or index == 0:
+                continue
+            self.memory -= len(entry.data)
+            entry.data = None
+
+    def _write_spill(self, data):
+        if self.spill_path is None:
+            handle, self.spill_path = tempfile.mkstemp(prefix="papi-history-", suffix=".bin", dir=self.spill_dir)
+            os.close(handle)
+        with open(self.spill_path, "ab") as spill_file:
+            spill_file.write(data)
+        offset = self.spill_size
+        self.spill_size += len(data)
+        return (offset, len(data))
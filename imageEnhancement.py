@@ -1,5 +1,6 @@
 from PIL import Image, ImageOps, ImageEnhance
 import numpy as np
+from pointOperation import PointOperationPipeline
 
 class ImageEnhancement:
     @staticmethod
@@ -12,14 +13,9 @@ class ImageEnhancement:
 
     @staticmethod
     def contrast_stretching(image, low_in=0, high_in=255, low_out=0, high_out=255):
-        img_array = np.array(image, dtype=np.float32)
-
-        # Apply contrast stretching formula
-        img_array = np.clip((img_array - low_in) * (high_out - low_out) / (high_in - low_in) + low_out, 0, 255)
-        return Image.fromarray(img_array.astype('uint8'))
+        # Apply contrast stretching formula as a lookup table
+        return PointOperationPipeline().contrast_stretching(low_in, high_in, low_out, high_out).apply(image)
 
     @staticmethod
     def gamma_correction(image, gamma=1.0):
-        img_array = np.array(image) / 255.0
-        img_array = np.clip(img_array ** gamma, 0, 1) * 255
-        return Image.fromarray(img_array.astype('uint8'))
\ No newline at end of file
+        return PointOperationPipeline().gamma(gamma).apply(image)
\ No newline at end of file
@@ -0,0 +1,171 @@
+import os
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """
+    A unit of work for the JobScheduler.
+    prepare runs on the Tk main thread when the job starts and returns the callable that runs on a worker.
+    on_success and on_error run on the Tk main thread with the result or the exception. An exception raised
+    by on_success is passed to on_error.
+    """
+
+    def __init__(self, name, prepare, on_success, on_error=None, key=None):
+        self.name = name
+        self.prepare = prepare
+        self.on_success = on_success
+        self.on_error = on_error
+        self.key = key
+        self.future = None
+        self.cancelled = False
+        self.started_at = None
+
+
+class JobScheduler:
+    """
+    Runs jobs on a thread pool and hands their results back on the Tk main thread through root.after.
+    Jobs in the same lane run one after another in submission order. Submitting a job with the same key
+    as a queued or running job in its lane cancels the older one, and a cancelled job's result is dropped.
+    """
+
+    def __init__(self, root, max_workers=None, poll_interval=30, on_status=None):
+        """
+        :param root: Tk root used to schedule callbacks on the main thread
+        :param max_workers: Number of worker threads, defaults to the CPU count
+        :param poll_interval: Milliseconds between checks for finished jobs
+        :param on_status: Optional callable receiving a short status text whenever it changes
+        """
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1)
+        self.poll_interval = poll_interval
+        self.on_status = on_status
+        self.lanes = {}
+        self.polling = False
+
+    def submit(self, name, prepare, on_success, on_error=None, key=None, lane="default"):
+        """
+        Queue a job.
+        :param name: Name shown in status updates
+        :param prepare: Callable run on the main thread when the job starts, returning the worker callable
+        :param on_success: Callable receiving the result on the main thread
+        :param on_error: Callable receiving the exception on the main thread
+        :param key: Jobs with the same key in a lane replace each other, None never replaces
+        :param lane: Name of the lane, jobs in a lane run one at a time
+        :return: The Job object
+        """
+        active, queue = self.lanes.setdefault(lane, [None, deque()])
+        if key is not None:
+            for job in [job for job in queue if job.key == key]:
+                queue.remove(job)
+            if active is not None and active.key == key:
+                self._cancel(active)
+                self.lanes[lane][0] = None
+
+        job = Job(name, prepare, on_success, on_error, key)
+        queue.append(job)
+        self._start_next(lane)
+        return job
+
+    def cancel_all(self, lane="default"):
+        """
+        Cancel the running and queued jobs of a lane, their results will never be delivered.
+        """
+        if lane not in self.lanes:
+            return
+        active, queue = self.lanes[lane]
+        if active is not None:
+            self._cancel(active)
+        queue.clear()
+        self.lanes[lane][0] = None
+        self._report()
+
+    def busy(self, lane="default"):
+        """
+        True while a job of the lane is running or queued.
+        """
+        active, queue = self.lanes.get(lane, (None, ()))
+        return active is not None or bool(queue)
+
+    def shutdown(self):
+        """
+        Cancel everything and stop accepting work.
+        """
+        for lane in list(self.lanes):
+            self.cancel_all(lane)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _start_next(self, lane):
+        active, queue = self.lanes[lane]
+        while active is None and queue:
+            job = queue.popleft()
+            try:
+                work = job.prepare()
+            except Exception as e:
+                self._deliver_error(job, e)
+                continue
+            job.started_at = time.monotonic()
+            job.future = self.executor.submit(work)
+            self.lanes[lane][0] = active = job
+        self._report()
+        if active is not None and not self.polling:
+            self.polling = True
+            self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        try:
+            for lane, (active, _) in list(self.lanes.items()):
+                if active is None or not active.future.done():
+                    continue
+                self.lanes[lane][0] = None
+                if not active.cancelled:
+                    try:
+                        result = active.future.result()
+                    except Exception as e:
+                        self._deliver_error(active, e)
+                    else:
+                        self._deliver(active, result)
+                self._start_next(lane)
+            self._report()
+        finally:
+            # Keep polling whatever a callback did, or every later job would never be delivered
+            if any(active is not None for active, _ in self.lanes.values()):
+                self.root.after(self.poll_interval, self._poll)
+            else:
+                self.polling = False
+
+    def _cancel(self, job):
+        job.cancelled = True
+        if job.future is not None:
+            job.future.cancel()
+
+    def _deliver(self, job, result):
+        # A failing on_success is reported like a failing job
+        try:
+            job.on_success(result)
+        except Exception as e:
+            self._deliver_error(job, e)
+
+    def _deliver_error(self, job, error):
+        if job.on_error is None:
+            return
+        try:
+            job.on_error(error)
+        except Exception:
+            traceback.print_exc()
+
+    def _report(self):
+        if self.on_status is None:
+            return
+        running = [active for active, _ in self.lanes.values() if active is not None]
+        if not running:
+            self.on_status("Ready")
+            return
+        queued = sum(len(queue) for _, queue in self.lanes.values())
+        job = running[0]
+        text = f"Running {job.name}... {time.monotonic() - job.started_at:.1f}s"
+        if queued:
+            text += f" ({queued} queued)"
+        self.on_status(text)
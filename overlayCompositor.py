@@ -0,0 +1,112 @@
+import numpy as np
+from PIL import Image
+
+
+class OverlayCompositor:
+    """
+    Keeps a preview-resolution copy of the base image and a premultiplied overlay resident,
+    so moving the overlay only recomposites the area it left and the area it moved into.
+    Positions are given in full-resolution base image coordinates, like basicOperations.apply_overlay.
+    """
+
+    def __init__(self, base_image, overlay_image, transparency, preview_size, max_fps=60):
+        """
+        :param base_image: PIL Image object for the base image
+        :param overlay_image: PIL Image object for the overlay image
+        :param transparency: Float value between 0.1 and 1.0 for transparency
+        :param preview_size: Tuple (width, height) the preview has to fit in
+        :param max_fps: Maximum number of preview frames per second while dragging
+        """
+        self.source = base_image
+        self.preview_size = tuple(preview_size)
+        self.max_fps = max_fps
+
+        # Fit the base image into the preview area, never upscaling
+        preview_width, preview_height = max(preview_size[0], 1), max(preview_size[1], 1)
+        self.scale = min(preview_width / base_image.width, preview_height / base_image.height, 1.0)
+        size = (max(1, round(base_image.width * self.scale)), max(1, round(base_image.height * self.scale)))
+
+        self.base = np.array(base_image.convert("RGB").resize(size, Image.LANCZOS))
+        self.frame = self.base.copy()
+        self.rect = None
+        self.dirty = None
+
+        self.overlay_image = overlay_image
+        self.transparency = None
+        self.set_transparency(transparency)
+
+    @property
+    def frame_interval(self):
+        """
+        Minimum delay between two preview frames, in milliseconds.
+        """
+        return max(1, 1000 // self.max_fps)
+
+    def set_transparency(self, transparency):
+        """
+        Rebuild the premultiplied overlay for a new transparency and redraw it in place.
+        :param transparency: Float value between 0.1 and 1.0 for transparency
+        """
+        if transparency == self.transparency:
+            return
+        self.transparency = transparency
+
+        overlay_size = (
+            max(1, round(self.overlay_image.width * self.scale)),
+            max(1, round(self.overlay_image.height * self.scale)),
+        )
+        overlay = np.array(self.overlay_image.convert("RGB").resize(overlay_size, Image.LANCZOS), dtype=np.uint16)
+
+        # Same constant alpha as apply_overlay's putalpha, stored premultiplied
+        alpha = int(255 * transparency)
+        self.overlay = (overlay * alpha + 127) // 255
+        self.inverse_alpha = 255 - alpha
+
+        if self.rect is not None:
+            self._composite(self.rect, self.rect)
+
+    def render(self, position):
+        """
+        Move the overlay to a new position and return the updated preview.
+        :param position: Tuple (x, y) for the top-left position of the overlay in base image coordinates
+        :return: PIL Image object of the preview
+        """
+        x = round(position[0] * self.scale)
+        y = round(position[1] * self.scale)
+        height, width = self.overlay.shape[:2]
+        rect = (x, y, x + width, y + height)
+
+        old_rect = self.rect if self.rect is not None else rect
+        self._composite(old_rect, rect)
+        self.rect = rect
+        return Image.fromarray(self.frame)
+
+    def _composite(self, old_rect, rect):
+        # Restore the union of the old and new overlay areas, then blend the overlay into the new one
+        dirty = self._clip((
+            min(old_rect[0], rect[0]),
+            min(old_rect[1], rect[1]),
+            max(old_rect[2], rect[2]),
+            max(old_rect[3], rect[3]),
+        ))
+        self.dirty = dirty
+        if dirty is None:
+            return
+        left, top, right, bottom = dirty
+        self.frame[top:bottom, left:right] = self.base[top:bottom, left:right]
+
+        visible = self._clip(rect)
+        if visible is None:
+            return
+        left, top, right, bottom = visible
+        overlay = self.overlay[top - rect[1]:bottom - rect[1], left - rect[0]:right - rect[0]]
+        base = self.base[top:bottom, left:right].astype(np.uint16)
+        self.frame[top:bottom, left:right] = overlay + (base * self.inverse_alpha + 127) // 255
+
+    def _clip(self, rect):
+        height, width = self.frame.shape[:2]
+        left, top = max(rect[0], 0), max(rect[1], 0)
+        right, bottom = min(rect[2], width), min(rect[3], height)
+        if left >= right or top >= bottom:
+            return None
+        return (left, top, right, bottom)
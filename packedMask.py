@@ -0,0 +1,193 @@
+import numpy as np
+from PIL import Image
+
+
+class PackedMask:
+    """
+    Binary mask stored one bit per pixel. Every row is packed into little-endian 64-bit words, pixel x being
+    bit x % 64 of word x // 64, which is np.packbits with little bit order viewed as "<u8". A mask takes an
+    eighth of a 0/255 uint8 plane. Morphology with rectangular elements works on whole words: a horizontal
+    step is a shift with carry from the neighbouring word and a vertical step is an OR of neighbouring rows.
+    """
+
+    # Rows converted at a time, so conversions never hold a full uint8 or bool copy of a large mask
+    BAND_ROWS = 256
+
+    def __init__(self, bits, width):
+        """
+        :param bits: (height, words) little-endian uint64 array, bits past width must be zero
+        :param width: Width of the mask in pixels
+        """
+        self.bits = bits
+        self.width = width
+        self.height = bits.shape[0]
+        # Bits of the last word that are inside the mask, the rest has to stay zero
+        self.tail = np.uint64((1 << (width % 64)) - 1) if width % 64 else np.uint64(2 ** 64 - 1)
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    @staticmethod
+    def from_array(array, threshold=0):
+        """
+        Pack a 2D array, pixels above threshold are set (any nonzero pixel with the default threshold).
+        """
+        height, width = array.shape
+        words = -(-width // 64)
+        bits = np.zeros((height, words), dtype="<u8")
+        packed_bytes = bits.view(np.uint8)
+        for top in range(0, height, PackedMask.BAND_ROWS):
+            band = np.packbits(array[top:top + PackedMask.BAND_ROWS] > threshold, axis=1, bitorder="little")
+            packed_bytes[top:top + len(band), :band.shape[1]] = band
+        return PackedMask(bits, width)
+
+    @staticmethod
+    def from_image(image, threshold=127):
+        """
+        Threshold and pack a PIL image band by band, pixels of the grayscale image above threshold are set.
+        Images of mode "1" are already packed and only copied into the word layout.
+        """
+        width, height = image.size
+        if image.mode == "1":
+            bits = np.zeros((height, -(-width // 64)), dtype="<u8")
+            # Raw mode "1;R" packs the lowest pixel into the lowest bit like packbits(bitorder="little")
+            packed = np.frombuffer(image.tobytes("raw", "1;R"), dtype=np.uint8).reshape(height, -(-width // 8))
+            bits.view(np.uint8)[:, :packed.shape[1]] = packed
+            return PackedMask(bits, width)
+
+        gray_image = image if image.mode == "L" else image.convert("L")
+        bits = np.zeros((height, -(-width // 64)), dtype="<u8")
+        packed_bytes = bits.view(np.uint8)
+        for top in range(0, height, PackedMask.BAND_ROWS):
+            band = np.asarray(gray_image.crop((0, top, width, min(top + PackedMask.BAND_ROWS, height))))
+            band = np.packbits(band > threshold, axis=1, bitorder="little")
+            packed_bytes[top:top + len(band), :band.shape[1]] = band
+        return PackedMask(bits, width)
+
+    def to_array(self, value=255, out=None):
+        """
+        Unpack to a uint8 array with value on set pixels and 0 elsewhere.
+        :param out: Optional (height, width) uint8 array to unpack into, e.g. a memmap
+        """
+        out = np.empty(self.shape, dtype=np.uint8) if out is None else out
+        packed_bytes = self.bits.view(np.uint8)
+        for top in range(0, self.height, self.BAND_ROWS):
+            band = np.unpackbits(packed_bytes[top:top + self.BAND_ROWS], axis=1, count=self.width, bitorder="little")
+            np.multiply(band, np.uint8(value), out=out[top:top + len(band)])
+        return out
+
+    def to_image(self, mode="L"):
+        """
+        Unpack to a PIL image with 255 on set pixels.
+        :param mode: "L", or "1" to hand the packed rows to PIL without unpacking
+        """
+        if mode == "1":
+            return Image.frombytes("1", (self.width, self.height), self.bits.tobytes(), "raw", "1;R", self.bits.shape[1] * 8)
+        return Image.fromarray(self.to_array())
+
+    def count(self):
+        """
+        Number of set pixels.
+        """
+        return int(np.bitwise_count(self.bits).sum(dtype=np.int64))
+
+    def copy(self):
+        return PackedMask(self.bits.copy(), self.width)
+
+    def invert(self):
+        """
+        Complement of the mask.
+        """
+        bits = ~self.bits
+        bits[:, -1] &= self.tail
+        return PackedMask(bits, self.width)
+
+    def dilate(self, size=3, iterations=1):
+        """
+        Dilation by a rectangle, pixels outside the mask count as unset like cv2.dilate.
+        :param size: Odd side of the rectangle, or (width, height)
+        :param iterations: Times the dilation is repeated, fused into one larger rectangle
+        """
+        half_width, half_height = self._half_sizes(size, iterations)
+        bits = self._segment_rows(self.bits, half_width)
+        return PackedMask(self._segment_columns(bits, half_height), self.width)
+
+    def erode(self, size=3, iterations=1):
+        """
+        Erosion by a rectangle, pixels outside the mask count as set like cv2.erode.
+        Computed as the complement of the dilated complement.
+        """
+        return self.invert().dilate(size, iterations).invert()
+
+    def open(self, size=3, iterations=1):
+        return self.erode(size, iterations).dilate(size, iterations)
+
+    def close(self, size=3, iterations=1):
+        return self.dilate(size, iterations).erode(size, iterations)
+
+    def boundary(self, size=3, iterations=1):
+        """
+        Pixels of the mask that its erosion removes.
+        """
+        return PackedMask(self.bits & ~self.erode(size, iterations).bits, self.width)
+
+    def _half_sizes(self, size, iterations):
+        width, height = (size, size) if np.ndim(size) == 0 else size
+        if width % 2 == 0 or height % 2 == 0:
+            raise ValueError("Packed masks need odd structuring element sizes.")
+        return iterations * (width - 1) // 2, iterations * (height - 1) // 2
+
+    def _segment_rows(self, bits, half):
+        # OR with the pixels up to half columns left and right. The reach doubles per shift, first to the right
+        # then to the left, so a pixel is only ever moved towards its target and nothing is lost at the border
+        for direction in (1, -1):
+            reached = 0
+            while reached < half:
+                step = min(reached + 1, half - reached)
+                bits = bits | self._shift_columns(bits, step * direction)
+                reached += step
+        return bits
+
+    def _shift_columns(self, bits, shift):
+        # Pixel x of the result is pixel x - shift of bits, shifting in zeros
+        words, offset = divmod(abs(shift), 64)
+        shifted = np.zeros_like(bits)
+        if words >= bits.shape[1]:
+            return shifted
+        offset = np.uint64(offset)
+        if shift > 0:
+            source = bits[:, :bits.shape[1] - words]
+            shifted[:, words:] = source << offset
+            if offset:
+                shifted[:, words + 1:] |= source[:, :-1] >> (np.uint64(64) - offset)
+        else:
+            source = bits[:, words:]
+            shifted[:, :bits.shape[1] - words] = source >> offset
+            if offset:
+                shifted[:, :bits.shape[1] - words - 1] |= source[:, 1:] << (np.uint64(64) - offset)
+        shifted[:, -1] &= self.tail
+        return shifted
+
+    @staticmethod
+    def _segment_columns(bits, half):
+        # OR with the rows up to half rows above and below, doubling the reach per step like _segment_rows
+        for direction in (1, -1):
+            reached = 0
+            while reached < half:
+                step = min(reached + 1, half - reached)
+                if step >= len(bits):
+                    break
+                shifted = bits.copy()
+                if direction > 0:
+                    shifted[step:] |= bits[:-step]
+                else:
+                    shifted[:-step] |= bits[step:]
+                bits = shifted
+                reached += step
+        return bits
+
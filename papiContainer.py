@@ -0,0 +1,546 @@
+import io
+import struct
+import zlib
+from contextlib import nullcontext
+import numpy as np
+from PIL import Image
+from compression import ImageCompressor
+
+
+class PapiContainer:
+    """
+    Binary container (.papi) for ImageCompressor output.
+    The file starts with a header and a plane table, followed by the image in bands of rows. Every band is
+    one chunk: a 4 byte length and a DEFLATE stream (LZ77 with Huffman coding), a zero length ends the file.
+    DCT bands hold the quantized coefficients of each plane as int16 in zig-zag order, stored coefficient by
+    coefficient so the long runs of zeros in the high frequencies sit together, and a reduced size preview
+    only has to inflate and transform the leading coefficients. RLE bands hold run lengths
+    and run values. Bands are encoded and decoded independently on worker threads, with only a few in flight
+    at a time, so the whole stream never has to be in memory.
+    """
+
+    MAGIC = b"PAPI"
+    # Version 2 adds the palette section after the dtype, version 1 files are still read
+    VERSION = 2
+    CODEC_RLE = 0
+    CODEC_DCT = 1
+    COLOR_PLANES = 0
+    COLOR_YCBCR = 1
+
+    # magic, version, codec, width, height, channels (0 for a 2D array), band rows, planes, color transform
+    HEADER = struct.Struct("<4sBBIIBHBB")
+    # width, height and horizontal/vertical subsampling of a plane,
+    # DCT planes are followed by their 8x8 quantization matrix as float32
+    PLANE = struct.Struct("<IIBB")
+    TABLE = struct.Struct("<64f")
+    CHUNK = struct.Struct("<I")
+    # Palette of mode "P" images: RGB bytes, then the transparency as none, an index or per entry alpha bytes
+    PALETTE_LENGTH = struct.Struct("<H")
+    TRANSPARENCY_NONE = 0
+    TRANSPARENCY_INDEX = 1
+    TRANSPARENCY_ALPHA = 2
+
+    # Position in the flattened 8x8 block of every zig-zag index
+    ZIGZAG = ImageCompressor.ZIGZAG
+
+    @staticmethod
+    def write(destination, image, codec="dct", quality=50, band_rows=128, level=9, subsampling=None, scale=None,
+              workers=None):
+        """
+        Compress an image into the container format.
+        :param destination: File path or binary file object
+        :param image: PIL.Image object, NumPy array (e.g. from BandSource.open_raw) or BandSource,
+                      DCT needs 8-bit grayscale or multi-channel data. The image is read one band at a time
+        :param codec: "dct" for lossy or "rle" for lossless compression
+        :param quality: Quality between 1 and 100 for the DCT codec
+        :param band_rows: Rows per chunk, rounded up to a multiple of 16
+        :param level: zlib compression level
+        :param subsampling: For DCT on RGB data, "4:4:4", "4:2:2" or "4:2:0" to code the image as YCbCr
+                            with subsampled chroma and separate luma and chroma tables; None codes the channels as they are
+        :param scale: Explicit quantization table scale for the DCT codec, quality then only sets the
+                      per-block threshold (0 disables it), see RateController
+        :param workers: Threads encoding bands in parallel, None for the CPU count. The output does not depend on it
+        :return: Number of bytes written
+        """
+        source = image if isinstance(image, BandSource) else BandSource(image)
+        height, width, channels = source.height, source.width, source.channels
+        # Bands cover whole 8x8 blocks of 2x2 subsampled planes too
+        band_rows = PapiContainer.band_rows(band_rows)
+
+        # Planes as (table, horizontal factor, vertical factor)
+        color = PapiContainer.COLOR_PLANES
+        if codec == "dct":
+            if source.dtype != np.uint8:
+                raise ValueError("DCT compression needs 8-bit image data.")
+            codec_id = PapiContainer.CODEC_DCT
+            if subsampling is not None:
+                if channels != 3:
+                    raise ValueError("YCbCr compression needs an RGB image.")
+                color = PapiContainer.COLOR_YCBCR
+            planes = PapiContainer.dct_planes(channels, quality, subsampling, scale)
+        elif codec == "rle":
+            codec_id = PapiContainer.CODEC_RLE
+            planes = [(None, 1, 1)]
+        else:
+            raise ValueError(f"Unknown codec: {codec}")
+
+        def encode(band):
+            # Runs on a worker thread, bands are independent so they are encoded in any order
+            if codec_id == PapiContainer.CODEC_DCT:
+                if color == PapiContainer.COLOR_YCBCR:
+                    band_planes = ImageCompressor.ycbcr_planes(band, subsampling)
+                else:
+                    band_planes = [band] if band.ndim == 2 else [band[:, :, index] for index in range(channels)]
+                payload = PapiContainer._encode_dct_band(band_planes, [table for table, _, _ in planes], quality)
+            else:
+                payload = PapiContainer._encode_rle_band(band)
+            return zlib.compress(payload, level)
+
+        palette = None
+        if source.mode == "P":
+            palette = (source.image.getpalette(), source.image.info.get("transparency"))
+        header = PapiContainer.header(
+            codec_id, width, height, channels, band_rows, planes, color, source.mode, source.dtype, palette
+        )
+        # Bands are read on this thread as workers become free and written back in order
+        bands = (source.read(top, band_rows) for top in range(0, height, band_rows))
+        with PapiContainer._open(destination, "wb") as file:
+            written = file.write(header)
+            for data in ImageCompressor.parallel_map(encode, bands, workers):
+                written += file.write(PapiContainer.CHUNK.pack(len(data)) + data)
+            written += file.write(PapiContainer.CHUNK.pack(0))
+        return written
+
+    @staticmethod
+    def band_rows(rows):
+        """
+        Round a requested band height up to whole 8x8 blocks of 2x2 subsampled planes.
+        """
+        return max(16, (rows + 15) // 16 * 16)
+
+    @staticmethod
+    def dct_planes(channels, quality, subsampling=None, scale=None):
+        """
+        Quantization table and subsampling of every plane coded by the DCT codec.
+        :param channels: Number of image channels, 0 for a 2D array
+        :param subsampling: YCbCr subsampling, None to code the channels as they are
+        :param scale: Explicit quantization table scale, see ImageCompressor.quantization_matrix
+        :return: List of (table, horizontal factor, vertical factor)
+        """
+        luma = ImageCompressor.quantization_matrix(quality, scale=scale)
+        if subsampling is None:
+            return [(luma, 1, 1)] * max(channels, 1)
+        factor_x, factor_y = ImageCompressor.SUBSAMPLING[subsampling]
+        chroma = ImageCompressor.quantization_matrix(quality, chroma=True, scale=scale)
+        return [(luma, 1, 1), (chroma, factor_x, factor_y), (chroma, factor_x, factor_y)]
+
+    @staticmethod
+    def header(codec, width, height, channels, band_rows, planes, color, mode, dtype, palette=None):
+        """
+        Pack the header and plane table.
+        :param planes: List of (table, horizontal factor, vertical factor), table None for RLE
+        :param palette: (palette list, transparency) of a mode "P" image, see PIL.Image.getpalette and
+                        info["transparency"], or None
+        :return: Header bytes
+        """
+        header = PapiContainer.HEADER.pack(
+            PapiContainer.MAGIC, PapiContainer.VERSION, codec, width, height, channels, band_rows, len(planes), color
+        )
+        header += PapiContainer._pack_text(mode) + PapiContainer._pack_text(np.dtype(dtype).str)
+        header += PapiContainer._pack_palette(palette)
+        for table, factor_x, factor_y in planes:
+            header += PapiContainer.PLANE.pack(-(-width // factor_x), -(-height // factor_y), factor_x, factor_y)
+            if table is not None:
+                header += PapiContainer.TABLE.pack(*np.asarray(table, dtype=np.float32).ravel())
+        return header
+
+    @staticmethod
+    def pack_coefficients(quantized_blocks):
+        """
+        Serialize quantized (blocks, 8, 8) coefficients as int16 in zig-zag order, coefficient-major
+        so every frequency's values are contiguous.
+        """
+        coefficients = quantized_blocks.reshape(-1, 64)[:, PapiContainer.ZIGZAG].astype(np.int16)
+        return np.ascontiguousarray(coefficients.T).astype("<i2").tobytes()
+
+    @staticmethod
+    def read(source, out=None, workers=None, reduce=1, coefficients=64):
+        """
+        Decode a container to a NumPy array.
+        :param source: File path, binary file object or bytes
+        :param out: Optional array of the image shape to decode into, e.g. a writable BandSource.open_raw
+                    memmap, so images larger than memory are decoded band by band to disk
+        :param workers: Threads decoding bands in parallel, None for the CPU count
+        :param reduce: 1, 2, 4 or 8 to decode a preview at 1/reduce of the size, see reduced_shape.
+                       DCT images decode straight from the low frequency coefficients, RLE images are subsampled
+        :param coefficients: Zig-zag coefficients per block used by the DCT codec, fewer decode faster and blurrier
+        """
+        return PapiContainer._read(source, out, workers, reduce, coefficients)[1]
+
+    @staticmethod
+    def read_image(source, workers=None, reduce=1, coefficients=64):
+        """
+        Decode a container to a PIL image with the mode it was written with.
+        :param source: File path, binary file object or bytes
+        :param workers: Threads decoding bands in parallel, None for the CPU count
+        :param reduce: Decode at 1/reduce of the size, see read
+        :param coefficients: Zig-zag coefficients per DCT block, see read
+        """
+        header, image = PapiContainer._read(source, None, workers, reduce, coefficients)
+        # Bilevel images come back as bool arrays, which fromarray already maps to mode "1"
+        if image.dtype == bool:
+            return Image.fromarray(image)
+        result = Image.fromarray(image, mode=header["mode"] or None)
+        if header["palette"] is not None:
+            colors, transparency = header["palette"]
+            result.putpalette(colors)
+            if transparency is not None:
+                result.info["transparency"] = transparency
+        return result
+
+    @staticmethod
+    def iter_bands(source, workers=None, reduce=1, coefficients=64):
+        """
+        Decode a container band by band.
+        :param workers: Threads decoding bands in parallel, None for the CPU count
+        :param reduce: Decode at 1/reduce of the size, see read
+        :param coefficients: Zig-zag coefficients per DCT block, see read
+        :return: Generator of (top row, band array) tuples, rows counted in the reduced image
+        """
+        with PapiContainer._open(source, "rb") as file:
+            header = PapiContainer.read_header(file)
+            yield from PapiContainer._decode_bands(file, header, workers, reduce, coefficients)
+
+    @staticmethod
+    def reduced_shape(header, reduce=1):
+        """
+        Shape of an image decoded at 1/reduce, height and width rounded up.
+        :param header: Dictionary from read_header
+        """
+        if reduce not in ImageCompressor.REDUCTIONS:
+            raise ValueError(f"Reduce must be one of {ImageCompressor.REDUCTIONS}, got {reduce}")
+        height, width = header["shape"][:2]
+        return (-(-height // reduce), -(-width // reduce)) + tuple(header["shape"][2:])
+
+    @staticmethod
+    def read_header(file):
+        """
+        Read the header and plane table from a binary file object positioned at the start of a container.
+        :return: Dictionary with codec, color, width, height, shape, dtype, mode, palette, band_rows and planes
+        """
+        magic, version, codec, width, height, channels, band_rows, plane_count, color = PapiContainer.HEADER.unpack(
+            PapiContainer._read_exact(file, PapiContainer.HEADER.size)
+        )
+        if magic != PapiContainer.MAGIC:
+            raise ValueError("Not a PAPI compressed file.")
+        if version not in (1, PapiContainer.VERSION):
+            raise ValueError(f"Unsupported PAPI file version: {version}")
+
+        mode = PapiContainer._read_text(file)
+        dtype = np.dtype(PapiContainer._read_text(file))
+        palette = PapiContainer._read_palette(file) if version >= 2 else None
+        planes = []
+        for _ in range(plane_count):
+            plane_width, plane_height, factor_x, factor_y = PapiContainer.PLANE.unpack(
+                PapiContainer._read_exact(file, PapiContainer.PLANE.size)
+            )
+            table = None
+            if codec == PapiContainer.CODEC_DCT:
+                table = np.array(
+                    PapiContainer.TABLE.unpack(PapiContainer._read_exact(file, PapiContainer.TABLE.size)),
+                    dtype=np.float32,
+                ).reshape(8, 8)
+            planes.append({
+                "width": plane_width,
+                "height": plane_height,
+                "factors": (factor_x, factor_y),
+                "table": table,
+            })
+
+        return {
+            "codec": codec,
+            "color": color,
+            "width": width,
+            "height": height,
+            "shape": (height, width, channels) if channels else (height, width),
+            "dtype": dtype,
+            "mode": mode,
+            "palette": palette,
+            "band_rows": band_rows,
+            "planes": planes,
+        }
+
+    @staticmethod
+    def _read(source, out=None, workers=None, reduce=1, coefficients=64):
+        with PapiContainer._open(source, "rb") as file:
+            header = PapiContainer.read_header(file)
+            shape = PapiContainer.reduced_shape(header, reduce)
+            image = np.empty(shape, dtype=header["dtype"]) if out is None else out
+            if image.shape != shape:
+                raise ValueError(f"Output shape {image.shape} does not match the image shape {shape}")
+            for top, band in PapiContainer._decode_bands(file, header, workers, reduce, coefficients):
+                image[top:top + band.shape[0]] = band
+        return header, image
+
+    @staticmethod
+    def _encode_dct_band(planes, tables, quality):
+        payload = []
+        for plane, table in zip(planes, tables):
+            dct_blocks, _ = ImageCompressor.forward_dct_blocks(plane)
+            payload.append(PapiContainer.pack_coefficients(ImageCompressor.quantize_blocks(dct_blocks, table, quality)))
+        return b"".join(payload)
+
+    @staticmethod
+    def _encode_rle_band(band):
+        values, counts = ImageCompressor(band).apply_rle()
+        return (
+            PapiContainer.CHUNK.pack(len(counts))
+            + counts.astype("<u4").tobytes()
+            + np.ascontiguousarray(values).tobytes()
+        )
+
+    @staticmethod
+    def _decode_bands(file, header, workers=None, reduce=1, coefficients=64):
+        height = header["height"]
+        band_rows = header["band_rows"]
+        ycbcr = header["color"] == PapiContainer.COLOR_YCBCR
+        if reduce not in ImageCompressor.REDUCTIONS:
+            raise ValueError(f"Reduce must be one of {ImageCompressor.REDUCTIONS}, got {reduce}")
+
+        def chunks():
+            # The file is read on this thread, decompression and decoding run on the workers
+            for top in range(0, height, band_rows):
+                length, = PapiContainer.CHUNK.unpack(PapiContainer._read_exact(file, PapiContainer.CHUNK.size))
+                if length == 0:
+                    raise ValueError("PAPI file ended early.")
+                yield top, PapiContainer._read_exact(file, length)
+
+        def decode(chunk):
+            # Band heights are multiples of 16, so bands start on whole rows of the reduced image too
+            top, data = chunk
+            rows = min(band_rows, height - top)
+            if header["codec"] == PapiContainer.CODEC_RLE:
+                band = PapiContainer._decode_rle_band(zlib.decompress(data), header, rows)
+                return top // reduce, -(-rows // reduce), band[::reduce, ::reduce]
+            return top // reduce, -(-rows // reduce), PapiContainer._decode_dct_band(data, header, rows, reduce, coefficients)
+
+        pending = None
+        for top, rows, planes in ImageCompressor.parallel_map(decode, chunks(), workers):
+            if header["codec"] == PapiContainer.CODEC_RLE:
+                yield top, planes
+                continue
+
+            if not ycbcr:
+                yield top, np.stack(planes, axis=-1) if len(header["shape"]) == 3 else planes[0]
+                continue
+
+            # Chroma upsampling needs the neighbouring chroma rows, so a band is merged once the next one is decoded
+            if pending is not None:
+                yield pending[0], PapiContainer._merge_ycbcr_band(pending, planes, header)
+                above = [plane[-1:] for plane in pending[2]]
+            else:
+                above = None
+            pending = (top, rows, planes, above)
+        if pending is not None:
+            yield pending[0], PapiContainer._merge_ycbcr_band(pending, None, header)
+
+    @staticmethod
+    def _merge_ycbcr_band(band, below, header):
+        _, rows, planes, above = band
+        chroma = []
+        for index in (1, 2):
+            parts = [above[index]] if above is not None else []
+            parts.append(planes[index])
+            if below is not None:
+                parts.append(below[index][:1])
+            chroma.append(np.concatenate(parts))
+        margins = (int(above is not None), int(below is not None))
+        return ImageCompressor.merge_ycbcr([planes[0]] + chroma, (rows, planes[0].shape[1]), margins)
+
+    @staticmethod
+    def _decode_dct_band(data, header, rows, reduce=1, coefficients=64):
+        # Subsampled planes are reduced less, so every plane comes out at the size of the reduced image
+        layout = []
+        offset = 0
+        end = 0
+        for plane in header["planes"]:
+            plane_rows = -(-rows // plane["factors"][1])
+            padded_shape = ((plane_rows + 7) // 8 * 8, (plane["width"] + 7) // 8 * 8)
+            block_count = (padded_shape[0] // 8) * (padded_shape[1] // 8)
+            plane_reduce = ImageCompressor.plane_reduction(reduce, plane["factors"])
+            count = ImageCompressor.coefficient_count(plane_reduce, coefficients)
+            layout.append((plane, plane_rows, padded_shape, block_count, offset, plane_reduce, count))
+            end = offset + count * block_count * 2
+            offset += 64 * block_count * 2
+
+        # Coefficients are stored coefficient-major, so the band is only inflated up to the last one used
+        payload = zlib.decompressobj().decompress(data, end)
+
+        planes = []
+        for plane, plane_rows, padded_shape, block_count, offset, (reduce_y, reduce_x), count in layout:
+            coefficients = np.frombuffer(payload, dtype="<i2", count=count * block_count, offset=offset)
+            blocks = np.zeros((block_count, 64), dtype=np.float32)
+            blocks[:, PapiContainer.ZIGZAG[:count]] = coefficients.reshape(count, block_count).T
+            blocks = blocks.reshape(-1, 8, 8) * plane["table"]
+            decoded = ImageCompressor.inverse_dct_blocks(blocks, padded_shape, (reduce_y, reduce_x))
+            planes.append(decoded[:-(-plane_rows // reduce_y), :-(-plane["width"] // reduce_x)])
+        return planes
+
+    @staticmethod
+    def _decode_rle_band(payload, header, rows):
+        run_count, = PapiContainer.CHUNK.unpack_from(payload)
+        counts = np.frombuffer(payload, dtype="<u4", count=run_count, offset=PapiContainer.CHUNK.size)
+        values = np.frombuffer(payload, dtype=header["dtype"], offset=PapiContainer.CHUNK.size + counts.nbytes)
+        shape = (rows,) + tuple(header["shape"][1:])
+        if len(shape) == 3:
+            values = values.reshape(-1, shape[2])
+        return np.repeat(values, counts, axis=0).reshape(shape)
+
+    @staticmethod
+    def _pack_text(text):
+        data = text.encode("ascii")
+        return struct.pack("<B", len(data)) + data
+
+    @staticmethod
+    def _pack_palette(palette):
+        # An empty palette stands for none
+        if palette is None or palette[0] is None:
+            return PapiContainer.PALETTE_LENGTH.pack(0)
+        colors, transparency = palette
+        data = PapiContainer.PALETTE_LENGTH.pack(len(colors)) + bytes(colors)
+        if transparency is None:
+            return data + struct.pack("<B", PapiContainer.TRANSPARENCY_NONE)
+        if isinstance(transparency, int):
+            return data + struct.pack("<BH", PapiContainer.TRANSPARENCY_INDEX, transparency)
+        data += struct.pack("<B", PapiContainer.TRANSPARENCY_ALPHA)
+        return data + PapiContainer.PALETTE_LENGTH.pack(len(transparency)) + bytes(transparency)
+
+    @staticmethod
+    def _read_palette(file):
+        length, = PapiContainer.PALETTE_LENGTH.unpack(PapiContainer._read_exact(file, PapiContainer.PALETTE_LENGTH.size))
+        if length == 0:
+            return None
+        colors = list(PapiContainer._read_exact(file, length))
+        kind, = struct.unpack("<B", PapiContainer._read_exact(file, 1))
+        transparency = None
+        if kind == PapiContainer.TRANSPARENCY_INDEX:
+            transparency, = struct.unpack("<H", PapiContainer._read_exact(file, 2))
+        elif kind == PapiContainer.TRANSPARENCY_ALPHA:
+            size, = PapiContainer.PALETTE_LENGTH.unpack(PapiContainer._read_exact(file, PapiContainer.PALETTE_LENGTH.size))
+            transparency = PapiContainer._read_exact(file, size)
+        return colors, transparency
+
+    @staticmethod
+    def _read_text(file):
+        length, = struct.unpack("<B", PapiContainer._read_exact(file, 1))
+        return PapiContainer._read_exact(file, length).decode("ascii")
+
+    @staticmethod
+    def _read_exact(file, size):
+        data = file.read(size)
+        if len(data) != size:
+            raise ValueError("PAPI file ended early.")
+        return data
+
+    @staticmethod
+    def _open(target, mode):
+        # Paths are opened here, file objects are used as they are and left open
+        if isinstance(target, (bytes, bytearray)):
+            return io.BytesIO(target)
+        if hasattr(target, "read" if "r" in mode else "write"):
+            return nullcontext(target)
+        return open(target, mode)
+
+
+
+class BandSource:
+    """
+    Reads an image in horizontal bands without holding a full decoded copy.
+    NumPy arrays and memory-mapped raw files are sliced directly. PIL images stored as uncompressed
+    rows (PPM, BMP, uncompressed TIFF strips) are memory-mapped from their file, other PIL images are
+    decoded once by PIL and cropped band by band.
+    """
+
+    def __init__(self, image):
+        """
+        :param image: PIL.Image object or NumPy array with 2 or 3 dimensions
+        """
+        self.image = image
+        self.mode = image.mode if isinstance(image, Image.Image) else ""
+        self.segments = None
+
+        if isinstance(image, Image.Image):
+            self.segments = self._map_rows(image)
+            self.width, self.height = image.size
+            if self.segments is None:
+                # Compressed formats are decoded by PIL, bands are converted as they are read
+                image.load()
+                probe = np.asarray(image.crop((0, 0, min(self.width, 1), min(self.height, 1))))
+            else:
+                probe = self.segments[0][2][:1, :1]
+            self.dtype = probe.dtype
+            self.channels = probe.shape[2] if probe.ndim == 3 else 0
+        else:
+            array = np.asarray(image) if not isinstance(image, np.ndarray) else image
+            if array.ndim not in (2, 3):
+                raise ValueError("Unsupported image format for compression.")
+            self.image = array
+            self.height, self.width = array.shape[:2]
+            self.channels = array.shape[2] if array.ndim == 3 else 0
+            self.dtype = array.dtype
+
+    def read(self, top, rows):
+        """
+        Read rows top to top + rows (clipped to the image) as a contiguous array.
+        """
+        bottom = min(top + rows, self.height)
+        if self.segments is not None:
+            parts = [
+                array[max(top, start) - start:min(bottom, end) - start]
+                for start, end, array in self.segments
+                if start < bottom and end > top
+            ]
+            return np.ascontiguousarray(np.concatenate(parts) if len(parts) > 1 else parts[0])
+        if isinstance(self.image, Image.Image):
+            return np.asarray(self.image.crop((0, top, self.width, bottom)))
+        return np.ascontiguousarray(self.image[top:bottom])
+
+    @staticmethod
+    def open_raw(path, width, height, channels=0, dtype=np.uint8, offset=0, mode="r"):
+        """
+        Memory-map a raw interleaved pixel file.
+        :param channels: Number of channels, 0 for a single 2D plane
+        :param mode: numpy.memmap mode, "w+" creates the file, e.g. as output for PapiContainer.read
+        :return: numpy.memmap of shape (height, width[, channels])
+        """
+        shape = (height, width, channels) if channels else (height, width)
+        return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=shape)
+
+    @staticmethod
+    def _map_rows(image):
+        # Map every uncompressed full-width tile of an unloaded file, None when any tile needs a decoder
+        channels = {"L": 0, "RGB": 3, "RGBA": 4}.get(image.mode)
+        filename = getattr(image, "filename", None)
+        tiles = getattr(image, "tile", None)
+        if channels is None or not filename or not tiles:
+            return None
+
+        width, _ = image.size
+        pixel_bytes = max(channels, 1)
+        segments = []
+        for codec_name, extents, offset, args in tiles:
+            rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+            x0, y0, x1, y1 = extents
+            if codec_name != "raw" or x0 != 0 or x1 != width or rawmode not in (image.mode, "BGR" if image.mode == "RGB" else None):
+                return None
+            rows = y1 - y0
+            stride = stride or width * pixel_bytes
+            array = np.memmap(filename, dtype=np.uint8, mode="r", offset=offset, shape=(rows, stride))
+            array = array[:, :width * pixel_bytes]
+            array = array.reshape(rows, width, channels) if channels else array
+            if orientation < 0:
+                array = array[::-1]
+            if rawmode == "BGR":
+                array = array[:, :, ::-1]
+            segments.append((y0, y1, array))
+        return sorted(segments, key=lambda segment: segment[0])
@@ -0,0 +1,186 @@
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+
+
+class PointOperationPipeline:
+    """
+    Collects a chain of per-pixel point operations and applies them as one lookup table per band.
+    Each stage is turned into a 256-entry table and composed with the previous ones, so a chain
+    of any length costs a single Image.point pass over the pixels.
+    """
+
+    # Modes handled with lookup tables, the others run the stages one by one on the image as it is
+    SUPPORTED_MODES = ("L", "RGB", "RGBA")
+
+    def __init__(self):
+        # List of (operation name, parameters) in the order they were added
+        self.stages = []
+
+    def brightness(self, value):
+        """
+        Add a brightness adjustment, same as basicOperations.adjust_brightness.
+        :param value: Brightness change in percent (negative for darker, positive for brighter)
+        :return: The pipeline, so calls can be chained
+        """
+        self.stages.append(("brightness", (1 + value / 100.0,)))
+        return self
+
+    def contrast(self, value):
+        """
+        Add a contrast adjustment around the mean gray level, same as basicOperations.adjust_contrast.
+        :param value: Contrast change in percent (negative for less, positive for more)
+        :return: The pipeline, so calls can be chained
+        """
+        self.stages.append(("contrast", (1 + value / 100.0,)))
+        return self
+
+    def negative(self):
+        """
+        Add a negative (invert) step.
+        :return: The pipeline, so calls can be chained
+        """
+        self.stages.append(("negative", ()))
+        return self
+
+    def rgb_intensity(self, red, green, blue):
+        """
+        Add a per-channel intensity step, same as basicOperations.adjust_rgb_intensity.
+        :param red: Intensity for red channel (0-255)
+        :param green: Intensity for green channel (0-255)
+        :param blue: Intensity for blue channel (0-255)
+        :return: The pipeline, so calls can be chained
+        """
+        self.stages.append(("rgb_intensity", (red / 255, green / 255, blue / 255)))
+        return self
+
+    def gamma(self, gamma=1.0):
+        """
+        Add a gamma correction step, same as ImageEnhancement.gamma_correction.
+        :param gamma: Gamma exponent
+        :return: The pipeline, so calls can be chained
+        """
+        self.stages.append(("gamma", (gamma,)))
+        return self
+
+    def contrast_stretching(self, low_in=0, high_in=255, low_out=0, high_out=255):
+        """
+        Add a linear contrast stretching step, same as ImageEnhancement.contrast_stretching.
+        :return: The pipeline, so calls can be chained
+        """
+        self.stages.append(("contrast_stretching", (low_in, high_in, low_out, high_out)))
+        return self
+
+    def build_luts(self, image):
+        """
+        Compose all stages into one lookup table per band of the image.
+        :param image: PIL.Image object in one of SUPPORTED_MODES
+        :return: uint8 array of shape (bands, 256)
+        """
+        bands = image.getbands()
+        identity = np.arange(256, dtype=np.uint8)
+        luts = np.tile(identity, (len(bands), 1))
+        histograms = None
+
+        for name, params in self.stages:
+            # Alpha is left untouched by the enhancer based steps, like ImageEnhance does
+            color_bands = [i for i, band in enumerate(bands) if band != "A"]
+
+            if name == "brightness":
+                table = self._blend_table(0, params[0])
+                for i in color_bands:
+                    luts[i] = table[luts[i]]
+            elif name == "contrast":
+                if histograms is None:
+                    histograms = np.array(image.histogram(), dtype=np.float64).reshape(len(bands), 256)
+                mean = self._gray_mean(image, luts, histograms, identity)
+                table = self._blend_table(mean, params[0])
+                for i in color_bands:
+                    luts[i] = table[luts[i]]
+            elif name == "negative":
+                for i in color_bands:
+                    luts[i] = 255 - luts[i]
+            elif name == "rgb_intensity":
+                if bands[:3] != ("R", "G", "B"):
+                    raise ValueError("RGB intensity requires an RGB image")
+                for i, factor in enumerate(params):
+                    luts[i] = self._blend_table(0, factor)[luts[i]]
+            elif name == "gamma":
+                table = np.clip((identity / 255.0) ** params[0], 0, 1) * 255
+                table = table.astype(np.uint8)
+                luts = table[luts]
+            elif name == "contrast_stretching":
+                low_in, high_in, low_out, high_out = params
+                values = identity.astype(np.float32)
+                table = np.clip((values - low_in) * (high_out - low_out) / (high_in - low_in) + low_out, 0, 255)
+                luts = table.astype(np.uint8)[luts]
+            else:
+                raise ValueError(f"Unknown point operation: {name}")
+
+        return luts
+
+    def apply(self, image):
+        """
+        Apply the whole chain to the image in a single pass.
+        Images outside SUPPORTED_MODES keep their mode and go through the stages one at a time, exactly
+        like the single operations did before they were turned into tables.
+        :param image: PIL.Image object
+        :return: New PIL image with all stages applied
+        """
+        if not isinstance(image, Image.Image):
+            raise ValueError("Input must be a PIL.Image object")
+        if image.mode not in self.SUPPORTED_MODES:
+            return self.apply_stages(image)
+        luts = self.build_luts(image)
+        return image.point(luts.ravel().tolist())
+
+    def apply_stages(self, image):
+        """
+        Apply the stages one after another with PIL and NumPy, for any mode these operations accept.
+        :param image: PIL.Image object
+        :return: New PIL image with all stages applied
+        """
+        for name, params in self.stages:
+            if name == "brightness":
+                image = ImageEnhance.Brightness(image).enhance(params[0])
+            elif name == "contrast":
+                image = ImageEnhance.Contrast(image).enhance(params[0])
+            elif name == "negative":
+                image = ImageOps.invert(image)
+            elif name == "rgb_intensity":
+                r, g, b = image.split()
+                r, g, b = (ImageEnhance.Brightness(band).enhance(factor) for band, factor in zip((r, g, b), params))
+                image = Image.merge("RGB", (r, g, b))
+            elif name == "gamma":
+                img_array = np.array(image) / 255.0
+                img_array = np.clip(img_array ** params[0], 0, 1) * 255
+                image = Image.fromarray(img_array.astype("uint8"))
+            elif name == "contrast_stretching":
+                low_in, high_in, low_out, high_out = params
+                img_array = np.array(image, dtype=np.float32)
+                img_array = np.clip((img_array - low_in) * (high_out - low_out) / (high_in - low_in) + low_out, 0, 255)
+                image = Image.fromarray(img_array.astype("uint8"))
+            else:
+                raise ValueError(f"Unknown point operation: {name}")
+        return image
+
+    @staticmethod
+    def _blend_table(degenerate, factor):
+        # Same arithmetic as Image.blend(degenerate, image, factor): float32, truncated, saturated
+        values = np.arange(256, dtype=np.float32)
+        degenerate = np.float32(degenerate)
+        table = degenerate + np.float32(factor) * (values - degenerate)
+        return np.clip(np.trunc(table), 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def _gray_mean(image, luts, histograms, identity):
+        # Rounded mean of the grayscale version of the image as it is after the previous stages
+        if image.mode == "L":
+            hist = histograms[0]
+            return int(np.dot(hist, luts[0]) / hist.sum() + 0.5)
+        if all(np.array_equal(lut, identity) for lut in luts[:3]):
+            # Nothing changed yet, measure exactly like ImageEnhance.Contrast does
+            gray = np.array(image.convert("L").histogram(), dtype=np.float64)
+            return int(np.dot(gray, identity) / gray.sum() + 0.5)
+        # Otherwise estimate from the per-channel histograms with the ITU-R 601-2 luma weights
+        means = [np.dot(histograms[i], luts[i]) / histograms[i].sum() for i in range(3)]
+        return int(0.299 * means[0] + 0.587 * means[1] + 0.114 * means[2] + 0.5)
@@ -0,0 +1,56 @@
+from PIL import Image
+
+
+class PreviewPyramid:
+    """
+    Mipmap pyramid of an image for on-screen display. Every level is half the size of the previous one
+    and is built once, so showing the image at any zoom only resamples from the nearest larger level.
+    """
+
+    def __init__(self, image, min_size=256):
+        """
+        :param image: PIL.Image object at full resolution
+        :param min_size: Levels stop once the longest side would drop below this size
+        """
+        self.source = image
+
+        # reduce() does not handle palette or bilevel images, so levels are built from a display copy
+        level = image
+        if image.mode in ("1", "P"):
+            level = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        self.levels = [level]
+        while max(level.size) // 2 >= min_size:
+            level = level.reduce(2)
+            self.levels.append(level)
+
+    def level_for(self, scale):
+        """
+        Return the smallest level that still has at least the requested resolution.
+        :param scale: Display scale relative to the full resolution image
+        :return: PIL.Image object of the chosen level
+        """
+        for level in reversed(self.levels):
+            if level.width >= self.source.width * scale and level.height >= self.source.height * scale:
+                return level
+        return self.levels[0]
+
+    def render(self, size, box=None, resample=Image.LANCZOS):
+        """
+        Render part of the image at the requested display size.
+        :param size: Tuple (width, height) of the output
+        :param box: Visible region (left, top, right, bottom) in full resolution coordinates, defaults to the whole image
+        :param resample: Resampling filter for the final resize
+        :return: PIL.Image object of the given size
+        """
+        if box is None:
+            box = (0, 0, self.source.width, self.source.height)
+        scale = max(size[0] / (box[2] - box[0]), size[1] / (box[3] - box[1]))
+        level = self.level_for(scale)
+
+        # Crop to the viewport on the chosen level as part of the resize
+        ratio_x = level.width / self.source.width
+        ratio_y = level.height / self.source.height
+        level_box = (box[0] * ratio_x, box[1] * ratio_y, box[2] * ratio_x, box[3] * ratio_y)
+        if level is self.source and size == level.size and level_box == (0, 0, level.width, level.height):
+            return level.copy()
+        return level.resize(size, resample, box=level_box)
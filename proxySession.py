@@ -0,0 +1,108 @@
+from PIL import Image
+
+
+class ProxySession:
+    """
+    Records operations applied to a screen-sized proxy of an image so they can be replayed on the
+    full resolution source later. Operations are callables taking the image as first argument;
+    replaying the same callables with the same parameters gives the exact full resolution result.
+    """
+
+    def __init__(self, source, max_size):
+        """
+        :param source: PIL.Image object at full resolution
+        :param max_size: Tuple (width, height) the proxy has to fit in
+        """
+        self.source = source
+        proxy = source.copy()
+        proxy.thumbnail(max_size, Image.LANCZOS)
+        self.scale = proxy.width / source.width
+
+        # states[0] is the proxy of the source, states[i + 1] the proxy after operation i
+        self.states = [proxy]
+        self.operations = []
+        self.undone = []
+
+    @property
+    def proxy(self):
+        """
+        The proxy image after the last recorded operation.
+        """
+        return self.states[-1]
+
+    def state(self, index=None):
+        """
+        Return the proxy after the first index operations, or the latest proxy when index is None.
+        """
+        return self.states[-1 if index is None else index]
+
+    def apply(self, operation, args=(), kwargs=None, base_index=None):
+        """
+        Run an operation on the proxy and record it.
+        :param operation: Callable taking the image as first argument
+        :param args: Positional parameters after the image
+        :param kwargs: Keyword parameters
+        :param base_index: State the operation reads from, defaults to the latest one
+        :return: The new proxy image
+        """
+        kwargs = kwargs or {}
+        result = operation(self.state(base_index), *args, **kwargs)
+        return self.record(operation, args, kwargs, result, base_index)
+
+    def record(self, operation, args, kwargs, result, base_index=None):
+        """
+        Record an operation whose proxy result was computed by the caller.
+        :return: The new proxy image
+        """
+        self.operations.append((operation, tuple(args), dict(kwargs or {}), base_index))
+        self.states.append(result)
+        self.undone.clear()
+        return result
+
+    def undo(self):
+        """
+        Drop the last operation, keeping it for redo.
+        :return: The proxy image after undoing, or None when there is nothing to undo
+        """
+        if not self.operations:
+            return None
+        self.undone.append((self.operations.pop(), self.states.pop()))
+        return self.proxy
+
+    def redo(self):
+        """
+        Restore the last undone operation.
+        :return: The proxy image after redoing, or None when there is nothing to redo
+        """
+        if not self.undone:
+            return None
+        operation, state = self.undone.pop()
+        self.operations.append(operation)
+        self.states.append(state)
+        return self.proxy
+
+    def render(self, operations=None):
+        """
+        Replay the recorded operations on the full resolution source.
+        Safe to call from a worker thread when given a snapshot of the operations.
+        :param operations: List of recorded operations, defaults to the current ones
+        :return: Full resolution PIL image
+        """
+        if operations is None:
+            operations = list(self.operations)
+
+        # Remember the last operation that reads each state, so full size states are freed early
+        last_use = {}
+        for index, (_, _, _, base_index) in enumerate(operations):
+            last_use[index if base_index is None else base_index] = index
+
+        states = {0: self.source}
+        for index, (operation, args, kwargs, base_index) in enumerate(operations):
+            # Results nobody reads again (e.g. superseded geometric chains) are skipped
+            if index + 1 not in last_use and index + 1 != len(operations):
+                continue
+            source_index = index if base_index is None else base_index
+            states[index + 1] = operation(states[source_index], *args, **kwargs)
+            for key in [key for key in states if key <= index and last_use.get(key, -1) <= index]:
+                del states[key]
+        return states[len(operations)]
@@ -0,0 +1,154 @@
+import math
+import zlib
+import numpy as np
+from PIL import Image
+from compression import ImageCompressor
+from papiContainer import PapiContainer
+
+
+class RateController:
+    """
+    Finds the quantization table scale that meets a byte budget or a PSNR floor for the DCT codec.
+    The forward DCT of every plane is computed once, so each probe of the bisection only re-quantizes
+    the cached coefficients, serializes them like PapiContainer does and measures the result.
+    PSNR is measured on the image the decoder would produce: inverse DCT, chroma upsampling, color
+    conversion, rounding and clipping. An estimate from the coefficient errors alone (Parseval) misses
+    the correlation of the Y, Cb and Cr errors, the smoothing of the chroma upsampling and the clipping,
+    and was measured more than 1.5 dB off for 4:2:0 images.
+    """
+
+    # Range of table scales searched, beyond it every table entry is clipped to 1 or 255
+    MIN_SCALE = 1 / 16
+    MAX_SCALE = 255.0
+
+    def __init__(self, image, subsampling=None, threshold=0, band_rows=128, level=9, workers=None):
+        """
+        :param image: PIL.Image object or NumPy array with 8-bit data
+        :param subsampling: None to code the channels as they are, or "4:4:4", "4:2:2", "4:2:0" for YCbCr
+        :param threshold: Per-block threshold as a quality value (see ImageCompressor.quantize_blocks), 0 disables it
+        :param band_rows: Rows per container chunk
+        :param level: zlib compression level, the same one used when writing
+        :param workers: Threads compressing the bands of a probe and of the written file, None for the CPU count
+        """
+        self.image = image
+        self.array = np.asarray(image)
+        if self.array.dtype != np.uint8 or self.array.ndim not in (2, 3):
+            raise ValueError("Rate control needs 8-bit image data.")
+        self.subsampling = subsampling
+        self.threshold = threshold
+        self.band_rows = PapiContainer.band_rows(band_rows)
+        self.level = level
+        self.workers = workers
+
+        height, width = self.array.shape[:2]
+        self.channels = self.array.shape[2] if self.array.ndim == 3 else 0
+        if subsampling is not None:
+            if self.channels != 3:
+                raise ValueError("YCbCr compression needs an RGB image.")
+            planes = ImageCompressor.ycbcr_planes(self.array, subsampling)
+            color = PapiContainer.COLOR_YCBCR
+        else:
+            planes = [self.array] if self.array.ndim == 2 else [self.array[:, :, index] for index in range(self.channels)]
+            color = PapiContainer.COLOR_PLANES
+
+        # Forward transform once, with the block rows that belong to every container band
+        self.planes = []
+        for plane, (_, factor_x, factor_y) in zip(planes, PapiContainer.dct_planes(self.channels, 0, subsampling)):
+            dct_blocks, padded_shape = ImageCompressor.forward_dct_blocks(plane)
+            blocks_per_row = padded_shape[1] // 8
+            band_block_rows = self.band_rows // factor_y // 8
+            self.planes.append({
+                "blocks": dct_blocks,
+                "shape": plane.shape,
+                "padded_shape": padded_shape,
+                "bands": [
+                    slice(row * blocks_per_row, (row + band_block_rows) * blocks_per_row)
+                    for row in range(0, padded_shape[0] // 8, band_block_rows)
+                ],
+            })
+
+        mode = image.mode if isinstance(image, Image.Image) else ""
+        header = PapiContainer.header(
+            PapiContainer.CODEC_DCT, width, height, self.channels, self.band_rows,
+            PapiContainer.dct_planes(self.channels, 0, subsampling), color, mode, np.uint8,
+        )
+        # Header plus the end marker, the chunk lengths are added per band
+        self.overhead = len(header) + PapiContainer.CHUNK.size
+        self.sample_count = self.array.size
+        self.probes = {}
+
+    def probe(self, scale):
+        """
+        Quantize the cached coefficients with the tables scaled by scale.
+        :return: Tuple (container size in bytes, PSNR in dB)
+        """
+        if scale in self.probes:
+            return self.probes[scale]
+
+        tables = [table for table, _, _ in PapiContainer.dct_planes(self.channels, self.threshold, self.subsampling, scale)]
+        decoded = []
+        band_payloads = None
+        for plane, table in zip(self.planes, tables):
+            quantized = ImageCompressor.quantize_blocks(plane["blocks"], table, self.threshold)
+            rows, columns = plane["shape"]
+            decoded.append(ImageCompressor.inverse_dct_blocks(quantized * table, plane["padded_shape"])[:rows, :columns])
+            packed = [PapiContainer.pack_coefficients(quantized[band]) for band in plane["bands"]]
+            band_payloads = packed if band_payloads is None else [a + b for a, b in zip(band_payloads, packed)]
+
+        compressed = ImageCompressor.parallel_map(lambda payload: len(zlib.compress(payload, self.level)), band_payloads, self.workers)
+        size = self.overhead + sum(PapiContainer.CHUNK.size + length for length in compressed)
+        mse = self._squared_error(decoded) / self.sample_count
+        psnr = math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+        self.probes[scale] = (size, psnr)
+        return self.probes[scale]
+
+    def fit_size(self, max_bytes, tolerance=0.01):
+        """
+        Smallest table scale (best quality) whose output fits in max_bytes.
+        :param tolerance: Relative precision of the scale
+        :return: The scale, or MAX_SCALE when even the coarsest quantization is too large
+        """
+        return self._bisect(lambda scale: self.probe(scale)[0] <= max_bytes, tolerance, large_fits=True)
+
+    def fit_psnr(self, min_psnr, tolerance=0.01):
+        """
+        Largest table scale (smallest output) whose PSNR is at least min_psnr.
+        :param tolerance: Relative precision of the scale
+        :return: The scale, or MIN_SCALE when even the finest quantization is below the floor
+        """
+        return self._bisect(lambda scale: self.probe(scale)[1] >= min_psnr, tolerance, large_fits=False)
+
+    def write(self, destination, scale):
+        """
+        Write the image as a PAPI container with the given table scale.
+        :return: Number of bytes written
+        """
+        return PapiContainer.write(
+            destination, self.image, codec="dct", quality=self.threshold, band_rows=self.band_rows,
+            level=self.level, subsampling=self.subsampling, scale=scale, workers=self.workers,
+        )
+
+    def _squared_error(self, decoded):
+        # Squared error of the decoded planes once merged into the image, like PapiContainer.read does
+        if self.subsampling is not None:
+            image = ImageCompressor.merge_ycbcr(decoded, self.array.shape[:2])
+        else:
+            image = decoded[0] if self.array.ndim == 2 else np.dstack(decoded)
+        difference = np.subtract(image, self.array, dtype=np.int32)
+        return float(np.sum(np.square(difference), dtype=np.int64))
+
+    def _bisect(self, fits, tolerance, large_fits):
+        # Bisection on log(scale); fits holds on one side of the boundary, large_fits tells which side
+        fitting, failing = (self.MAX_SCALE, self.MIN_SCALE) if large_fits else (self.MIN_SCALE, self.MAX_SCALE)
+        if fits(failing):
+            return failing
+        if not fits(fitting):
+            return fitting
+        fitting, failing = math.log(fitting), math.log(failing)
+        while abs(fitting - failing) > math.log1p(tolerance):
+            middle = (fitting + failing) / 2
+            if fits(math.exp(middle)):
+                fitting = middle
+            else:
+                failing = middle
+        return math.exp(fitting)
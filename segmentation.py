@@ -1,31 +1,107 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
 import numpy as np
 import cv2
 from PIL import Image
 
 class ImageSegmentation:
+    # Pixels the fast k-means fits its centers on
+    KMEANS_SAMPLE_SIZE = 100000
+    # Fitted palettes keyed by (content hash, k, sample size), shared by every instance and thread
+    PALETTE_CACHE_SIZE = 32
+    palette_cache = OrderedDict()
+    palette_lock = threading.Lock()
+    # Instances of the last images segmented, by id of the source image, see for_image
+    INSTANCE_CACHE_SIZE = 4
+    instance_cache = OrderedDict()
+    instance_lock = threading.Lock()
+    # Side of the tiles the pyramid watershed floods again at full resolution
+    WATERSHED_TILE = 256
+
     def __init__(self, image):
         self.image = image.convert("RGB")  # Ensure the image is in RGB format
         self.image_array = np.array(self.image)
+        # Shared by every method and possibly several threads, so nobody may write into it
+        self.image_array.setflags(write=False)
+        self.planes = {}
+
+    @classmethod
+    def for_image(cls, image):
+        """
+        Shared instance for a source image, so methods run one after another on the same image reuse
+        its grayscale, blur, gradient, threshold and distance planes. Entries are dropped with the image
+        or when newer images push them out. The image must not be modified after the first call.
+        :param image: PIL.Image object
+        """
+        key = id(image)
+        with cls.instance_lock:
+            entry = cls.instance_cache.get(key)
+            # The id of a collected image can be reused, the weak reference tells whether it is the same one
+            if entry is not None and entry[0]() is image:
+                cls.instance_cache.move_to_end(key)
+                return entry[1]
+
+        instance = cls(image)
+        with cls.instance_lock:
+            cls.instance_cache[key] = (weakref.ref(image, lambda _: cls._forget(key)), instance)
+            while len(cls.instance_cache) > cls.INSTANCE_CACHE_SIZE:
+                cls.instance_cache.popitem(last=False)
+        return instance
+
+    @classmethod
+    def _forget(cls, key):
+        with cls.instance_lock:
+            entry = cls.instance_cache.get(key)
+            if entry is not None and entry[0]() is None:
+                del cls.instance_cache[key]
+
+    def _plane(self, name, compute):
+        # Compute an intermediate plane once per instance, read-only since callers share it
+        plane = self.planes.get(name)
+        if plane is None:
+            plane = compute()
+            plane.setflags(write=False)
+            self.planes[name] = plane
+        return plane
+
+    def gray(self):
+        return self._plane("gray", lambda: cv2.cvtColor(self.image_array, cv2.COLOR_RGB2GRAY))
+
+    def blurred(self):
+        # 5x5 Gaussian blur of the grayscale plane
+        return self._plane("blurred", lambda: cv2.GaussianBlur(self.gray(), (5, 5), 0))
+
+    def gradient(self):
+        # Sobel magnitude as the mean of |dx| and |dy| in 8 bits
+        def compute():
+            sobel_x = cv2.convertScaleAbs(cv2.Sobel(self.gray(), cv2.CV_64F, 1, 0, ksize=3))
+            sobel_y = cv2.convertScaleAbs(cv2.Sobel(self.gray(), cv2.CV_64F, 0, 1, ksize=3))
+            return cv2.addWeighted(sobel_x, 0.5, sobel_y, 0.5, 0)
+        return self._plane("gradient", compute)
+
+    def otsu_binary(self):
+        # Inverted Otsu threshold of the blurred plane, dark objects become 255
+        return self._plane(
+            "otsu_binary",
+            lambda: cv2.threshold(self.blurred(), 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1],
+        )
+
+    def distance_transform(self):
+        # L2 distance of every object pixel of otsu_binary to the background
+        return self._plane("distance_transform", lambda: cv2.distanceTransform(self.otsu_binary(), cv2.DIST_L2, 5))
 
     def edge_detected(self):
         # Convert to grayscale
-        gray_image = cv2.cvtColor(self.image_array, cv2.COLOR_RGB2GRAY)
+        gray_image = self.gray()
         # Apply Canny edge detection
         edges = cv2.Canny(gray_image, 100, 200)
         return Image.fromarray(edges)
 
     def apply_edge_sobel(self):
-        # Convert to grayscale
-        gray_image = cv2.cvtColor(self.image_array, cv2.COLOR_RGB2GRAY)
-        # Apply Sobel operator
-        sobel_x = cv2.Sobel(gray_image, cv2.CV_64F, 1, 0, ksize=3)
-        sobel_y = cv2.Sobel(gray_image, cv2.CV_64F, 0, 1, ksize=3)
-        # Convert gradients to absolute values
-        sobel_x = cv2.convertScaleAbs(sobel_x)
-        sobel_y = cv2.convertScaleAbs(sobel_y)
-        #Sobel combined
-        sobel_combined = cv2.addWeighted(sobel_x, 0.5, sobel_y, 0.5, 0)
-        return Image.fromarray(sobel_combined)
+        # Sobel operator, |dx| and |dy| combined
+        return Image.fromarray(self.gradient())
 
     def apply_edge_prewitt(self):
         # Prewitt operator kernels
@@ -37,7 +113,7 @@ class ImageSegmentation:
                              [-1, -1, -1]])
         
         # Convert to grayscale
-        gray_image = cv2.cvtColor(self.image_array, cv2.COLOR_RGB2GRAY)
+        gray_image = self.gray()
         # Apply Prewitt operator
         prewitt_x = cv2.filter2D(gray_image, -1, kernel_x)
         prewitt_y = cv2.filter2D(gray_image, -1, kernel_y)
@@ -53,7 +129,7 @@ class ImageSegmentation:
                              [-1, 0]])
         
         # Convert to grayscale
-        gray_image = cv2.cvtColor(self.image_array, cv2.COLOR_RGB2GRAY)
+        gray_image = self.gray()
         # Apply Roberts operator
         roberts_x = cv2.filter2D(gray_image, -1, kernel_x)
         roberts_y = cv2.filter2D(gray_image, -1, kernel_y)
@@ -61,46 +137,102 @@ class ImageSegmentation:
         return Image.fromarray(roberts_combined)
 
     def apply_region_growing(self, seed_point, threshold=10):
-        # Convert to grayscale
-        gray_image = cv2.cvtColor(self.image_array, cv2.COLOR_RGB2GRAY)
+        # One (x, y) seed or a list of seeds, every grown region is white
+        seed_points = [seed_point] if np.ndim(seed_point) == 1 else seed_point
+        labels = self.region_labels(seed_points, threshold)
+        segmented_image = np.where(labels > 0, 255, 0).astype(np.uint8)
+        return Image.fromarray(segmented_image)
+
+    def region_labels(self, seed_points, threshold=10):
+        """
+        Grow a region from every seed over the 8-connected pixels whose gray value differs from the
+        seed's by less than threshold.
+        :param seed_points: List of (x, y) seeds
+        :return: int32 label map, 0 outside every region and i + 1 inside the region of seed_points[i].
+                 Where regions overlap the earlier seed keeps the pixel
+        """
+        # Grayscale copy, floodFill takes its image as an output argument even when it only fills the mask
+        gray_image = self.gray().copy()
         height, width = gray_image.shape
-        segmented_image = np.zeros_like(gray_image)
-
-        # Initialize the seed point
-        x, y = seed_point
-        seed_value = gray_image[y, x]
-        segmented_image[y, x] = 255  # Mark the seed point
-
-        # Create a list for the pixels to be checked
-        pixel_list = [(x, y)]
-
-        while pixel_list:
-            x, y = pixel_list.pop()
-            for dx in [-1, 0, 1]:
-                for dy in [-1, 0, 1]:
-                    nx, ny = x + dx, y + dy
-                    if 0 <= nx < width and 0 <= ny < height:
-                        if segmented_image[ny, nx] == 0:  # Not yet segmented
-                            if abs(int(gray_image[ny, nx]) - int(seed_value)) < threshold:
-                                segmented_image[ny, nx] = 255  # Mark as part of the region
-                                pixel_list.append((nx, ny))
+        labels = np.zeros((height, width), dtype=np.int32)
+
+        # floodFill marks the region in a mask with a one pixel border, it never touches the image
+        mask = np.zeros((height + 2, width + 2), dtype=np.uint8)
+        flags = 8 | cv2.FLOODFILL_FIXED_RANGE | cv2.FLOODFILL_MASK_ONLY | (1 << 8)
+        for label, (x, y) in enumerate(seed_points, start=1):
+            if not (0 <= x < width and 0 <= y < height):
+                raise ValueError(f"Seed point {(x, y)} is outside the image.")
+            if threshold <= 0:
+                # Nothing differs by less than zero, the region is the seed alone
+                if labels[y, x] == 0:
+                    labels[y, x] = label
+                continue
+
+            # Fixed range compares every pixel with the seed, |I - seed| <= threshold - 1 on integer values
+            _, _, _, (left, top, rect_width, rect_height) = cv2.floodFill(
+                gray_image, mask, (int(x), int(y)), 0, threshold - 1, threshold - 1, flags
+            )
+
+            # Only the bounding box of the region is touched, so many small seeds stay cheap
+            rows = slice(top, top + rect_height)
+            columns = slice(left, left + rect_width)
+            region = mask[top + 1:top + rect_height + 1, left + 1:left + rect_width + 1]
+            region_labels = labels[rows, columns]
+            region_labels[(region != 0) & (region_labels == 0)] = label
+            region[...] = 0
+
+        return labels
 
+
+    def apply_region_watershed(self, levels=0):
+        # Boundaries of the watershed regions drawn in red on a copy of the image
+        markers = self.watershed_labels(levels)
+        segmented_image = self.image_array.copy()
+        segmented_image[markers == -1] = [255, 0, 0]  # Mark the boundaries in red
+
+        # Convert back to RGB for display
         return Image.fromarray(segmented_image)
 
+    def watershed_labels(self, levels=0):
+        """
+        Marker-based watershed of the image.
+        :param levels: Pyramid levels the segmentation starts on, each one halves the size. The markers are found
+                       and flooded on the coarse level, the coarse regions are scaled up, and only tiles holding
+                       a band around the coarse boundaries are flooded again at full resolution. 0 does
+                       everything at full resolution, None picks the levels from the image size
+        :return: int32 label map, regions numbered from 1 (1 is the background), -1 on the boundaries
+        """
+        if levels is None:
+            levels = self.pyramid_levels(self.image_array.shape)
+        return self._plane(f"watershed_{levels}", lambda: self._watershed(levels))
 
-    def apply_region_watershed(self):
-        # Convert to grayscale and apply Gaussian blur
-        gray_image = cv2.cvtColor(self.image_array, cv2.COLOR_RGB2GRAY)
-        blurred_image = cv2.GaussianBlur(gray_image, (5, 5), 0)
+    @staticmethod
+    def pyramid_levels(shape, max_pixels=2000000):
+        # Number of halvings that bring an image under max_pixels
+        height, width = shape[:2]
+        levels = 0
+        while height * width > max_pixels and min(height, width) >= 64:
+            height, width = (height + 1) // 2, (width + 1) // 2
+            levels += 1
+        return levels
 
-        # Apply thresholding to get a binary image
-        _, binary_image = cv2.threshold(blurred_image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    def watershed_markers(self):
+        """
+        Watershed markers: 1 for sure background, 2 and up for every sure foreground object, 0 unknown.
+        """
+        return self._plane(
+            "watershed_markers", lambda: self.markers_from_binary(self.otsu_binary(), self.distance_transform())
+        )
 
+    @staticmethod
+    def markers_from_binary(binary_image, dist_transform):
+        """
+        Watershed markers of an Otsu binary image and its distance transform, see watershed_markers.
+        """
         # Find sure background area
         sure_bg = cv2.dilate(binary_image, np.ones((3, 3), np.uint8), iterations=3)
 
         # Find sure foreground area
-        dist_transform = cv2.distanceTransform(binary_image, cv2.DIST_L2, 5)
         _, sure_fg = cv2.threshold(dist_transform, 0.7 * dist_transform.max(), 255, 0)
 
         # Find unknown region
@@ -112,26 +244,135 @@ class ImageSegmentation:
         # Add one to all the labels to distinguish sure regions from unknown
         markers = markers + 1
         markers[unknown == 255] = 0  # Mark the unknown region with zero
+        return markers
 
-        # Apply watershed algorithm
-        markers = cv2.watershed(self.image_array, markers)
-        self.image_array[markers == -1] = [255, 0, 0]  # Mark the boundaries in red
+    def _watershed(self, levels):
+        # Apply watershed algorithm, cv2.watershed writes into its markers
+        if levels == 0:
+            return cv2.watershed(self.image_array, self.watershed_markers().copy())
 
-        # Convert back to RGB for display
-        return Image.fromarray(self.image_array)
+        # Markers and flooding on the coarse level, with the same steps as at full resolution
+        coarse_image = self.image_array
+        for _ in range(levels):
+            coarse_image = cv2.pyrDown(coarse_image)
+        coarse_binary = cv2.threshold(
+            cv2.GaussianBlur(cv2.cvtColor(coarse_image, cv2.COLOR_RGB2GRAY), (5, 5), 0),
+            0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU,
+        )[1]
+        coarse_markers = self.markers_from_binary(coarse_binary, cv2.distanceTransform(coarse_binary, cv2.DIST_L2, 5))
+        coarse_markers = cv2.watershed(coarse_image, coarse_markers)
+        # cv2.watershed marks the image frame as a boundary, the frame takes the labels next to it instead
+        coarse_markers[0], coarse_markers[-1] = coarse_markers[1], coarse_markers[-2]
+        coarse_markers[:, 0], coarse_markers[:, -1] = coarse_markers[:, 1], coarse_markers[:, -2]
+
+        # Scale the coarse regions up, boundaries can move by about one coarse pixel so that band is unknown again
+        height, width = self.image_array.shape[:2]
+        factor = 2 ** levels
+        boundary = cv2.dilate(np.uint8(coarse_markers == -1), np.ones((3, 3), np.uint8))
+        markers = np.repeat(np.repeat(coarse_markers, factor, axis=0), factor, axis=1)[:height, :width]
+        band = np.repeat(np.repeat(boundary, factor, axis=0), factor, axis=1)[:height, :width]
+        band = cv2.dilate(band, np.ones((factor + 1, factor + 1), np.uint8))
+        markers[band == 1] = 0
 
-    def apply_kmeans_clustering(self, k=3):
+        # Only tiles with unknown pixels are flooded, each with a margin reaching past the band to the labels
+        # around it. The tile keeps the flooding of its own pixels, the margin belongs to the neighbouring tiles
+        tile, margin = self.WATERSHED_TILE, 3 * factor + 1
+        result = markers.copy()
+        for top in range(0, height, tile):
+            for left in range(0, width, tile):
+                if not band[top:top + tile, left:left + tile].any():
+                    continue
+                crop_top, crop_left = max(top - margin, 0), max(left - margin, 0)
+                crop = cv2.watershed(
+                    np.ascontiguousarray(self.image_array[crop_top:top + tile + margin, crop_left:left + tile + margin]),
+                    markers[crop_top:top + tile + margin, crop_left:left + tile + margin].copy(),
+                )
+                bottom, right = min(top + tile, height), min(left + tile, width)
+                result[top:bottom, left:right] = crop[top - crop_top:bottom - crop_top, left - crop_left:right - crop_left]
+
+        # Same frame as a full resolution watershed
+        result[0], result[-1], result[:, 0], result[:, -1] = -1, -1, -1, -1
+        return result
+
+    def apply_kmeans_clustering(self, k=3, sample_size=None, centers=None):
+        """
+        :param sample_size: None for k-means on every pixel, else the fast mode of kmeans_palette
+        :param centers: Optional (k, 3) palette to map the pixels to instead of fitting one,
+                        e.g. the palette fitted on a proxy of the image
+        """
         # Reshape the image to a 2D array of pixels
         pixel_values = self.image_array.reshape((-1, 3))
-        pixel_values = np.float32(pixel_values)
 
-        # Define criteria and apply kmeans
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
-        _, labels, centers = cv2.kmeans(pixel_values, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+        if centers is not None:
+            labels = self.nearest_center(pixel_values, centers)
+        elif sample_size is None:
+            pixel_values = np.float32(pixel_values)
+
+            # Define criteria and apply kmeans
+            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
+            _, labels, centers = cv2.kmeans(pixel_values, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+        else:
+            # Fast mode: centers fitted on a sample, then every pixel goes to its nearest center
+            centers = self.kmeans_palette(k, sample_size)
+            labels = self.nearest_center(pixel_values, centers)
 
         # Convert back to 8 bit values
         centers = np.uint8(centers)
         segmented_image = centers[labels.flatten()]
         segmented_image = segmented_image.reshape(self.image_array.shape)
 
-        return Image.fromarray(segmented_image)
\ No newline at end of file
+        return Image.fromarray(segmented_image)
+
+    def kmeans_palette(self, k=3, sample_size=KMEANS_SAMPLE_SIZE):
+        """
+        Fit k-means centers on a random sample of the pixels. Palettes are cached by a hash of the pixels,
+        so applying again to the same image skips the fit.
+        :param sample_size: Number of pixels sampled, all pixels when the image is smaller
+        :return: (k, 3) float32 centers, read-only since they are shared
+        """
+        key = (self.content_hash(), k, sample_size)
+        with ImageSegmentation.palette_lock:
+            if key in ImageSegmentation.palette_cache:
+                ImageSegmentation.palette_cache.move_to_end(key)
+                return ImageSegmentation.palette_cache[key]
+
+        pixel_values = self.image_array.reshape((-1, 3))
+        if len(pixel_values) > sample_size:
+            # Seeded, so the palette of an image does not change between runs
+            sample = np.random.default_rng(0).choice(len(pixel_values), sample_size, replace=False)
+            pixel_values = pixel_values[np.sort(sample)]
+
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
+        _, _, centers = cv2.kmeans(np.float32(pixel_values), k, None, criteria, 3, cv2.KMEANS_PP_CENTERS)
+        centers.setflags(write=False)
+
+        with ImageSegmentation.palette_lock:
+            ImageSegmentation.palette_cache[key] = centers
+            while len(ImageSegmentation.palette_cache) > ImageSegmentation.PALETTE_CACHE_SIZE:
+                ImageSegmentation.palette_cache.popitem(last=False)
+        return centers
+
+    def content_hash(self):
+        # Hash of the pixels and their shape, computed once per instance
+        if "content_hash" not in self.planes:
+            digest = hashlib.sha1(repr(self.image_array.shape).encode())
+            digest.update(self.image_array.data)
+            self.planes["content_hash"] = digest.hexdigest()
+        return self.planes["content_hash"]
+
+    @staticmethod
+    def nearest_center(pixel_values, centers, chunk_size=1 << 20):
+        """
+        Index of the nearest center of every pixel, in chunks so the distance matrix stays small.
+        :param pixel_values: (N, 3) pixels
+        :return: (N,) int32 labels
+        """
+        centers = np.float32(centers)
+        center_norms = np.sum(centers ** 2, axis=1)
+        labels = np.empty(len(pixel_values), dtype=np.int32)
+        for start in range(0, len(pixel_values), chunk_size):
+            chunk = np.float32(pixel_values[start:start + chunk_size])
+            # |p - c|^2 without the |p|^2 term, which is the same for every center
+            distances = center_norms - 2 * chunk @ centers.T
+            labels[start:start + chunk_size] = np.argmin(distances, axis=1)
+        return labels
@@ -0,0 +1,114 @@
+import math
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageDraw
+
+
+class ShapeMaskCache:
+    """
+    LRU cache of grayscale shape masks ("Circle", "Star", "Diamond") keyed by (shape, size).
+    Masks are rasterized once with supersampling for antialiased edges and then reused,
+    and the cache evicts the least recently used masks when it goes over its memory cap.
+    Safe to share between worker threads.
+    """
+
+    SHAPES = ("Circle", "Star", "Diamond")
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, supersample=4, max_supersample_pixels=16 * 1024 * 1024):
+        """
+        :param max_bytes: Memory cap for all cached masks together (1 byte per mask pixel)
+        :param supersample: Supersampling factor per axis used when rasterizing a mask
+        :param max_supersample_pixels: Upper bound on the supersampled canvas, large masks use a smaller factor
+        """
+        self.max_bytes = max_bytes
+        self.supersample = supersample
+        self.max_supersample_pixels = max_supersample_pixels
+        self.masks = OrderedDict()
+        self.current_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, shape, size):
+        """
+        Return the mask for a shape at the given size, rasterizing it on a cache miss.
+        :param shape: Shape name ("Circle", "Star", "Diamond")
+        :param size: Tuple (width, height) of the mask
+        :return: PIL image in mode "L", 255 inside the shape. Shared, do not modify it.
+        """
+        key = (shape, tuple(size))
+        with self.lock:
+            mask = self.masks.get(key)
+            if mask is not None:
+                self.masks.move_to_end(key)
+                return mask
+
+        # Rasterized outside the lock, so other threads are not held up by a large mask
+        mask = self.rasterize(shape, size)
+        with self.lock:
+            if key in self.masks:
+                # Another thread drew it in the meantime
+                self.masks.move_to_end(key)
+                return self.masks[key]
+            self.masks[key] = mask
+            self.current_bytes += mask.width * mask.height
+            self._evict()
+        return mask
+
+    def clear(self):
+        """
+        Drop every cached mask.
+        """
+        with self.lock:
+            self.masks.clear()
+            self.current_bytes = 0
+
+    def rasterize(self, shape, size):
+        """
+        Draw a mask without touching the cache.
+        :param shape: Shape name ("Circle", "Star", "Diamond")
+        :param size: Tuple (width, height) of the mask
+        :return: PIL image in mode "L"
+        """
+        if shape not in self.SHAPES:
+            raise ValueError(f"Unknown shape: {shape}")
+        width, height = size
+
+        factor = self.supersample
+        while factor > 1 and width * height * factor * factor > self.max_supersample_pixels:
+            factor -= 1
+
+        mask = Image.new("L", (width * factor, height * factor), 0)
+        self._draw_shape(ImageDraw.Draw(mask), shape, width * factor, height * factor)
+        if factor > 1:
+            mask = mask.reduce(factor)
+        return mask
+
+    def _evict(self):
+        # Called with the lock held. Always keep the newest mask, even when it alone is over the cap
+        while self.current_bytes > self.max_bytes and len(self.masks) > 1:
+            _, mask = self.masks.popitem(last=False)
+            self.current_bytes -= mask.width * mask.height
+
+    @staticmethod
+    def _draw_shape(draw, shape, width, height):
+        if shape == "Circle":
+            draw.ellipse((0, 0, width, height), fill=255)
+        elif shape == "Star":
+            # Buat bentuk bintang sederhana (5 sisi)
+            center_x, center_y = width / 2, height / 2
+            radius = min(width, height) / 2
+            points = []
+            for i in range(10):
+                angle = i * (math.pi / 5)  # Sudut 36 derajat
+                r = radius if i % 2 == 0 else radius / 2
+                x = center_x + r * math.cos(angle)
+                y = center_y - r * math.sin(angle)
+                points.append((x, y))
+            draw.polygon(points, fill=255)
+        elif shape == "Diamond":
+            # Bentuk belah ketupat
+            draw.polygon([
+                (width / 2, 0),
+                (width, height / 2),
+                (width / 2, height),
+                (0, height / 2)
+            ], fill=255)
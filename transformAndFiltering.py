@@ -1,15 +1,17 @@
 import numpy as np
 import cv2
+import scipy.fft
 from PIL import Image
 from scipy.ndimage import median_filter
+from frequencyFilter import FrequencyFilter
 
 class TransformAndFiltering:
     @staticmethod
     def fourier_transformation(image):
-        dft = np.fft.fft2(image)
-        dft_shift = np.fft.fftshift(dft)  
-        dft_ishift = np.fft.ifftshift(dft_shift) 
-        reconstructed_image = np.fft.ifft2(dft_ishift) 
+        # Real transform of every channel in single precision, see FrequencyFilter for the filters
+        image_array = np.asarray(image, dtype=np.float32)
+        dft = scipy.fft.rfft2(image_array, axes=(0, 1), workers=FrequencyFilter.WORKERS)
+        reconstructed_image = scipy.fft.irfft2(dft, s=image_array.shape[:2], axes=(0, 1), workers=FrequencyFilter.WORKERS)
         reconstructed_image = np.abs(reconstructed_image)
 
         reconstructed_image = (reconstructed_image / np.max(reconstructed_image)) * 255